@@ -0,0 +1,112 @@
+import os
+from collections.abc import Callable
+
+SMALL_NETWORK = '''\
+import requests
+
+
+def fetch_{i}(url, params=None):
+    resp = requests.get(url, params=params, timeout=10)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def submit_{i}(url, payload):
+    return requests.post(url, json=payload)
+'''
+
+SMALL_PLAIN = '''\
+import dataclasses
+import os
+
+
+@dataclasses.dataclass
+class Config{i}:
+    name: str
+    value: int = {i}
+
+    def path(self) -> str:
+        return os.path.join('/tmp', self.name, str(self.value))
+
+
+def total_{i}(values):
+    return sum(v * 2 for v in values if v % 3 == 0)
+'''
+
+GENERATED_CHUNK = '''\
+class Message{i}(object):
+    __slots__ = ('field_a', 'field_b')
+    DESCRIPTOR = _descriptor.Descriptor(
+        name='Message{i}',
+        full_name='pkg.Message{i}',
+        fields=[
+            _descriptor.FieldDescriptor(name='a', number=1, type=9),
+            _descriptor.FieldDescriptor(name='b', number=2, type=5),
+        ],
+    )
+
+    def send(self, url):
+        return requests.post(url, data=self.SerializeToString())
+
+'''
+
+CALL = '''\
+requests.get('https://example.com/{i}', timeout={i} % 30)
+urlopen('https://example.com/{i}')
+'''
+
+
+def _small(directory: str, scale: float) -> None:
+    for i in range(int(2000 * scale)):
+        # most real files never mention a tracked module
+        template = SMALL_NETWORK if i % 10 == 0 else SMALL_PLAIN
+        with open(os.path.join(directory, f'small_{i}.py'), 'w') as f:
+            f.write(template.format(i=i))
+
+
+def _generated(directory: str, scale: float) -> None:
+    n_chunks = 50_000 // GENERATED_CHUNK.count('\n')
+    for n in range(max(int(3 * scale), 1)):
+        with open(os.path.join(directory, f'generated_{n}.py'), 'w') as f:
+            f.write('import requests\n')
+            f.write('from google.protobuf import descriptor as _descriptor\n')
+            for i in range(n_chunks):
+                f.write(GENERATED_CHUNK.format(i=i))
+
+
+def _imports(directory: str, scale: float) -> None:
+    for n in range(int(200 * scale)):
+        with open(os.path.join(directory, f'imports_{n}.py'), 'w') as f:
+            for i in range(300):
+                if i % 3 == 0:
+                    f.write(f'import pkg_{i}.module_{n} as alias_{i}\n')
+                elif i % 3 == 1:
+                    f.write(f'from pkg_{i} import name_{n} as alias_{i}\n')
+                else:
+                    f.write(f'from requests import get as get_{i}\n')
+            f.write('get_2("https://example.com")\n')
+
+
+def _calls(directory: str, scale: float) -> None:
+    for n in range(int(50 * scale)):
+        with open(os.path.join(directory, f'calls_{n}.py'), 'w') as f:
+            f.write('import requests\nfrom urllib.request import urlopen\n')
+            for i in range(2000):
+                f.write(CALL.format(i=i))
+
+
+CORPORA: dict[str, Callable[[str, float], None]] = {
+    'small': _small,
+    'generated': _generated,
+    'imports': _imports,
+    'calls': _calls,
+}
+
+
+def generate(name: str, directory: str, scale: float = 1) -> list[str]:
+    os.makedirs(directory, exist_ok=True)
+    CORPORA[name](directory, scale)
+    return sorted(
+        os.path.join(directory, filename)
+        for filename in os.listdir(directory)
+    )
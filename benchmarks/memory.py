@@ -0,0 +1,71 @@
+import argparse
+import ast
+import tracemalloc
+from collections.abc import Callable
+from collections.abc import Sequence
+
+from flake8_timeout import DEFAULT_MATCHER
+from flake8_timeout import Visitor
+
+# a generated API client, nearly every line is a call without a timeout
+CHUNK = '''\
+def endpoint_{i}(session, base, **params):
+    return session.get(base + '/v1/endpoint_{i}', params=params)
+
+
+def create_{i}(base, body):
+    return requests.post(base + '/v1/create_{i}', json=body)
+
+'''
+
+
+def _peak(func: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            'compare the peak allocation of collecting all violations of a '
+            'file before reporting them with streaming them'
+        ),
+    )
+    parser.add_argument('--endpoints', type=int, default=5_000)
+    args = parser.parse_args(argv)
+
+    src = 'import requests\nsession = requests.Session()\n\n\n' + ''.join(
+        CHUNK.format(i=i) for i in range(args.endpoints)
+    )
+    # the tree is not part of the measurement, flake8 parses it anyway
+    tree = ast.parse(src)
+
+    def collected() -> object:
+        # what every file did before: walk first, then report everything
+        results = [
+            (v.lineno, v.col_offset, v.end_lineno)
+            for v in Visitor(DEFAULT_MATCHER).visit(tree)
+        ]
+        for _ in results:
+            pass
+        return None
+
+    def streamed() -> object:
+        for _ in Visitor(DEFAULT_MATCHER).visit(tree):
+            pass
+        return None
+
+    n = sum(1 for _ in Visitor(DEFAULT_MATCHER).visit(tree))
+    print(f'{src.count(chr(10))} lines, {n} results')
+    for name, func in (('collected', collected), ('streamed', streamed)):
+        print(f'{name:<24}{_peak(func) / 1024:>10.1f} KiB')
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
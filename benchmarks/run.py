@@ -0,0 +1,186 @@
+import argparse
+import ast
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from collections.abc import Sequence
+from typing import Any
+
+from benchmarks.corpus import CORPORA
+from benchmarks.corpus import generate
+from flake8_timeout import Plugin
+from flake8_timeout import Visitor
+
+# runs flake8 with every plugin except this one
+WITHOUT_PLUGIN = '''\
+import sys
+from flake8.main import cli
+from flake8.plugins import finder
+find_plugins = finder.find_plugins
+finder.find_plugins = lambda *args: [
+    p for p in find_plugins(*args)
+    if not p.entry_point.value.startswith('flake8_timeout:')
+]
+raise SystemExit(cli.main(sys.argv[1:]))
+'''
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    if len(values) < 2:
+        values = values * 2
+    q = statistics.quantiles(values, n=100, method='inclusive')
+    return {'p50': q[49], 'p90': q[89], 'p99': q[98], 'max': max(values)}
+
+
+def _measure(
+        files: list[tuple[str, ast.Module, list[str]]],
+        func: Callable[[ast.Module, list[str]], object],
+) -> dict[str, Any]:
+    latencies = []
+    start = time.perf_counter()
+    for _, tree, lines in files:
+        t0 = time.perf_counter()
+        func(tree, lines)
+        latencies.append((time.perf_counter() - t0) * 1e3)
+    total = time.perf_counter() - start
+
+    # tracemalloc slows everything down, so measure memory in a second pass
+    peak = 0
+    tracemalloc.start()
+    for _, tree, lines in files:
+        tracemalloc.reset_peak()
+        func(tree, lines)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+
+    n_lines = sum(len(lines) for _, _, lines in files)
+    return {
+        'total_s': total,
+        'files_per_s': len(files) / total,
+        'lines_per_s': n_lines / total,
+        'latency_ms': _percentiles(latencies),
+        'peak_kib': peak / 1024,
+    }
+
+
+def _flake8(filenames: list[str], *, plugin: bool, jobs: int) -> float:
+    if plugin:
+        cmd = [sys.executable, '-m', 'flake8']
+    else:
+        cmd = [sys.executable, '-c', WITHOUT_PLUGIN]
+    cmd.extend(('--isolated', f'--jobs={jobs}', *filenames))
+
+    start = time.perf_counter()
+    subprocess.run(cmd, stdout=subprocess.DEVNULL, check=False)
+    return time.perf_counter() - start
+
+
+def _visitor(tree: ast.Module, lines: list[str]) -> object:
+    return list(Visitor(Plugin.matcher).visit(tree))
+
+
+def _plugin(tree: ast.Module, lines: list[str]) -> object:
+    return list(Plugin(tree, lines).run())
+
+
+def run_corpus(
+        name: str,
+        scale: float,
+        *,
+        flake8: bool,
+        jobs: int,
+) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filenames = generate(name, tmpdir, scale)
+        files = []
+        for filename in filenames:
+            with open(filename) as f:
+                src = f.read()
+            files.append((filename, ast.parse(src), src.splitlines(True)))
+
+        ret: dict[str, Any] = {
+            'files': len(files),
+            'lines': sum(len(lines) for _, _, lines in files),
+            'visitor': _measure(files, _visitor),
+            'plugin': _measure(files, _plugin),
+        }
+        if flake8:
+            enabled = _flake8(filenames, plugin=True, jobs=jobs)
+            disabled = _flake8(filenames, plugin=False, jobs=jobs)
+            ret['flake8'] = {
+                'enabled_s': enabled,
+                'disabled_s': disabled,
+                'overhead': enabled / disabled - 1,
+            }
+
+    return ret
+
+
+def _compare(old: dict[str, Any], new: dict[str, Any]) -> None:
+    for corpus, results in new['corpora'].items():
+        if corpus not in old['corpora']:
+            continue
+        for kind in ('visitor', 'plugin'):
+            before = old['corpora'][corpus][kind]['total_s']
+            after = results[kind]['total_s']
+            print(
+                f'{corpus:<12}{kind:<10}{after / before - 1:>+8.1%}',
+                file=sys.stderr,
+            )
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='measure speed and memory of the plugin on synthetic '
+        'corpora and write the results as JSON',
+    )
+    parser.add_argument(
+        '--corpus', action='append', choices=tuple(CORPORA),
+        help='corpus to run, may be given multiple times (default: all)',
+    )
+    parser.add_argument('--scale', type=float, default=1)
+    parser.add_argument('--no-flake8', action='store_true')
+    parser.add_argument('--jobs', type=int, default=1)
+    parser.add_argument(
+        '--output', '-o', help='write the JSON here instead of stdout',
+    )
+    parser.add_argument(
+        '--compare', metavar='JSON',
+        help='previous results to compare the timings with',
+    )
+    args = parser.parse_args(argv)
+
+    results = {
+        'version': Plugin.version,
+        'python': platform.python_version(),
+        'scale': args.scale,
+        'corpora': {},
+    }
+    for name in args.corpus or CORPORA:
+        print(f'running {name}...', file=sys.stderr)
+        results['corpora'][name] = run_corpus(
+            name, args.scale, flake8=not args.no_flake8, jobs=args.jobs,
+        )
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(json.load(f), results)
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
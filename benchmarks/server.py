@@ -0,0 +1,64 @@
+import argparse
+import statistics
+import time
+from collections.abc import Sequence
+
+from flake8_timeout import DEFAULT_MATCHER
+from flake8_timeout import Server
+
+CHUNK = '''\
+def handler_{i}(url, data=None):
+    headers = {{'X-Request': str({i}), 'Accept': 'application/json'}}
+    if data is not None and len(data) > {i} % 7:
+        resp = requests.post(url, json=data, headers=headers, timeout=5)
+    else:
+        resp = requests.get(url, headers=headers)
+    return resp.json()
+
+
+'''
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            'compare checking a buffer from scratch with checking it again '
+            'after editing one function, like an editor does on save'
+        ),
+    )
+    parser.add_argument('--handlers', type=int, default=2_000)
+    parser.add_argument('-n', '--number', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    src = 'import requests\n\n\n' + ''.join(
+        CHUNK.format(i=i) for i in range(args.handlers)
+    )
+    middle = args.handlers // 2
+    edits = [
+        src.replace(f'str({middle})', f'str({middle}) + "{n}"')
+        for n in range(args.number)
+    ]
+
+    cold = []
+    for _ in range(args.number):
+        t0 = time.perf_counter()
+        Server(DEFAULT_MATCHER).check('bench.py', src)
+        cold.append(time.perf_counter() - t0)
+
+    server = Server(DEFAULT_MATCHER)
+    server.check('bench.py', src)
+    warm = []
+    for edit in edits:
+        t0 = time.perf_counter()
+        server.check('bench.py', edit)
+        warm.append(time.perf_counter() - t0)
+
+    print(f'{src.count(chr(10))} lines')
+    for name, times in (('cold', cold), ('one statement edited', warm)):
+        print(f'{name:<24}{statistics.median(times) * 1e3:>10.1f} ms')
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,42 @@
+import argparse
+import ast
+import timeit
+from collections.abc import Sequence
+
+from flake8_timeout import DEFAULT_TRACKED_FUNCTIONS
+from flake8_timeout import Matcher
+from flake8_timeout import Plugin
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='measure the per-file setup cost of the plugin',
+    )
+    parser.add_argument('-n', '--number', type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    # an empty module isolates the setup from the actual traversal
+    tree = ast.parse('')
+    specs = DEFAULT_TRACKED_FUNCTIONS * 10
+
+    def compile_per_file() -> None:
+        # what every file paid before the matcher was compiled once
+        Matcher.compile(specs)
+        list(Plugin(tree).run())
+
+    def shared_matcher() -> None:
+        list(Plugin(tree).run())
+
+    Plugin.matcher = Matcher.compile(specs)
+    for name, func in (
+            ('compile per file', compile_per_file),
+            ('shared matcher', shared_matcher),
+    ):
+        per_file = timeit.timeit(func, number=args.number) / args.number
+        print(f'{name:<20}{per_file * 1e9:>10.0f} ns/file')
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,43 @@
+import argparse
+import statistics
+import subprocess
+import sys
+from collections.abc import Sequence
+
+
+def import_time(module: str) -> int:
+    # cumulative import time of the module in a fresh interpreter in us
+    stderr = subprocess.run(
+        (sys.executable, '-X', 'importtime', '-c', f'import {module}'),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    for line in stderr.splitlines():
+        _, cumulative, name = line.split('|')
+        if name.strip() == module:
+            return int(cumulative)
+    raise AssertionError(f'{module} was not imported')
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='measure the import time of the plugin',
+    )
+    parser.add_argument('-n', '--number', type=int, default=20)
+    parser.add_argument(
+        '--budget', type=float, default=30,
+        help='fail if the median import time exceeds this (ms)',
+    )
+    args = parser.parse_args(argv)
+
+    # the first import writes the bytecode cache
+    import_time('flake8_timeout')
+    times = [import_time('flake8_timeout') / 1e3 for _ in range(args.number)]
+    median = statistics.median(times)
+    print(f'flake8_timeout {median:.1f} ms (budget: {args.budget} ms)')
+    return int(median > args.budget)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,103 @@
+import argparse
+import ast
+import timeit
+from collections.abc import Sequence
+from typing import Any
+
+from flake8_timeout import DEFAULT_MATCHER
+from flake8_timeout import DEFAULT_TRACKED_FUNCTIONS
+from flake8_timeout import Matcher
+from flake8_timeout import Visitor
+
+CHUNK = '''\
+import requests
+from urllib.request import urlopen
+
+
+def handler_{i}(url, data=None):
+    headers = {{'X-Request': str({i}), 'Accept': 'application/json'}}
+    if data is not None and len(data) > {i} % 7:
+        resp = requests.post(url, json=data, headers=headers, timeout=5)
+    else:
+        resp = requests.get(url, headers=headers)
+    values = [x * 2 for x in range({i}) if x % 3 == 0]
+    return resp.json(), urlopen(url).read(), sum(values)
+
+
+class Client_{i}:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.session = requests.Session()
+
+    def fetch(self, path):
+        with requests.Session() as s:
+            s.get(self.url + path)
+        return self.session.get(self.url + path, timeout=5).json()
+'''
+
+
+class RecursiveVisitor(ast.NodeVisitor):
+    # the ast.NodeVisitor based traversal which was used before, all names
+    # are bound in the module scope
+    def __init__(self, visitor: Visitor) -> None:
+        self.visitor = visitor
+        self.scope = visitor.module_scope
+        self.results: list[tuple[int, int]] = []
+
+    def visit_Import(self, node: ast.Import) -> None:
+        self.visitor.visit_Import(node, self.scope)
+        self.generic_visit(node)
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        self.visitor.visit_ImportFrom(node, self.scope)
+        self.generic_visit(node)
+
+    def visit_Call(self, node: ast.Call) -> None:
+        for v in self.visitor.visit_Call(node, self.scope):
+            self.results.append((v.lineno, v.col_offset))
+        self.generic_visit(node)
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description='compare the iterative traversal with ast.NodeVisitor',
+    )
+    parser.add_argument('--lines', type=int, default=50_000)
+    parser.add_argument('-n', '--number', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    n_chunks = args.lines // CHUNK.count('\n')
+    src = ''.join(CHUNK.format(i=i) for i in range(n_chunks))
+    tree = ast.parse(src)
+
+    # instance tracking only applies with configured client functions
+    no_clients = Matcher.compile(DEFAULT_TRACKED_FUNCTIONS)
+
+    def iterative() -> Any:
+        visitor = Visitor(DEFAULT_MATCHER)
+        return [(v.lineno, v.col_offset) for v in visitor.visit(tree)]
+
+    def iterative_no_clients() -> Any:
+        visitor = Visitor(no_clients)
+        return [(v.lineno, v.col_offset) for v in visitor.visit(tree)]
+
+    def recursive() -> Any:
+        recursive_visitor = RecursiveVisitor(Visitor(no_clients))
+        recursive_visitor.visit(tree)
+        return recursive_visitor.results
+
+    assert iterative_no_clients() == recursive()
+    print(f'{src.count(chr(10))} lines, {len(iterative())} results')
+    for name, func in (
+            ('ast.NodeVisitor', recursive),
+            ('Visitor (no clients)', iterative_no_clients),
+            ('Visitor', iterative),
+    ):
+        t = min(timeit.repeat(func, number=1, repeat=args.number))
+        print(f'{name:<24}{t * 1e3:>10.1f} ms')
+
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,13 +1,68 @@
 import argparse
 import ast
-import importlib.metadata as importlib_metadata
+import atexit
+import hashlib
+import json
+import math
+import operator
+import os
+import re
+import sys
+import time
+from collections.abc import Callable
+from collections.abc import Collection
 from collections.abc import Generator
+from collections.abc import Iterable
+from collections.abc import Sequence
 from typing import Any
+from typing import IO
+from typing import NamedTuple
+from typing import TYPE_CHECKING
+from typing import TypeVar
 
-from flake8.options.manager import OptionManager
+# imported where they are used, flake8 imports this module in every process
+# and most runs never need them
+if TYPE_CHECKING:
+    import sqlite3
+    import tokenize
+
+    from flake8.options.manager import OptionManager
+
+__version__ = '2.0.0'
 
 MSG = 'TIM100 request call has no timeout'
-# Format: 'module.function' or 'module.function:positional_index'
+MSG_TOO_LARGE = 'TIM101 {}timeout of {} exceeds the maximum of {}'
+# the state of the timeout of a violation
+STATUS_MISSING = 'missing'
+STATUS_NONE = 'none'
+STATUS_NEGATIVE = 'negative'
+STATUS_NOT_CONSTANT = 'non-constant'
+STATUS_TOO_LARGE = 'too-large'
+
+MSG_LOOP = 'TIM200 request call inside a loop (loop depth {})'
+MSG_POOL = 'TIM201 {} creates a new connection pool {}'
+MSG_ONE_SHOT = (
+    'TIM202 {} opens a new connection on every call of {}() which is '
+    'called in a loop'
+)
+MSG_BLOCKING = 'TIM300 {} blocks the event loop in async function {}()'
+STATUS_LOOP = 'in-loop'
+STATUS_POOL = 'new-pool'
+STATUS_ONE_SHOT = 'one-shot'
+STATUS_BLOCKING = 'blocking'
+# how the timeout of a tracked call which passes the check is set, for the
+# coverage metrics: a literal, an expression of constants, any positional
+# argument or by the callers of a wrapper
+COVERAGE_LITERAL = 'literal'
+COVERAGE_CONSTANT = 'constant'
+COVERAGE_DYNAMIC = 'dynamic'
+COVERAGE_FORWARDED = 'forwarded'
+COVERAGE_KINDS = (
+    COVERAGE_LITERAL, COVERAGE_CONSTANT, COVERAGE_DYNAMIC, COVERAGE_FORWARDED,
+    STATUS_TOO_LARGE, STATUS_NONE, STATUS_NEGATIVE, STATUS_NOT_CONSTANT,
+    STATUS_MISSING,
+)
+# Format: 'module.function[:positional_index][@keyword,...]'
 DEFAULT_TRACKED_FUNCTIONS = [
     'urllib.request.urlopen:2',  # urlopen(url, data=None, timeout=...)
     'requests.get',  # get(url, **kwargs)
@@ -18,20 +73,165 @@ DEFAULT_TRACKED_FUNCTIONS = [
     'requests.patch',
     'requests.options',
     'requests.request',
+    'requests.Session.get',  # methods of the clients below
+    'requests.Session.post',
+    'requests.Session.put',
+    'requests.Session.delete',
+    'requests.Session.head',
+    'requests.Session.patch',
+    'requests.Session.options',
+    'requests.Session.request',
+]
+# calling these returns a client, their methods are tracked on names bound to
+# the result, e.g. 's = requests.Session()' or 'def f(s: requests.Session)'
+DEFAULT_CLIENTS = [
+    'requests.Session',
+]
+# constructors of connection pools, which should be created once and reused.
+# The other tracked functions of their modules, e.g. requests.get, create a
+# pool for a single call
+DEFAULT_POOLS = [
+    'requests.Session',
+    'httpx.Client',
+    'httpx.AsyncClient',
+    'aiohttp.ClientSession',
+    'urllib3.PoolManager',
+    'urllib3.ProxyManager',
+    'urllib3.HTTPConnectionPool',
+    'urllib3.HTTPSConnectionPool',
+    'urllib3.connection_from_url',
+]
+# decorators which make a function create its result only once
+CACHE_DECORATORS = frozenset((
+    ('functools', 'cache'),
+    ('functools', 'lru_cache'),
+    ('functools', 'cached_property'),
+))
+
+
+class Preset(NamedTuple):
+    funcs: tuple[str, ...]
+    clients: tuple[str, ...] = ()
+
+
+_HTTP_METHODS = (
+    'get', 'post', 'put', 'delete', 'head', 'patch', 'options', 'request',
+)
+# enabled by name with --timeout-presets, only the enabled ones are compiled
+# into the matcher
+PRESETS = {
+    'requests': Preset(
+        (
+            *(f'requests.{method}' for method in _HTTP_METHODS),
+            *(f'requests.Session.{method}' for method in _HTTP_METHODS),
+        ),
+        ('requests.Session',),
+    ),
+    'httpx': Preset((
+        *(f'httpx.{method}' for method in _HTTP_METHODS),
+        'httpx.stream',
+        'httpx.Client',  # the timeout of a client applies to all requests
+        'httpx.AsyncClient',
+    )),
+    'aiohttp': Preset((
+        'aiohttp.request',
+        'aiohttp.ClientSession',
+    )),
+    'urllib3': Preset((
+        'urllib3.request',
+        'urllib3.PoolManager',
+        'urllib3.ProxyManager',
+        'urllib3.HTTPConnectionPool:2',  # (host, port=None, timeout=...)
+        'urllib3.HTTPSConnectionPool:2',
+        'urllib3.connection_from_url',
+    )),
+    'stdlib-net': Preset((
+        'urllib.request.urlopen:2',  # (url, data=None, timeout=...)
+        'http.client.HTTPConnection:2',  # (host, port=None, timeout=...)
+        'http.client.HTTPSConnection',
+        'socket.create_connection:1',  # (address, timeout=...)
+        'smtplib.SMTP:3',  # (host, port, local_hostname, timeout=...)
+        'smtplib.SMTP_SSL',
+        'ftplib.FTP:4',  # (host, user, passwd, acct, timeout=...)
+        'ftplib.FTP_TLS',
+    )),
+    'subprocess': Preset((
+        'subprocess.run',
+        'subprocess.call',
+        'subprocess.check_call',
+        'subprocess.check_output',
+    )),
+}
+
+
+# synchronous functions which block the event loop when they are called in an
+# async function
+DEFAULT_BLOCKING = [
+    *(f'requests.{method}' for method in _HTTP_METHODS),
+    *(f'requests.Session.{method}' for method in _HTTP_METHODS),
+    'urllib.request.urlopen',
+    *(f'httpx.{method}' for method in _HTTP_METHODS),
+    'httpx.stream',
+    'urllib3.request',
+    'socket.create_connection',
+    'smtplib.SMTP',
+    'smtplib.SMTP_SSL',
+    'ftplib.FTP',
+    'ftplib.FTP_TLS',
 ]
 
 
+def resolve_presets(names: Iterable[str]) -> Preset:
+    funcs: list[str] = []
+    clients: list[str] = []
+    for name in names:
+        if name not in PRESETS:
+            raise ValueError(
+                f'Unknown preset: {name!r} '
+                f'(available: {", ".join(sorted(PRESETS))})',
+            )
+        funcs.extend(PRESETS[name].funcs)
+        clients.extend(PRESETS[name].clients)
+    return Preset(tuple(funcs), tuple(clients))
+
+
+def split_keywords(spec: str) -> tuple[str, tuple[str, ...]]:
+    # 'module.function[:index]@keyword,...' -> the rest of the spec and the
+    # names of the keyword arguments setting the timeout
+    rest, sep, names = spec.partition('@')
+    if not sep:
+        return spec, ()
+    keywords = tuple(names.split(','))
+    if not all(keyword.isidentifier() for keyword in keywords):
+        raise ValueError(
+            f'Timeout keywords must be identifiers in spec: {spec}',
+        )
+    return rest, keywords
+
+
+def join_keyword_specs(items: Iterable[str]) -> list[str]:
+    # flake8 splits comma separated options, 'module.function@a,b' arrives as
+    # 'module.function@a' and 'b'. A spec is never a bare name
+    specs: list[str] = []
+    for item in items:
+        if specs and '@' in specs[-1] and item.isidentifier():
+            specs[-1] = f'{specs[-1]},{item}'
+        else:
+            specs.append(item)
+    return specs
+
+
 def parse_function_spec(spec: str) -> tuple[tuple[str, str], int | None]:
+    func_part, _ = split_keywords(spec)
     # Split off positional index if present
-    if ':' in spec:
-        func_part, index_str = spec.rsplit(':', 1)
+    if ':' in func_part:
+        func_part, index_str = func_part.rsplit(':', 1)
         if not index_str.isdigit():
             raise ValueError(
                 f"Positional index must be an integer in spec: {spec}",
             )
         positional_index = int(index_str)
     else:
-        func_part = spec
         positional_index = None
 
     # Parse the function part
@@ -44,203 +244,3587 @@ def parse_function_spec(spec: str) -> tuple[tuple[str, str], int | None]:
     return ('.'.join(parts[:-1]), parts[-1]), positional_index
 
 
-class Visitor(ast.NodeVisitor):
+def parse_module_path(module: str) -> tuple[str, ...]:
+    # 'package.module' or a single name like 'config'
+    parts = tuple(module.split('.'))
+    if not all(part.isidentifier() for part in parts):
+        raise ValueError(f'Module must be a dotted name: {module}')
+    return parts
+
+
+# (connect, read) in seconds, None is no limit
+Limit = tuple[float | None, float | None]
+
+
+def parse_limit(value: str) -> Limit:
+    # 'max' or 'connect/read'
+    try:
+        connect, _, read = value.partition('/')
+        return float(connect), float(read or connect)
+    except ValueError:
+        raise ValueError(
+            f"Limit must be 'seconds' or 'connect/read' seconds: {value}",
+        )
+
+
+def parse_limit_spec(spec: str) -> tuple[str, Limit]:
+    # 'module.function=limit'
+    key, sep, value = spec.partition('=')
+    if not sep:
+        raise ValueError(f"Limit spec must be 'module.function=limit': {spec}")
+    (module, func), _ = parse_function_spec(key)
+    return f'{module}.{func}', parse_limit(value)
+
+
+# nested dicts keyed by the parts of the dotted names, the Spec of a function
+# is stored under '' in the node of its last part
+Trie = dict[str, Any]
+
+
+class Spec(NamedTuple):
+    # interned 'module.function' key and its parts
+    key: str
+    path: tuple[str, ...]
+    # positional index of the timeout argument
+    positional: int | None = None
+    # names of the keyword arguments setting the timeout, any of them counts
+    keywords: tuple[str, ...] = ('timeout',)
+    # calls are checked for a timeout
+    tracked: bool = False
+    # calling it returns a client, e.g. requests.Session, names bound to the
+    # result resolve to its path so its methods can be tracked below it
+    client: bool = False
+    # the maximum timeout which may be passed
+    limit: Limit = (None, None)
+    # names imported from this module are constants, e.g. project settings
+    settings: bool = False
+    # calling it creates a connection pool
+    pool: bool = False
+    # a tracked function next to a pool which creates a pool for every call
+    one_shot: bool = False
+    # calls block the event loop of an async function
+    blocking: bool = False
+
+
+class Matcher(NamedTuple):
+    trie: Trie
+    # matches any root module name, a file without a match cannot contain a
+    # tracked call since it has to import it first
+    prefilter: re.Pattern[str]
+    # identifies the configuration, e.g. for the result cache
+    fingerprint: str
+    # the keywords of all tracked functions, dicts setting one of them can be
+    # passed as **kwargs
+    keywords: frozenset[str] = frozenset(('timeout',))
+
+    @classmethod
+    def compile(
+            cls,
+            specs: Iterable[str],
+            clients: Iterable[str] = (),
+            limit: Limit = (None, None),
+            limits: Iterable[str] = (),
+            settings: Iterable[str] = (),
+            wrappers: Iterable[str] = (),
+            pools: Iterable[str] = (),
+            blocking: Iterable[str] = (),
+    ) -> 'Matcher':
+        compiled: dict[str, Spec] = {}
+
+        def _add(spec: str, **kwargs: Any) -> None:
+            (module, func), pos_index = parse_function_spec(spec)
+            _, keywords = split_keywords(spec)
+            key = sys.intern(f'{module}.{func}')
+            path = tuple(sys.intern(part) for part in key.split('.'))
+            if key not in compiled:
+                compiled[key] = Spec(key, path)
+            if pos_index is not None:
+                kwargs['positional'] = pos_index
+            if keywords:
+                kwargs['keywords'] = tuple(
+                    sys.intern(keyword) for keyword in keywords
+                )
+            compiled[key] = compiled[key]._replace(**kwargs)
+
+        for spec in join_keyword_specs(specs):
+            _add(spec, tracked=True, limit=limit)
+        # functions of the project can be called without importing their
+        # module, e.g. by relative imports, but not without their name
+        words = set()
+        for spec in wrappers:
+            _add(spec, tracked=True, limit=limit)
+            (_, func), _ = parse_function_spec(spec)
+            words.add(func)
+        for spec in clients:
+            _add(spec, client=True)
+        for module in settings:
+            path = tuple(
+                sys.intern(part) for part in parse_module_path(module)
+            )
+            key = sys.intern('.'.join(path))
+            compiled[key] = compiled.get(key, Spec(key, path))._replace(
+                settings=True,
+            )
+        for spec in limits:
+            key, spec_limit = parse_limit_spec(spec)
+            if key not in compiled or not compiled[key].tracked:
+                raise ValueError(f'Limit for a function not tracked: {spec}')
+            compiled[key] = compiled[key]._replace(limit=spec_limit)
+        for spec in pools:
+            _add(spec, pool=True)
+        for spec in blocking:
+            _add(spec, blocking=True)
+        pool_modules = {
+            spec.path[:-1] for spec in compiled.values() if spec.pool
+        }
+        for key, compiled_spec in compiled.items():
+            if (
+                    compiled_spec.tracked and
+                    not compiled_spec.pool and
+                    compiled_spec.path[:-1] in pool_modules
+            ):
+                compiled[key] = compiled_spec._replace(one_shot=True)
+
+        trie: Trie = {}
+        for compiled_spec in compiled.values():
+            node = trie
+            for part in compiled_spec.path:
+                node = node.setdefault(part, {})
+            node[''] = compiled_spec
+
+        words.update(trie)
+        prefilter = re.compile(
+            rf"\b(?:{'|'.join(re.escape(word) for word in sorted(words))})\b",
+        )
+        config = repr(sorted(compiled.values())).encode()
+        fingerprint = hashlib.sha256(config).hexdigest()
+        keywords = frozenset(
+            keyword
+            for compiled_spec in compiled.values() if compiled_spec.tracked
+            for keyword in compiled_spec.keywords
+        )
+        return cls(trie, prefilter, fingerprint, keywords)
+
+    def lookup(self, path: Iterable[str]) -> Spec | None:
+        node = self.trie
+        for part in path:
+            child = node.get(part)
+            if child is None:
+                return None
+            node = child
+        return node.get('')
+
+    def tracked(self) -> list[str]:
+        keys = []
+        stack = [self.trie]
+        while stack:
+            for part, child in stack.pop().items():
+                if part:
+                    stack.append(child)
+                elif child.tracked:
+                    keys.append(child.key)
+        return keys
+
+    def is_settings(self, path: Sequence[str]) -> bool:
+        # whether the path is a name inside of a settings module
+        node = self.trie
+        for part in path[:-1]:
+            child = node.get(part)
+            if child is None:
+                return False
+            node = child
+            spec = node.get('')
+            if spec is not None and spec.settings:
+                return True
+        return False
+
+
+DEFAULT_MATCHER = Matcher.compile(
+    DEFAULT_TRACKED_FUNCTIONS,
+    DEFAULT_CLIENTS,
+    pools=DEFAULT_POOLS,
+    blocking=DEFAULT_BLOCKING,
+)
+
+# nodes that can never have a call anywhere below them, they are not descended
+# into during the traversal
+_NO_CALLS = frozenset((
+    ast.Constant, ast.Name, ast.Pass, ast.Break, ast.Continue, ast.Global,
+    ast.Nonlocal, ast.alias, ast.Import, ast.ImportFrom,
+    *ast.expr_context.__subclasses__(), *ast.boolop.__subclasses__(),
+    *ast.operator.__subclasses__(), *ast.unaryop.__subclasses__(),
+    *ast.cmpop.__subclasses__(),
+))
+
+
+# fields which run on every iteration of a loop or comprehension and the
+# number of loops they are nested in by it. The generators of a comprehension
+# are handled in Visitor.visit since each one is nested in the ones before it
+_LOOP_FIELDS: dict[type[ast.AST], dict[str, int]] = {
+    ast.For: {'body': 1},
+    ast.AsyncFor: {'body': 1},
+    ast.While: {'test': 1, 'body': 1},
+    ast.comprehension: {'ifs': 1},
+}
+_COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)
+for _comprehension in _COMPREHENSIONS:
+    # the number of generators is added when the node is visited
+    _LOOP_FIELDS[_comprehension] = {'elt': 0, 'key': 0, 'value': 0}
+
+# nodes without a name below them
+_NO_NAMES = _NO_CALLS.difference((ast.Name, ast.Global, ast.Nonlocal))
+
+
+_OPERATORS: dict[type[ast.operator], Callable[[Any, Any], float]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+}
+
+
+def _format_seconds(value: float) -> str:
+    return 'None' if value == math.inf else f'{value:g}s'
+
+
+def _check_limit(timeout: tuple[float, float], limit: Limit) -> str | None:
+    for kind, value, maximum in zip(('connect ', 'read '), timeout, limit):
+        if maximum is not None and value > maximum:
+            return MSG_TOO_LARGE.format(
+                kind if limit[0] != limit[1] or timeout[0] != timeout[1]
+                else '',
+                _format_seconds(value),
+                _format_seconds(maximum),
+            )
+    return None
+
+
+class Const(NamedTuple):
+    # a constant expression, timeout is its value as (connect, read) and None
+    # for an explicit None
+    timeout: tuple[float, float] | None
+    # a single number which can be used in arithmetic
+    scalar: bool = False
+    # the key of a dict containing a timeout which can be passed as **kwargs
+    kwargs: str | None = None
+
+
+# the value of a name from a settings module is not known, nan is never
+# larger than a maximum
+UNKNOWN = Const((math.nan, math.nan), scalar=True)
+# timeouts are simple expressions, deeper ones are not evaluated
+MAX_EVALUATE_DEPTH = 32
+# summaries of files which were not seen for this long are removed (seconds)
+INDEX_MAX_AGE = 7 * 24 * 60 * 60
+
+
+class Scope:
+    __slots__ = (
+        'parent', 'names', 'is_class', 'self_name', 'function', 'qualname',
+    )
+
     def __init__(
             self,
-            tracked_functions: set[tuple[str, str]],
-            timeout_positional: dict[str, int],
+            parent: 'Scope | None' = None,
+            name: str | None = None,
+            *,
+            is_class: bool = False,
+            self_name: str | None = None,
+            function: 'ast.FunctionDef | ast.AsyncFunctionDef | None' = None,
     ) -> None:
-        self.assignments: list[tuple[int, int]] = []
-        # map local names to (module, attr) tuples
-        # 'urlopen': ('urllib.request', 'urlopen')
-        # 'request': ('urllib', 'request') for module imports
-        self.imports: dict[str, tuple[str, str | None]] = {}
-        self.tracked_functions = tracked_functions
-        self.timeout_positional = timeout_positional
-
-    def visit_Import(self, node: ast.Import) -> None:
-        for alias in node.names:
-            local_name = (
-                alias.asname if alias.asname else alias.name.split('.')[-1]
+        self.parent = parent
+        # dotted name of the class or function, e.g. 'Client.fetch'
+        if parent is not None and parent.qualname is not None:
+            self.qualname: str | None = f'{parent.qualname}.{name}'
+        else:
+            self.qualname = name
+        # local name -> dotted path it is bound to (imports and clients), the
+        # constant assigned to it or None when it shadows such a name.
+        # Instance attributes assigned in methods are stored in the class
+        # scope as '.attr'. Outside of functions only these names are stored
+        # so the size is bounded by the tracked bindings and constants
+        self.names: dict[str, tuple[str, ...] | Const | None] = {}
+        self.is_class = is_class
+        # name of the first argument of a method
+        self.self_name = self_name
+        # the function this is the body of
+        self.function = function
+
+    def find(self, name: str) -> 'Scope | None':
+        # the scope the name is bound in
+        scope: Scope | None = self
+        while scope is not None:
+            if name in scope.names:
+                return scope
+            scope = scope.parent
+            # names of a class body are not visible in its methods
+            while scope is not None and scope.is_class:
+                scope = scope.parent
+        return None
+
+    def bound(self, name: str) -> bool:
+        return self.find(name) is not None
+
+    def resolve(self, name: str) -> tuple[str, ...] | None:
+        scope = self.find(name)
+        if scope is None:
+            # unbound names are resolved as they are written
+            return (name,)
+        value = scope.names[name]
+        return None if isinstance(value, Const) else value
+
+    def constant(self, name: str) -> Const | None:
+        scope = self.find(name)
+        value = scope.names[name] if scope is not None else None
+        return value if isinstance(value, Const) else None
+
+    def bind(
+            self,
+            name: str,
+            value: tuple[str, ...] | Const | None,
+    ) -> None:
+        # arguments and names assigned in a function or lambda are always
+        # local, they shadow module names even when they are not imported
+        if (
+                value is not None or
+                (self.parent is not None and not self.is_class) or
+                self.find(name) is not None
+        ):
+            self.names[name] = value
+
+
+def _timeout_argument(args: ast.arguments) -> str | None:
+    # the spec suffix of an argument named timeout which defaults to None
+    positional = [*args.posonlyargs, *args.args]
+    defaults = [None] * (len(positional) - len(args.defaults)) + args.defaults
+    for index, (arg, default) in enumerate(zip(positional, defaults)):
+        if arg.arg == 'timeout':
+            is_none = (
+                isinstance(default, ast.Constant) and default.value is None
+            )
+            return f':{index}' if is_none else None
+    for arg, kw_default in zip(args.kwonlyargs, args.kw_defaults):
+        if arg.arg == 'timeout':
+            is_none = (
+                isinstance(kw_default, ast.Constant) and
+                kw_default.value is None
+            )
+            return '' if is_none else None
+    return None
+
+
+def _sets_timeout(
+        function: ast.FunctionDef | ast.AsyncFunctionDef,
+        name: str,
+) -> bool:
+    # kwargs.setdefault('timeout', 5), kwargs.update(...) or
+    # kwargs['timeout'] = 5 in the function
+    for node in ast.walk(function):
+        if (
+                isinstance(node, ast.Call) and
+                isinstance(node.func, ast.Attribute) and
+                node.func.attr in {'setdefault', 'update'} and
+                isinstance(node.func.value, ast.Name) and
+                node.func.value.id == name
+        ):
+            return True
+        elif (
+                isinstance(node, ast.Subscript) and
+                isinstance(node.ctx, ast.Store) and
+                isinstance(node.value, ast.Name) and
+                node.value.id == name
+        ):
+            return True
+    return False
+
+
+class Violation:
+    __slots__ = (
+        'lineno', 'col_offset', 'end_lineno', 'end_col_offset', 'spec', 'msg',
+        'status', 'function',
+    )
+
+    def __init__(
+            self,
+            lineno: int,
+            col_offset: int,
+            end_lineno: int,
+            end_col_offset: int,
+            spec: Spec,
+            msg: str,
+            status: str,
+            function: str | None,
+    ) -> None:
+        self.lineno = lineno
+        self.col_offset = col_offset
+        self.end_lineno = end_lineno
+        self.end_col_offset = end_col_offset
+        self.spec = spec
+        self.msg = msg
+        # one of the STATUS_* constants
+        self.status = status
+        # qualified name of the enclosing function, None on module level
+        self.function = function
+
+
+class Visitor:
+    def __init__(
+            self,
+            matcher: Matcher,
+            module: tuple[str, ...] | None = None,
+            package: tuple[str, ...] | None = None,
+    ) -> None:
+        self.matcher = matcher
+        # dotted name of the module and its package if known, module level
+        # functions resolve to their full name and relative imports work
+        self.module = module
+        self.package = package
+        self.module_scope = Scope()
+        # instrumentation for --timeout-stats
+        self.n_nodes = self.n_calls = self.n_imports = 0
+        # number of loops and comprehensions the current node runs in
+        self.loop_depth = 0
+        # module level function -> TIM202 violations of the calls of one-shot
+        # functions in it and the names of the functions called in a loop,
+        # the violations are reported if the function is one of them
+        self.one_shot_calls: dict[str, list[Violation]] = {}
+        self.called_in_loop: set[str] = set()
+        # calls in functions whose timeout uses names which are not bound
+        # yet, e.g. a constant assigned below the function. Functions run
+        # after the module, so they are checked again once it is walked
+        self.deferred: list[tuple[ast.Call, Spec, Scope]] = []
+        # (spec, kind of timeout) -> number of tracked calls, only counted
+        # for --timeout-coverage
+        self.coverage: dict[tuple[str, str], int] | None = None
+        # function -> the calls in it whose result outlives it
+        self._kept: dict[ast.AST, set[ast.AST]] = {}
+        self._dispatch: dict[
+            type[ast.AST], Callable[[Any, Scope], Scope | None],
+        ] = {
+            ast.Import: self.visit_Import,
+            ast.ImportFrom: self.visit_ImportFrom,
+            ast.Assign: self.visit_Assign,
+            ast.AnnAssign: self.visit_AnnAssign,
+            ast.NamedExpr: self.visit_NamedExpr,
+            ast.With: self.visit_With,
+            ast.AsyncWith: self.visit_With,
+            ast.FunctionDef: self.visit_FunctionDef,
+            ast.AsyncFunctionDef: self.visit_FunctionDef,
+            ast.Lambda: self.visit_Lambda,
+            ast.ClassDef: self.visit_ClassDef,
+        }
+
+    def visit(self, tree: ast.AST) -> Generator[Violation, None, None]:
+        yield from self.walk(tree)
+        yield from self.recheck()
+        yield from self.one_shot()
+
+    def walk(self, tree: ast.AST) -> Generator[Violation, None, None]:
+        # pre-order walk with an explicit stack (the same order as
+        # ast.NodeVisitor) so deeply nested code cannot hit the recursion
+        # limit. Violations are yielded as soon as they are found
+        dispatch = self._dispatch
+        visit_call = self.visit_Call
+        skip = _NO_CALLS.difference(dispatch)
+        scope = self.module_scope
+        depth = self.loop_depth
+        # a Scope on the stack marks where the traversal enters or leaves it,
+        # an int sets the loop depth
+        stack: list[ast.AST | Scope | int] = [tree]
+        n_nodes = 0
+        while stack:
+            node = stack.pop()
+            if type(node) is Scope:
+                scope = node
+                continue
+            elif type(node) is int:
+                depth = self.loop_depth = node
+                continue
+            assert isinstance(node, ast.AST)
+            n_nodes += 1
+
+            body_scope = None
+            if type(node) is ast.Call:
+                yield from visit_call(node, scope)
+            else:
+                handler = dispatch.get(type(node))
+                if handler is not None:
+                    body_scope = handler(node, scope)
+
+            loop_fields = _LOOP_FIELDS.get(type(node))
+            if body_scope is None and loop_fields is None:
+                # push the children in reverse so they are popped in field
+                # order
+                for field in reversed(node._fields):
+                    value = getattr(node, field, None)
+                    if isinstance(value, list):
+                        for child in reversed(value):
+                            if (
+                                    isinstance(child, ast.AST) and
+                                    type(child) not in skip
+                            ):
+                                stack.append(child)
+                    elif (
+                            isinstance(value, ast.AST) and
+                            type(value) not in skip
+                    ):
+                        stack.append(value)
+                continue
+
+            # the same with markers around the fields which change the scope
+            # or the loop depth
+            for field in reversed(node._fields):
+                value = getattr(node, field, None)
+                inner = depth
+                if body_scope is not None and field == 'body':
+                    stack.append(scope)
+                    if not body_scope.is_class:
+                        # the body of a function runs when it is called
+                        inner = 0
+                elif loop_fields is not None and field in loop_fields:
+                    inner += loop_fields[field]
+                    if isinstance(node, _COMPREHENSIONS):
+                        inner += len(node.generators)
+                if inner != depth:
+                    stack.append(depth)
+                if field == 'generators' and isinstance(node, _COMPREHENSIONS):
+                    # the first iterable is evaluated once, every further
+                    # one for each item of the generators before it
+                    for index in reversed(range(len(node.generators))):
+                        stack.append(depth)
+                        stack.append(node.generators[index])
+                        stack.append(depth + index)
+                elif isinstance(value, list):
+                    for child in reversed(value):
+                        if (
+                                isinstance(child, ast.AST) and
+                                type(child) not in skip
+                        ):
+                            stack.append(child)
+                elif isinstance(value, ast.AST) and type(value) not in skip:
+                    stack.append(value)
+                if inner != depth:
+                    stack.append(inner)
+                if body_scope is not None and field == 'body':
+                    stack.append(body_scope)
+
+        self.n_nodes += n_nodes
+
+    def recheck(self) -> Generator[Violation, None, None]:
+        # the deferred calls with the names of the whole module
+        for node, spec, scope in self.deferred:
+            timeout, checked = self._check_timeout(node, spec, scope)
+            yield from self._timeout_violations(
+                node, spec, scope, timeout, checked,
             )
-            self.imports[local_name] = (alias.name, None)
-        self.generic_visit(node)
 
-    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
-        if node.module is None:
-            self.generic_visit(node)
+    def one_shot(self) -> Generator[Violation, None, None]:
+        # only known once the whole module has been walked, reported last
+        for name in self.called_in_loop.intersection(self.one_shot_calls):
+            yield from self.one_shot_calls[name]
+
+    def visit_Import(self, node: ast.Import, scope: Scope) -> None:
+        self.n_imports += len(node.names)
+        for alias in node.names:
+            if alias.asname:
+                scope.bind(alias.asname, tuple(alias.name.split('.')))
+            else:
+                # 'import a.b' binds 'a'
+                name = alias.name.partition('.')[0]
+                scope.bind(name, (name,))
+
+    def visit_ImportFrom(self, node: ast.ImportFrom, scope: Scope) -> None:
+        if node.level:
+            # relative imports can only refer to a wrapper of the project
+            if self.package is None or node.level - 1 > len(self.package):
+                return
+            module = self.package[:len(self.package) - node.level + 1]
+        else:
+            module = ()
+        if node.module is not None:
+            module = (*module, *node.module.split('.'))
+        if not module:
             return
 
+        self.n_imports += len(node.names)
         for alias in node.names:
             local_name = alias.asname if alias.asname else alias.name
-            self.imports[local_name] = (node.module, alias.name)
-        self.generic_visit(node)
+            scope.bind(local_name, (*module, alias.name))
+
+    def _path(self, node: ast.expr, scope: Scope) -> tuple[str, ...] | None:
+        # flatten the attribute chain of e.g. a.b.c.d into ['d', 'c', 'b']
+        # and 'a', the root is resolved through the scopes
+        attrs = []
+        while isinstance(node, ast.Attribute):
+            attrs.append(node.attr)
+            node = node.value
+
+        if isinstance(node, ast.Name):
+            if attrs and node.id == scope.self_name:
+                # self.session.get where __init__ set self.session
+                assert scope.parent is not None
+                prefix = scope.parent.names.get(f'.{attrs[-1]}')
+                if prefix is not None:
+                    attrs.pop()
+                else:
+                    prefix = scope.resolve(node.id)
+            elif len(attrs) < 2 and not scope.bound(node.id):
+                # without an import only a dotted module path like
+                # urllib.request.urlopen is taken as written, not requests.get
+                return None
+            else:
+                prefix = scope.resolve(node.id)
+        elif isinstance(node, ast.Call):
+            # requests.Session().get(...)
+            client = self._client(node, scope)
+            prefix = client.path if client is not None else None
+        else:
+            return None
+
+        if prefix is None:
+            return None
+        attrs.reverse()
+        return (*prefix, *attrs)
+
+    def _lookup(self, node: ast.expr, scope: Scope) -> Spec | None:
+        path = self._path(node, scope)
+        return self.matcher.lookup(path) if path is not None else None
+
+    def _client(self, node: ast.expr | None, scope: Scope) -> Spec | None:
+        # the client spec created by a call like requests.Session()
+        if not isinstance(node, ast.Call):
+            return None
+        func = node.func
+        while isinstance(func, ast.Attribute):
+            func = func.value
+        if isinstance(func, ast.Call):
+            # do not follow call chains like a().b().c() recursively
+            return None
+        spec = self._lookup(node.func, scope)
+        return spec if spec is not None and spec.client else None
+
+    def _annotation(self, node: ast.expr | None, scope: Scope) -> Spec | None:
+        # the client spec of an annotation like requests.Session | None
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.BitOr):
+            return (
+                self._annotation(node.left, scope) or
+                self._annotation(node.right, scope)
+            )
+        if not isinstance(node, (ast.Name, ast.Attribute)):
+            return None
+        spec = self._lookup(node, scope)
+        return spec if spec is not None and spec.client else None
+
+    def _value(
+            self,
+            node: ast.expr | None,
+            scope: Scope,
+    ) -> tuple[str, ...] | Const | None:
+        # what a name bound to the expression refers to, a client or constant
+        if node is None:
+            return None
+        client = self._client(node, scope)
+        if client is not None:
+            return client.path
+        return self._evaluate(node, scope)
+
+    def _bind_target(
+            self,
+            target: ast.expr,
+            value: tuple[str, ...] | Const | None,
+            scope: Scope,
+    ) -> None:
+        if isinstance(target, ast.Name):
+            scope.bind(target.id, value)
+            if scope.is_class and isinstance(value, Const):
+                # class constants are read as self.NAME in methods
+                scope.bind(f'.{target.id}', value)
+        elif (
+                isinstance(target, ast.Attribute) and
+                isinstance(target.value, ast.Name) and
+                target.value.id == scope.self_name
+        ):
+            assert scope.parent is not None
+            scope.parent.bind(f'.{target.attr}', value)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for elt in target.elts:
+                self._bind_target(elt, None, scope)
+        elif isinstance(target, ast.Starred):
+            self._bind_target(target.value, None, scope)
+
+    def visit_Assign(self, node: ast.Assign, scope: Scope) -> None:
+        value = self._value(node.value, scope)
+        for target in node.targets:
+            self._bind_target(target, value, scope)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign, scope: Scope) -> None:
+        value = self._value(node.value, scope)
+        if value is None:
+            client = self._annotation(node.annotation, scope)
+            value = client and client.path
+        if scope.is_class and isinstance(node.target, ast.Name):
+            # class level annotations declare instance attributes
+            scope.bind(f'.{node.target.id}', value)
+        self._bind_target(node.target, value, scope)
+
+    def visit_NamedExpr(self, node: ast.NamedExpr, scope: Scope) -> None:
+        self._bind_target(node.target, self._value(node.value, scope), scope)
+
+    def visit_With(
+            self,
+            node: ast.With | ast.AsyncWith,
+            scope: Scope,
+    ) -> None:
+        for item in node.items:
+            if item.optional_vars is not None:
+                client = self._client(item.context_expr, scope)
+                self._bind_target(
+                    item.optional_vars, client and client.path, scope,
+                )
+
+    def visit_FunctionDef(
+            self,
+            node: ast.FunctionDef | ast.AsyncFunctionDef,
+            scope: Scope,
+    ) -> Scope:
+        if self.module is not None and scope is self.module_scope:
+            scope.bind(node.name, (*self.module, node.name))
+        else:
+            scope.bind(node.name, None)
+        args = [*node.args.posonlyargs, *node.args.args]
+        self_name = args[0].arg if scope.is_class and args else None
+        body_scope = Scope(
+            scope, node.name, self_name=self_name, function=node,
+        )
+        for arg in (
+                *args, *node.args.kwonlyargs, node.args.vararg,
+                node.args.kwarg,
+        ):
+            if arg is not None and arg.arg != self_name:
+                client = self._annotation(arg.annotation, scope)
+                body_scope.bind(arg.arg, client and client.path)
+        return body_scope
+
+    def visit_Lambda(self, node: ast.Lambda, scope: Scope) -> Scope:
+        body_scope = Scope(scope, '<lambda>')
+        for arg in (*node.args.posonlyargs, *node.args.args):
+            body_scope.bind(arg.arg, None)
+        return body_scope
+
+    def visit_ClassDef(self, node: ast.ClassDef, scope: Scope) -> Scope:
+        scope.bind(node.name, None)
+        return Scope(scope, node.name, is_class=True)
+
+    def _evaluate(
+            self,
+            node: ast.expr,
+            scope: Scope,
+            depth: int = 0,
+            keywords: Collection[str] | None = None,
+    ) -> Const | None:
+        # the value of a constant expression like '5 * 60', '(5, TIMEOUT)' or
+        # {'timeout': 5}, names are resolved in the constants bound so far,
+        # dicts are looked up for the keywords of any tracked function unless
+        # the ones of the called function are given
+        if depth > MAX_EVALUATE_DEPTH:
+            return None
+        depth += 1
+        if isinstance(node, ast.Constant):
+            if node.value is None:
+                return Const(None)
+            elif (
+                    isinstance(node.value, (int, float)) and
+                    type(node.value) is not bool
+            ):
+                return Const((node.value, node.value), scalar=True)
+        elif isinstance(node, ast.Name):
+            return scope.constant(node.id) or self._settings(node, scope)
+        elif isinstance(node, ast.Attribute):
+            if (
+                    isinstance(node.value, ast.Name) and
+                    node.value.id == scope.self_name
+            ):
+                # self.TIMEOUT of a class constant
+                assert scope.parent is not None
+                attr = scope.parent.names.get(f'.{node.attr}')
+                if isinstance(attr, Const):
+                    return attr
+            return self._settings(node, scope)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            operand = self._scalar(node.operand, scope, depth)
+            if operand is not None:
+                return Const((-operand, -operand), scalar=True)
+        elif isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+            left = self._scalar(node.left, scope, depth)
+            right = self._scalar(node.right, scope, depth)
+            if left is not None and right is not None:
+                try:
+                    value = _OPERATORS[type(node.op)](left, right)
+                except ZeroDivisionError:
+                    return None
+                return Const((value, value), scalar=True)
+        elif isinstance(node, ast.Tuple) and len(node.elts) == 2:
+            # (connect, read) where None is no timeout
+            timeout = []
+            for elt in node.elts:
+                if isinstance(elt, ast.Constant) and elt.value is None:
+                    timeout.append(math.inf)
+                else:
+                    seconds = self._scalar(elt, scope, depth)
+                    if seconds is None:
+                        return None
+                    timeout.append(seconds)
+            connect, read = timeout
+            return Const((connect, read))
+        elif isinstance(node, ast.Dict):
+            if keywords is None:
+                keywords = self.matcher.keywords
+            for key, item in zip(node.keys, node.values):
+                if (
+                        isinstance(key, ast.Constant) and
+                        isinstance(key.value, str) and
+                        key.value in keywords
+                ):
+                    return self._kwargs(item, scope, depth, key.value)
+        elif (
+                isinstance(node, ast.Call) and
+                isinstance(node.func, ast.Name) and
+                scope.resolve(node.func.id) == ('dict',)
+        ):
+            # dict(timeout=5)
+            if keywords is None:
+                keywords = self.matcher.keywords
+            for keyword in node.keywords:
+                if keyword.arg is not None and keyword.arg in keywords:
+                    return self._kwargs(
+                        keyword.value, scope, depth, keyword.arg,
+                    )
+        return None
+
+    def _scalar(
+            self,
+            node: ast.expr,
+            scope: Scope,
+            depth: int,
+    ) -> float | None:
+        value = self._evaluate(node, scope, depth)
+        if value is None or not value.scalar or value.timeout is None:
+            return None
+        return value.timeout[0]
+
+    def _kwargs(
+            self,
+            node: ast.expr,
+            scope: Scope,
+            depth: int,
+            key: str,
+    ) -> Const | None:
+        value = self._evaluate(node, scope, depth)
+        return value._replace(kwargs=key) if value is not None else None
+
+    def _settings(self, node: ast.expr, scope: Scope) -> Const | None:
+        path = self._path(node, scope)
+        if path is not None and self.matcher.is_settings(path):
+            return UNKNOWN
+        return None
 
     def _check_timeout(
             self,
             node: ast.Call,
-            func_spec: str | None = None,
-    ) -> bool:
-        # Check keyword arguments
+            spec: Spec,
+            scope: Scope,
+    ) -> tuple[ast.expr | None, tuple[str, str] | None]:
+        # the expression passing the timeout, None if there is none, and the
+        # status of the timeout and the message of the violation, if any
+        timeout: ast.expr
         for kwarg in node.keywords:
+            if kwarg.arg in spec.keywords:
+                timeout = kwarg.value
+                value = self._evaluate(timeout, scope)
+                break
+            elif kwarg.arg is None:
+                # **{'timeout': 5} or a name bound to such a dict
+                timeout = kwarg.value
+                value = self._evaluate(timeout, scope, keywords=spec.keywords)
+                if value is not None and value.kwargs in spec.keywords:
+                    break
+        else:
+            if spec.positional is None or len(node.args) <= spec.positional:
+                return None, (STATUS_MISSING, MSG)
+            timeout = node.args[spec.positional]
+            value = self._evaluate(timeout, scope)
+            if value is None:
+                # a keyword has to be constant, any positional argument counts
+                return timeout, None
+
+        if value is None:
+            return timeout, (STATUS_NOT_CONSTANT, MSG)
+        elif value.timeout is None or math.inf in value.timeout:
+            # None in a (connect, read) tuple is no timeout either
+            return timeout, (STATUS_NONE, MSG)
+        elif min(value.timeout) < 0:
+            return timeout, (STATUS_NEGATIVE, MSG)
+        msg = _check_limit(value.timeout, spec.limit)
+        return timeout, (STATUS_TOO_LARGE, msg) if msg is not None else None
+
+    def _cover(
+            self,
+            spec: Spec,
+            scope: Scope,
+            timeout: ast.expr | None,
+            checked: tuple[str, str] | None,
+            reported: bool,
+    ) -> None:
+        # counts the tracked call by the kind of its timeout, the expression
+        # found by _check_timeout
+        assert self.coverage is not None
+        if reported:
+            assert checked is not None
+            kind = checked[0]
+        elif checked is not None:
+            # a wrapper which is passed the timeout by its callers
+            kind = COVERAGE_FORWARDED
+        else:
+            assert timeout is not None
+            if not any(
+                    isinstance(child, (ast.Name, ast.Attribute))
+                    for child in ast.walk(timeout)
+            ):
+                kind = COVERAGE_LITERAL
+            elif (
+                    self._evaluate(timeout, scope, keywords=spec.keywords)
+                    is not None
+            ):
+                kind = COVERAGE_CONSTANT
+            else:
+                kind = COVERAGE_DYNAMIC
+        key = (spec.key, kind)
+        self.coverage[key] = self.coverage.get(key, 0) + 1
+
+    def _forwarded(
+            self,
+            node: ast.Call,
+            scope: Scope,
+            keywords: Collection[str],
+    ) -> str | None:
+        # whether the call is passed the timeout of the module level function
+        # it is in as one of the keywords of the called function, returns the
+        # suffix of the spec of the function: '' if the timeout is passed as
+        # keyword or ':index' if it can be positional
+        function = scope.function
+        if function is None or scope.parent is not self.module_scope:
+            return None
+
+        args = function.args
+        for keyword in node.keywords:
+            if keyword.arg is not None and keyword.arg in keywords:
+                # timeout=timeout where the argument defaults to None
+                if (
+                        isinstance(keyword.value, ast.Name) and
+                        keyword.value.id == 'timeout'
+                ):
+                    return _timeout_argument(args)
+                return None
+
+        kwarg = args.kwarg.arg if args.kwarg is not None else None
+        for keyword in node.keywords:
             if (
-                kwarg.arg == 'timeout' and
-                isinstance(kwarg.value, ast.Constant) and
-                kwarg.value.value is not None
+                    keyword.arg is None and
+                    isinstance(keyword.value, ast.Name) and
+                    keyword.value.id == kwarg and
+                    not _sets_timeout(function, kwarg)
             ):
-                return True
+                return ''
+        return None
 
-        # Check posargs if function has a known positional timeout index
-        if func_spec and func_spec in self.timeout_positional:
-            pos_index = self.timeout_positional[func_spec]
-            if len(node.args) > pos_index:
-                return True
+    def _is_wrapper(self, scope: Scope) -> bool:
+        if self.module is None or scope.function is None:
+            return False
+        spec = self.matcher.lookup((*self.module, scope.function.name))
+        return spec is not None and spec.tracked
 
-        return False
+    def _kept_calls(
+            self,
+            function: ast.FunctionDef | ast.AsyncFunctionDef,
+            factory: bool,
+    ) -> set[ast.AST]:
+        # the calls whose result outlives a call of the function: stored in
+        # an attribute, an item or a global, bound to a name used in a loop
+        # or returned by a factory
+        kept = self._kept.get(function)
+        if kept is not None:
+            return kept
 
-    def visit_Call(self, node: ast.Call) -> None:
-        func_spec: str | None = None
-
-        # direct function call
-        if isinstance(node.func, ast.Name):
-            func_name = node.func.id
-            if func_name in self.imports:
-                module, attr = self.imports[func_name]
-                # attr should be the function name for 'from X import Y'
-                if attr and (module, attr) in self.tracked_functions:
-                    func_spec = f"{module}.{attr}"
-
-        # attribute call
-        elif isinstance(node.func, ast.Attribute):
-            attr_name = node.func.attr
-
-            # Check if the base is a Name (requests.get or request.urlopen)
-            if isinstance(node.func.value, ast.Name):
-                base_name = node.func.value.id
-
-                if base_name in self.imports:
-                    module, imported_attr = self.imports[base_name]
-
-                    # If imported_attr is None, it's a module import
-                    if imported_attr is None:
-                        # Check if module.attr is tracked
-                        if (module, attr_name) in self.tracked_functions:
-                            func_spec = f"{module}.{attr_name}"
+        names: set[str] = set()
+        values: list[ast.expr] = []
+        bound: list[tuple[ast.expr, ast.expr]] = []
+        # the nodes of the function and whether they run in a loop in it
+        stack: list[tuple[ast.AST, bool]] = [(function, False)]
+        while stack:
+            node, in_loop = stack.pop()
+            if type(node) is ast.Name:
+                if in_loop:
+                    names.add(node.id)
+                continue
+            elif isinstance(node, (ast.Global, ast.Nonlocal)):
+                names.update(node.names)
+            elif isinstance(node, (ast.Return, ast.Yield)):
+                if factory and node.value is not None:
+                    values.append(node.value)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+                targets = (
+                    node.targets if isinstance(node, ast.Assign)
+                    else [node.target]
+                )
+                for target in targets:
+                    if node.value is None:
+                        break
+                    elif isinstance(target, (ast.Attribute, ast.Subscript)):
+                        values.append(node.value)
                     else:
-                        full_module = f"{module}.{imported_attr}"
-                        if (full_module, attr_name) in self.tracked_functions:
-                            func_spec = f"{full_module}.{attr_name}"
+                        bound.append((target, node.value))
+            elif isinstance(node, (ast.With, ast.AsyncWith)):
+                for item in node.items:
+                    if item.optional_vars is not None:
+                        bound.append((item.optional_vars, item.context_expr))
 
-            # nested attribute: urllib.request.urlopen('url')
-            elif isinstance(node.func.value, ast.Attribute):
-                if isinstance(node.func.value.value, ast.Name):
-                    base = node.func.value.value.id
-                    middle = node.func.value.attr
-                    func = attr_name
-                    full_spec = f"{base}.{middle}.{func}"
-                    module_part = f"{base}.{middle}"
+            in_loop = in_loop or type(node) in _LOOP_FIELDS
+            for field in node._fields:
+                value = getattr(node, field, None)
+                if isinstance(value, list):
+                    for child in value:
+                        if (
+                                isinstance(child, ast.AST) and
+                                type(child) not in _NO_NAMES
+                        ):
+                            stack.append((child, in_loop))
+                elif isinstance(value, ast.AST):
+                    if type(value) not in _NO_NAMES:
+                        stack.append((value, in_loop))
 
-                    if (module_part, func) in self.tracked_functions:
-                        func_spec = full_spec
+        calls: set[ast.AST] = set()
+        while True:
+            # the values themselves, the items of tuples and lists and the
+            # arguments of calls, e.g. 'return Client(session=Session())'
+            while values:
+                value = values.pop()
+                if isinstance(value, ast.Name):
+                    names.add(value.id)
+                elif isinstance(value, (ast.Tuple, ast.List)):
+                    values.extend(value.elts)
+                elif isinstance(value, ast.Call):
+                    calls.add(value)
+                    values.extend(value.args)
+                    values.extend(kw.value for kw in value.keywords)
+            # then the values bound to the names found so far
+            unresolved = []
+            for target, bound_value in bound:
+                if isinstance(target, ast.Name) and target.id in names:
+                    values.append(bound_value)
+                else:
+                    unresolved.append((target, bound_value))
+            if not values:
+                break
+            bound = unresolved
+        self._kept[function] = calls
+        return calls
 
-        if func_spec:
-            if not self._check_timeout(node, func_spec):
-                self.assignments.append((node.lineno, node.col_offset))
+    def _creates_pool(self, node: ast.Call, scope: Scope) -> str | None:
+        # where a new pool is created on every execution, if it is
+        if self.loop_depth:
+            return 'inside a loop'
+        function = scope.function
+        if function is None:
+            return None
+        assert scope.parent is not None
+        for decorator in function.decorator_list:
+            if isinstance(decorator, ast.Call):
+                decorator = decorator.func
+            if self._path(decorator, scope.parent) in CACHE_DECORATORS:
+                return None
+        factory = scope.parent is self.module_scope
+        if node in self._kept_calls(function, factory):
+            return None
+        return f'on every call of {scope.qualname}()'
 
-        self.generic_visit(node)
+    def visit_Call(
+            self,
+            node: ast.Call,
+            scope: Scope,
+    ) -> tuple[Violation, ...]:
+        self.n_calls += 1
+        if (
+                self.loop_depth and
+                type(node.func) is ast.Name and
+                self._module_function(node.func.id, scope)
+        ):
+            self.called_in_loop.add(node.func.id)
+        spec = self._lookup(node.func, scope)
+        if spec is None:
+            return ()
 
+        violations: tuple[Violation, ...] = ()
+        if spec.tracked:
+            timeout, checked = self._check_timeout(node, spec, scope)
+            if checked is not None and self._unresolved(node, timeout, scope):
+                self.deferred.append((node, spec, scope))
+            else:
+                violations = self._timeout_violations(
+                    node, spec, scope, timeout, checked,
+                )
+        if spec.pool:
+            where = self._creates_pool(node, scope)
+            if where is not None:
+                violations += (
+                    self._violation(
+                        node,
+                        spec,
+                        MSG_POOL.format(spec.key, where),
+                        STATUS_POOL,
+                        scope,
+                    ),
+                )
+        elif spec.tracked and self.loop_depth:
+            violations += (
+                self._violation(
+                    node,
+                    spec,
+                    MSG_LOOP.format(self.loop_depth),
+                    STATUS_LOOP,
+                    scope,
+                ),
+            )
+        if spec.blocking and type(scope.function) is ast.AsyncFunctionDef:
+            # not in nested functions and lambdas, e.g. ones passed to
+            # asyncio.to_thread or run_in_executor
+            violations += (
+                self._violation(
+                    node,
+                    spec,
+                    MSG_BLOCKING.format(spec.key, scope.qualname),
+                    STATUS_BLOCKING,
+                    scope,
+                ),
+            )
+        if spec.one_shot and scope is not self.module_scope:
+            top = scope
+            while top.parent is not self.module_scope:
+                assert top.parent is not None
+                top = top.parent
+            if top.function is not None:
+                name = top.function.name
+                self.one_shot_calls.setdefault(name, []).append(
+                    self._violation(
+                        node,
+                        spec,
+                        MSG_ONE_SHOT.format(spec.key, name),
+                        STATUS_ONE_SHOT,
+                        scope,
+                    ),
+                )
+        return violations
 
-class Namespace(argparse.Namespace):
-    timeout_funcs: list[str] = []
-    timeout_extend_funcs: list[str] = []
+    def _module_function(self, name: str, scope: Scope) -> bool:
+        # whether the name refers to the module level function of that name,
+        # not to an argument or local. It can be defined after the call
+        found = scope.find(name)
+        if found is None:
+            return True
+        elif found is not self.module_scope:
+            return False
+        value = found.names[name]
+        return value is None or (
+            self.module is not None and value == (*self.module, name)
+        )
 
+    def _unresolved(
+            self,
+            node: ast.Call,
+            timeout: ast.expr | None,
+            scope: Scope,
+    ) -> bool:
+        # whether the call runs after the module and its timeout, or a dict
+        # passed as **kwargs, uses a name which is not bound yet
+        inner = scope
+        while inner is not self.module_scope and inner.is_class:
+            assert inner.parent is not None
+            inner = inner.parent
+        if inner is self.module_scope:
+            return False
+        exprs = [kwarg.value for kwarg in node.keywords if kwarg.arg is None]
+        if timeout is not None:
+            exprs.append(timeout)
+        return any(
+            isinstance(child, ast.Name) and not scope.bound(child.id)
+            for expr in exprs
+            for child in ast.walk(expr)
+        )
 
-class Plugin:
-    name = __name__
-    version = importlib_metadata.version(__name__)
+    def _timeout_violations(
+            self,
+            node: ast.Call,
+            spec: Spec,
+            scope: Scope,
+            timeout: ast.expr | None,
+            checked: tuple[str, str] | None,
+    ) -> tuple[Violation, ...]:
+        violations: tuple[Violation, ...] = ()
+        if checked is not None:
+            status, msg = checked
+            if (
+                    status == STATUS_TOO_LARGE or
+                    not self._is_wrapper(scope) or
+                    self._forwarded(node, scope, spec.keywords) is None
+            ):
+                # otherwise the callers of the wrapper pass the timeout
+                violations = (
+                    self._violation(node, spec, msg, status, scope),
+                )
+        if self.coverage is not None:
+            self._cover(spec, scope, timeout, checked, bool(violations))
+        return violations
 
-    def __init__(self, tree: ast.AST):
-        self._tree = tree
-        self.tracked_functions = getattr(Plugin, 'tracked_functions', None)
-        self.extend_tracked_functions = getattr(
-            Plugin, 'extend_tracked_functions', [],
+    @staticmethod
+    def _violation(
+            node: ast.Call,
+            spec: Spec,
+            msg: str,
+            status: str,
+            scope: Scope,
+    ) -> Violation:
+        return Violation(
+            node.lineno,
+            node.col_offset,
+            node.end_lineno or 0,
+            node.end_col_offset or 0,
+            spec,
+            msg,
+            status,
+            scope.qualname,
         )
 
+
+RUN_ENV = 'FLAKE8_TIMEOUT_RUN'
+# changed when the cached results change
+CACHE_FORMAT = 4
+
+
+def _start_run() -> tuple[str, bool]:
+    # flake8 -j workers inherit the run of their parent, every other process
+    # starts a new one. Returns the run id and whether we own the run
+    run = os.environ.get(RUN_ENV)
+    if run is not None:
+        pid = int(run.split('-')[0])
+        if pid == os.getpid():
+            return run, True
+        elif pid == os.getppid():
+            return run, False
+
+    import uuid
+
+    run = os.environ[RUN_ENV] = f'{os.getpid()}-{uuid.uuid4().hex}'
+    return run, True
+
+
+class Result(NamedTuple):
+    line: int
+    col: int
+    end_line: int
+    end_col: int
+    msg: str
+    # key of the spec of the called function
+    spec: str
+    status: str
+    function: str | None
+
     @classmethod
-    def add_options(cls, option_manager: OptionManager) -> None:
-        option_manager.add_option(
-            '--timeout-funcs',
-            default=DEFAULT_TRACKED_FUNCTIONS,
-            parse_from_config=True,
-            comma_separated_list=True,
-            help=(
-                'Comma-separated list of fully qualified function names to '
-                'check for timeout. This OVERRIDES the defaults. '
-                'Format: "module.function" or "module.function:index" where '
-                'index is the positional argument index for timeout '
-                '(e.g., "foo.bar.baz,my.func:2"). '
-            ),
+    def from_violation(cls, v: Violation) -> 'Result':
+        return cls(
+            v.lineno,
+            v.col_offset,
+            v.end_lineno,
+            v.end_col_offset,
+            v.msg,
+            v.spec.key,
+            v.status,
+            v.function,
         )
-        option_manager.add_option(
-            '--timeout-extend-funcs',
-            default='',
-            parse_from_config=True,
-            comma_separated_list=True,
-            help=(
-                'Comma-separated list of additional fully qualified function '
-                'names to check for timeout. This EXTENDS the default list. '
-                'Format: "module.function" or "module.function:index" where '
-                'index is the positional argument index for timeout '
-                '(e.g., "foo.bar.baz,my.func:2").'
-            ),
+
+    def shift(self, lines: int) -> 'Result':
+        return self._replace(
+            line=self.line + lines, end_line=self.end_line + lines,
         )
 
-    @classmethod
-    def parse_options(cls, options: Namespace) -> None:
-        # Validate tracked_functions specs
-        for spec in options.timeout_funcs:
-            parse_function_spec(spec)
+    def record(self) -> dict[str, Any]:
+        # for the reports and the server, columns are 1-based and the end
+        # column is the one after the call
+        code, _, message = self.msg.partition(' ')
+        return {
+            'line': self.line,
+            'col': self.col + 1,
+            'end_line': self.end_line,
+            'end_col': self.end_col + 1,
+            'code': code,
+            'message': message,
+            'spec': self.spec,
+            'status': self.status,
+            'function': self.function,
+        }
+
+
+class ResultCache:
+    def __init__(
+            self,
+            path: str,
+            max_size: int,
+            fingerprint: str,
+            run: str,
+    ) -> None:
+        self.path = path
+        self.max_size = max_size
+        self.run = run
+        self._salt = (
+            f'{Plugin.version}:{CACHE_FORMAT}:{fingerprint}:'.encode()
+        )
+        self._db: 'sqlite3.Connection | None' = None
+        self._pid: int | None = None
+        # lookups are counted in memory and written once per process
+        self._hits = self._misses = 0
+        self._used: list[str] = []
+        self._counting_pid: int | None = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {
+            **self.__dict__,
+            '_db': None,
+            '_pid': None,
+            '_hits': 0,
+            '_misses': 0,
+            '_used': [],
+            '_counting_pid': None,
+        }
+
+    @property
+    def db(self) -> 'sqlite3.Connection':
+        # connections must not be shared with forked -j workers
+        if self._db is None or self._pid != os.getpid():
+            import sqlite3
+
+            self._db = sqlite3.connect(self.path, timeout=60)
+            self._pid = os.getpid()
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            with self._db:
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS results ('
+                    '   key TEXT PRIMARY KEY,'
+                    '   results TEXT NOT NULL,'
+                    '   used REAL NOT NULL'
+                    ')',
+                )
+                self._db.execute(
+                    'CREATE INDEX IF NOT EXISTS results_used '
+                    'ON results (used)',
+                )
+                self._db.execute(
+                    'CREATE TABLE IF NOT EXISTS stats ('
+                    '   run TEXT PRIMARY KEY,'
+                    '   hits INTEGER NOT NULL,'
+                    '   misses INTEGER NOT NULL'
+                    ')',
+                )
+        return self._db
+
+    def key(self, lines: list[str], module: str = '') -> str:
+        src = ''.join(lines).encode('utf-8', 'surrogatepass')
+        return hashlib.sha256(
+            self._salt + module.encode() + b':' + src,
+        ).hexdigest()
+
+    def _start_counting(self) -> None:
+        # forked -j workers start with counts of their own, which they flush
+        # when they exit since they are not the owner of the run
+        if self._counting_pid == os.getpid():
+            return
+        self._hits = self._misses = 0
+        self._used = []
+        self._counting_pid = os.getpid()
+        import multiprocessing
+
+        if multiprocessing.parent_process() is not None:
+            from multiprocessing import util
+
+            util.Finalize(None, self.flush, exitpriority=0)
+
+    def get(self, key: str) -> list[Result] | None:
+        # only reads, writing here would serialize the -j workers
+        self._start_counting()
+        row = self.db.execute(
+            'SELECT results FROM results WHERE key = ?', (key,),
+        ).fetchone()
+        if row is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._used.append(key)
+        return [Result(*result) for result in json.loads(row[0])]
+
+    def flush(self) -> None:
+        # writes the counts and when the entries were used in one transaction
+        if not self._hits and not self._misses:
+            return
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                'UPDATE results SET used = ? WHERE key = ?',
+                ((now, key) for key in self._used),
+            )
+            self.db.execute(
+                'INSERT INTO stats VALUES (?, ?, ?) ON CONFLICT (run) DO '
+                'UPDATE SET hits = hits + excluded.hits, '
+                '    misses = misses + excluded.misses',
+                (self.run, self._hits, self._misses),
+            )
+        self._hits = self._misses = 0
+        self._used = []
 
-        # Validate extend_tracked_functions specs
-        for spec in options.timeout_extend_funcs:
-            parse_function_spec(spec)
+    def put(self, key: str, results: list[Result]) -> None:
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+                (key, json.dumps(results), time.time()),
+            )
+
+    def report(self) -> None:
+        self.flush()
+        with self.db:
+            # evict the least recently used entries once per run
+            self.db.execute(
+                'DELETE FROM results WHERE key IN ('
+                '   SELECT key FROM results ORDER BY used DESC '
+                '   LIMIT -1 OFFSET ?'
+                ')',
+                (self.max_size,),
+            )
+            row = self.db.execute(
+                'SELECT hits, misses FROM stats WHERE run = ?', (self.run,),
+            ).fetchone()
+            self.db.execute('DELETE FROM stats WHERE run = ?', (self.run,))
+        # processes forked later on must not inherit an open connection,
+        # closing it there releases the locks of their own connections
+        self.db.close()
+        self._db = None
+        hits, misses = row if row is not None else (0, 0)
+        print(
+            f'flake8-timeout cache: {hits} hits, {misses} misses',
+            file=sys.stderr,
+        )
 
-        cls.tracked_functions = options.timeout_funcs
-        cls.extend_tracked_functions = options.timeout_extend_funcs
 
-    def _parse_tracked_functions(
+def module_name(filename: str) -> tuple[tuple[str, ...], tuple[str, ...]]:
+    # the dotted name of the module and its package, derived from the
+    # directories containing an __init__.py
+    directory, basename = os.path.split(os.path.abspath(filename))
+    package = []
+    while os.path.exists(os.path.join(directory, '__init__.py')):
+        directory, part = os.path.split(directory)
+        package.append(part)
+    package.reverse()
+    name = os.path.splitext(basename)[0]
+    if name == '__init__':
+        return tuple(package), tuple(package)
+    return (*package, name), tuple(package)
+
+
+class Summarizer(Visitor):
+    # collects the module level functions which pass their timeout on to
+    # another function as (spec of the function, called function)
+    def __init__(
+            self,
+            matcher: Matcher,
+            module: tuple[str, ...],
+            package: tuple[str, ...],
+    ) -> None:
+        super().__init__(matcher, module, package)
+        self.summaries: list[tuple[str, str]] = []
+
+    def visit_Call(
             self,
-            specs: list[str],
-    ) -> tuple[set[tuple[str, str]], dict[str, int]]:
-        tracked = set()
-        positional = {}
+            node: ast.Call,
+            scope: Scope,
+    ) -> tuple[Violation, ...]:
+        if scope.function is None or scope.parent is not self.module_scope:
+            return ()
+        path = self._path(node.func, scope)
+        if path is None:
+            return ()
+        # wrappers found in the project take the timeout as 'timeout'
+        spec = self.matcher.lookup(path)
+        keywords = spec.keywords if spec is not None else ('timeout',)
+        suffix = self._forwarded(node, scope, keywords)
+        if suffix is not None:
+            assert self.module is not None and scope.function is not None
+            self.summaries.append((
+                f'{".".join(self.module)}.{scope.function.name}{suffix}',
+                '.'.join(path),
+            ))
+        return ()
 
-        for spec in specs:
-            (module, func), pos_index = parse_function_spec(spec)
-            tracked.add((module, func))
-            if pos_index is not None:
-                positional[f"{module}.{func}"] = pos_index
 
-        return tracked, positional
+def _summarize(filename: str) -> list[tuple[str, str]]:
+    try:
+        with open(filename, 'rb') as f:
+            tree = ast.parse(f.read(), filename)
+    except (OSError, SyntaxError, ValueError):
+        return []
+    summarizer = Summarizer(Plugin.matcher, *module_name(filename))
+    for _ in summarizer.visit(tree):
+        pass
+    return summarizer.summaries
 
-    def run(self) -> Generator[tuple[int, int, str, type[Any]], None, None]:
-        # Determine which functions to track
-        if self.extend_tracked_functions:
-            # Extension mode: use defaults + extensions
-            specs = list(DEFAULT_TRACKED_FUNCTIONS)
-            specs.extend(self.extend_tracked_functions)
-        elif self.tracked_functions is not None:
-            # Override mode: use only specified functions
-            specs = self.tracked_functions
+
+def load_summaries(
+        path: str,
+        filenames: Iterable[str],
+        matcher: Matcher,
+        jobs: int,
+) -> list[tuple[str, str]]:
+    # the summaries of all files, stored in the index at path keyed by the
+    # hash of the file so only changed files are summarized again
+    import sqlite3
+
+    salt = f'{Plugin.version}:{matcher.fingerprint}:'.encode()
+    db = sqlite3.connect(path, timeout=60)
+    try:
+        with db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS summaries ('
+                '   key TEXT PRIMARY KEY,'
+                '   summaries TEXT NOT NULL,'
+                '   used REAL NOT NULL'
+                ')',
+            )
+
+        summaries: list[tuple[str, str]] = []
+        hits = []
+        misses = {}
+        for filename in filenames:
+            try:
+                with open(filename, 'rb') as f:
+                    src = f.read()
+            except OSError:
+                continue
+            module, _ = module_name(filename)
+            key = hashlib.sha256(
+                salt + '.'.join(module).encode() + b':' + src,
+            ).hexdigest()
+            row = db.execute(
+                'SELECT summaries FROM summaries WHERE key = ?', (key,),
+            ).fetchone()
+            if row is None:
+                misses[filename] = key
+            else:
+                summaries.extend(
+                    (wrapper, called)
+                    for wrapper, called in json.loads(row[0])
+                )
+                hits.append(key)
+
+        results: Iterable[list[tuple[str, str]]]
+        if jobs > 1 and len(misses) > 1:
+            import multiprocessing
+
+            with multiprocessing.Pool(
+                    min(jobs, len(misses)),
+                    _init_worker,
+                    initargs=(
+                        matcher, None, None, None, None, None, None, False,
+                    ),
+            ) as pool:
+                results = pool.map(_summarize, misses)
         else:
-            # Default mode: use defaults
-            specs = list(DEFAULT_TRACKED_FUNCTIONS)
+            results = map(_summarize, misses)
 
-        tracked_functions, timeout_positional = self._parse_tracked_functions(
-            specs,
-        )
+        now = time.time()
+        with db:
+            db.executemany(
+                'UPDATE summaries SET used = ? WHERE key = ?',
+                ((now, key) for key in hits),
+            )
+            for key, file_summaries in zip(misses.values(), results):
+                summaries.extend(file_summaries)
+                db.execute(
+                    'INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)',
+                    (key, json.dumps(file_summaries), now),
+                )
+            # files which were not seen in a while were removed or changed
+            db.execute(
+                'DELETE FROM summaries WHERE used < ?',
+                (now - INDEX_MAX_AGE,),
+            )
+    finally:
+        db.close()
+    return summaries
+
+
+def resolve_wrappers(
+        summaries: Iterable[tuple[str, str]],
+        tracked: Iterable[str],
+) -> list[str]:
+    # the specs of all functions passing their timeout on to a tracked
+    # function, directly or through other wrappers
+    callers: dict[str, list[str]] = {}
+    for wrapper, called in summaries:
+        callers.setdefault(called, []).append(wrapper)
+
+    wrappers = []
+    seen = set(tracked)
+    todo = list(seen)
+    while todo:
+        for wrapper in callers.get(todo.pop(), ()):
+            (module, func), _ = parse_function_spec(wrapper)
+            key = f'{module}.{func}'
+            if key not in seen:
+                seen.add(key)
+                todo.append(key)
+                wrappers.append(wrapper)
+    return sorted(wrappers)
+
+
+HUNK_RE = re.compile(r'^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@')
+# maps the real path of a file to its changed (start, end) line ranges
+ChangedLines = dict[str, list[tuple[int, int]]]
+
+
+def parse_diff(diff: str, root: str) -> ChangedLines:
+    changed: ChangedLines = {}
+    ranges = None
+    for line in diff.splitlines():
+        if line.startswith('+++ '):
+            path = line[4:].rstrip('\t')
+            if path == '/dev/null':
+                ranges = None
+            else:
+                path = os.path.realpath(os.path.join(root, path[2:]))
+                ranges = changed.setdefault(path, [])
+        elif ranges is not None:
+            match = HUNK_RE.match(line)
+            if match is None:
+                continue
+            start = int(match[1])
+            count = 1 if match[2] is None else int(match[2])
+            if count == 0:
+                # lines were only deleted between start and start + 1
+                ranges.append((start, start + 1))
+            else:
+                ranges.append((start, start + count - 1))
+
+    return changed
+
+
+def project_root() -> str:
+    # the top level of the git repository, or the current directory outside
+    # of one
+    import subprocess
+
+    try:
+        return subprocess.check_output(
+            ('git', 'rev-parse', '--show-toplevel'),
+            stderr=subprocess.DEVNULL,
+            text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return os.getcwd()
+
+
+def git_changed_lines(ref: str) -> ChangedLines:
+    import subprocess
+
+    root = subprocess.check_output(
+        ('git', 'rev-parse', '--show-toplevel'), text=True,
+    ).strip()
+    diff = subprocess.check_output(
+        (
+            'git', '-c', 'core.quotePath=false', 'diff', '-U0', '--no-color',
+            '--no-ext-diff', '--src-prefix=a/', '--dst-prefix=b/', ref, '--',
+        ),
+        cwd=root,
+        text=True,
+    )
+    return parse_diff(diff, root)
+
+
+def _overlaps(result: Result, changed: list[tuple[int, int]]) -> bool:
+    # whether the call overlaps one of the changed line ranges
+    return any(
+        start <= result.end_line and result.line <= end
+        for start, end in changed
+    )
+
+
+def read_changed_lines(filename: str) -> ChangedLines:
+    # one "path", "path:line" or "path:start-end" per line
+    changed: ChangedLines = {}
+    with open(filename) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            path, sep, lines = line.rpartition(':')
+            if not sep or not re.fullmatch(r'\d+(-\d+)?', lines):
+                path, lines = line, f'1-{sys.maxsize}'
+            start, _, end = lines.partition('-')
+            ranges = changed.setdefault(os.path.realpath(path), [])
+            ranges.append((int(start), int(end or start)))
+
+    return changed
+
+
+def _percentiles(values: list[float]) -> dict[str, float]:
+    values = sorted(values) or [0]
+    return {
+        f'p{p}': values[max(-(-p * len(values) // 100) - 1, 0)]
+        for p in (50, 90, 99)
+    } | {'max': values[-1]}
+
+
+class _RunParts:
+    # every process appends JSON lines to its own file in a directory of the
+    # run, they are merged at the end of the run by the process owning it
+    KIND = ''
+
+    def __init__(self, path: str, run: str) -> None:
+        import tempfile
+
+        self.path = path
+        self.parts = os.path.join(
+            tempfile.gettempdir(), f'flake8-timeout-{self.KIND}-{run}',
+        )
+        self._file: Any = None
+        self._pid: int | None = None
+
+    def __getstate__(self) -> dict[str, Any]:
+        return {**self.__dict__, '_file': None, '_pid': None}
+
+    def _write(self, record: Sequence[Any]) -> None:
+        if self._file is None or self._pid != os.getpid():
+            os.makedirs(self.parts, exist_ok=True)
+            part = os.path.join(self.parts, f'{os.getpid()}.jsonl')
+            # line buffered since -j workers do not flush at exit
+            self._file = open(part, 'a', buffering=1)
+            self._pid = os.getpid()
+        self._file.write(json.dumps(record))
+        self._file.write('\n')
+
+    def _read(self) -> Generator[list[Any], None, None]:
+        # streams the records of all processes and removes them afterwards
+        import shutil
+
+        if not os.path.isdir(self.parts):
+            return
+        for part in sorted(os.listdir(self.parts)):
+            with open(os.path.join(self.parts, part)) as f:
+                for line in f:
+                    yield json.loads(line)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        shutil.rmtree(self.parts)
+
+
+class Stats(_RunParts):
+    KIND = 'stats'
+    SLOWEST = 20
+
+    def record(
+            self,
+            filename: str | None,
+            elapsed: float,
+            visitor: 'Visitor | None',
+            matches: int,
+    ) -> None:
+        if visitor is not None:
+            counts = [visitor.n_nodes, visitor.n_calls, visitor.n_imports]
+        else:
+            counts = [0, 0, 0]
+        self._write([filename, elapsed, *counts, matches])
+
+    def report(self) -> None:
+        keys = ('time_s', 'nodes', 'calls', 'imports', 'matches')
+        rows = [
+            {'filename': filename, **dict(zip(keys, values))}
+            for filename, *values in self._read()
+        ]
+        import heapq
+
+        stats = {
+            'files': len(rows),
+            **{key: sum(row[key] for row in rows) for key in keys},
+            'time_ms': _percentiles([row['time_s'] * 1e3 for row in rows]),
+            'slowest': heapq.nlargest(
+                self.SLOWEST, rows, key=lambda row: row['time_s'],
+            ),
+        }
+        with open(self.path, 'w') as f:
+            json.dump(stats, f, indent=2)
+            f.write('\n')
+
+
+SARIF_RULES = (
+    ('TIM100', 'timeout missing for request call'),
+    ('TIM101', 'timeout exceeds the maximum'),
+    ('TIM200', 'request call inside a loop'),
+    ('TIM201', 'connection pool created on every call'),
+    ('TIM202', 'one-shot request call in a function called in a loop'),
+    ('TIM300', 'blocking call in an async function'),
+)
+
+
+class Report(_RunParts):
+    KIND = 'report'
+    FORMATS = ('jsonl', 'sarif')
+
+    def __init__(self, path: str, run: str, format: str) -> None:
+        super().__init__(path, run)
+        self.format = format
+
+    def write(self, filename: str | None, result: Result) -> None:
+        self._write([filename, *result])
+
+    def _records(self) -> Generator[dict[str, Any], None, None]:
+        for filename, *result in self._read():
+            yield {'filename': filename, **Result(*result).record()}
+
+    def report(self) -> None:
+        # the records are streamed so the memory does not grow with them
+        with open(self.path, 'w') as f:
+            if self.format == 'jsonl':
+                for record in self._records():
+                    f.write(json.dumps(record))
+                    f.write('\n')
+                return
+
+            sarif = {
+                '$schema': 'https://json.schemastore.org/sarif-2.1.0.json',
+                'version': '2.1.0',
+                'runs': [{
+                    'tool': {
+                        'driver': {
+                            'name': 'flake8-timeout',
+                            'version': __version__,
+                            'informationUri': (
+                                'https://github.com/jkittner/flake8-timeout'
+                            ),
+                            'rules': [
+                                {'id': code, 'shortDescription': {'text': t}}
+                                for code, t in SARIF_RULES
+                            ],
+                        },
+                    },
+                    'results': [],
+                }],
+            }
+            # everything up to the results, which are written one by one
+            head, _, tail = json.dumps(sarif, indent=2).rpartition('[]')
+            f.write(f'{head}[')
+            sep = '\n'
+            for record in self._records():
+                f.write(sep)
+                json.dump(self._sarif_result(record), f)
+                sep = ',\n'
+            f.write(f'\n]{tail}\n')
+
+    @staticmethod
+    def _sarif_result(record: dict[str, Any]) -> dict[str, Any]:
+        filename = record['filename'] or ''
+        if filename.startswith(f'.{os.sep}'):
+            filename = filename[2:]
+        location: dict[str, Any] = {
+            'physicalLocation': {
+                'artifactLocation': {
+                    'uri': filename.replace(os.sep, '/'),
+                },
+                'region': {
+                    'startLine': record['line'],
+                    'startColumn': record['col'],
+                    'endLine': record['end_line'],
+                    'endColumn': record['end_col'],
+                },
+            },
+        }
+        if record['function'] is not None:
+            location['logicalLocations'] = [{
+                'fullyQualifiedName': record['function'],
+                'kind': 'function',
+            }]
+        return {
+            'ruleId': record['code'],
+            'level': 'warning',
+            'message': {'text': record['message']},
+            'locations': [location],
+            'properties': {
+                'spec': record['spec'],
+                'status': record['status'],
+            },
+        }
+
+
+class Baseline(_RunParts):
+    # fingerprints of the known results which are not reported. They don't
+    # contain line numbers, so moving a call around keeps its fingerprint
+    KIND = 'baseline'
+    HEADER = '# flake8-timeout baseline 1\n'
+
+    def __init__(self, path: str, run: str, update: bool = False) -> None:
+        super().__init__(path, run)
+        # paths of the fingerprints are relative to the baseline, so they
+        # don't depend on the directory flake8 is run from
+        self.root = os.path.dirname(os.path.abspath(path))
+        # record the fingerprints of all results of the run instead
+        self.update = update
+        self.fingerprints = frozenset() if update else self.load(path)
+
+    @staticmethod
+    def load(path: str) -> frozenset[str]:
+        try:
+            with open(path) as f:
+                return frozenset(
+                    line.strip() for line in f
+                    if line.strip() and not line.startswith('#')
+                )
+        except FileNotFoundError:
+            raise ValueError(f'Baseline not found: {path}')
+
+    @staticmethod
+    def _call_text(result: Result, lines: list[str] | None) -> str:
+        # the source of the call without whitespace, columns are offsets of
+        # the utf-8 encoded line
+        if lines is None:
+            return ''
+        parts = [
+            line.encode() for line in lines[result.line - 1:result.end_line]
+        ]
+        if not parts:
+            return ''
+        parts[-1] = parts[-1][:result.end_col]
+        parts[0] = parts[0][result.col:]
+        return ''.join(b''.join(parts).decode(errors='replace').split())
+
+    def filter(
+            self,
+            filename: str | None,
+            results: Iterable[Result],
+            lines: list[str] | None,
+    ) -> Generator[Result, None, None]:
+        path = ''
+        if filename is not None:
+            path = os.path.relpath(
+                os.path.abspath(filename), self.root,
+            ).replace(os.sep, '/')
+        # identical calls in one function are told apart by their order
+        seen: dict[tuple[str, ...], int] = {}
+        for result in results:
+            key = (
+                path,
+                result.function or '',
+                result.spec,
+                result.msg.partition(' ')[0],
+                self._call_text(result, lines),
+            )
+            n = seen[key] = seen.get(key, 0) + 1
+            fingerprint = hashlib.blake2b(
+                '\0'.join((*key, str(n))).encode(), digest_size=8,
+            ).hexdigest()
+            if self.update:
+                self._write([fingerprint])
+            elif fingerprint not in self.fingerprints:
+                yield result
+
+    def report(self) -> None:
+        if not self.update:
+            return
+        fingerprints = sorted({fingerprint for fingerprint, in self._read()})
+        # replaced at once so a failed run keeps the previous baseline
+        tmp = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(self.HEADER)
+            for fingerprint in fingerprints:
+                f.write(f'{fingerprint}\n')
+        os.replace(tmp, self.path)
+
+
+class Coverage(_RunParts):
+    # the number of tracked calls by the kind of their timeout, every file is
+    # one record of its module and counts
+    KIND = 'coverage'
+    FORMATS = ('json', 'csv')
+    COLUMNS = ('calls', 'covered', 'coverage', *COVERAGE_KINDS)
+    # the timeout passes the check
+    COVERED = frozenset((
+        COVERAGE_LITERAL, COVERAGE_CONSTANT, COVERAGE_DYNAMIC,
+        COVERAGE_FORWARDED,
+    ))
+
+    def __init__(self, path: str, run: str, format: str) -> None:
+        super().__init__(path, run)
+        self.format = format
+
+    def record(
+            self,
+            filename: str | None,
+            counts: dict[tuple[str, str], int],
+    ) -> None:
+        if not counts:
+            return
+        module = ''
+        if filename is not None:
+            module = '.'.join(module_name(filename)[0])
+        self._write([
+            module,
+            [[spec, kind, n] for (spec, kind), n in sorted(counts.items())],
+        ])
+
+    @classmethod
+    def _row(cls, counts: dict[str, int]) -> dict[str, Any]:
+        calls = sum(counts.values())
+        covered = sum(counts.get(kind, 0) for kind in cls.COVERED)
+        return {
+            'calls': calls,
+            'covered': covered,
+            'coverage': round(covered / calls, 4) if calls else None,
+            **{kind: counts.get(kind, 0) for kind in COVERAGE_KINDS},
+        }
+
+    def report(self) -> None:
+        total: dict[str, int] = {}
+        groups: dict[str, dict[str, dict[str, int]]] = {
+            'packages': {}, 'modules': {}, 'specs': {},
+        }
+        for module, counts in self._read():
+            parts = module.split('.')
+            # a package includes its subpackages
+            names = {
+                'packages': [
+                    '.'.join(parts[:i]) for i in range(1, len(parts))
+                ],
+                'modules': [module],
+            }
+            for spec, kind, n in counts:
+                total[kind] = total.get(kind, 0) + n
+                for group, keys in (*names.items(), ('specs', [spec])):
+                    for key in keys:
+                        row = groups[group].setdefault(key, {})
+                        row[kind] = row.get(kind, 0) + n
+
+        rows = {
+            group: {key: self._row(counts[key]) for key in sorted(counts)}
+            for group, counts in groups.items()
+        }
+        # the specs with the most calls without a timeout first
+        rows['specs'] = dict(
+            sorted(
+                rows['specs'].items(),
+                key=lambda item: item[1]['covered'] - item[1]['calls'],
+            ),
+        )
+        with open(self.path, 'w', newline='') as f:
+            if self.format == 'csv':
+                import csv
+
+                writer = csv.writer(f, lineterminator='\n')
+                writer.writerow(('group', 'name', *self.COLUMNS))
+                writer.writerow(
+                    ('total', '', *self._row(total).values()),
+                )
+                for group, group_rows in rows.items():
+                    for name, row in group_rows.items():
+                        writer.writerow((group[:-1], name, *row.values()))
+            else:
+                json.dump({'total': self._row(total), **rows}, f, indent=2)
+                f.write('\n')
+
+
+class Namespace(argparse.Namespace):
+    # only annotated, argparse does not set defaults for existing attributes
+    filenames: list[str]
+    timeout_funcs: list[str]
+    timeout_extend_funcs: list[str]
+    timeout_client_funcs: list[str]
+    timeout_pool_funcs: list[str]
+    timeout_blocking_funcs: list[str]
+    timeout_presets: list[str]
+    timeout_max: float | None
+    timeout_max_connect: float | None
+    timeout_max_read: float | None
+    timeout_max_funcs: list[str]
+    timeout_settings_modules: list[str]
+    timeout_project_index: str | None
+    timeout_cache: str | None
+    timeout_cache_size: int
+    timeout_diff_ref: str | None
+    timeout_changed_lines: str | None
+    timeout_stats: str | None
+    timeout_report: str | None
+    timeout_report_format: str
+    timeout_baseline: str | None
+    timeout_baseline_update: bool
+    timeout_coverage: str | None
+    timeout_coverage_format: str
+
+
+class Plugin:
+    name = __name__
+    version = __version__
+    # compiled once per process in parse_options and shared by all instances
+    matcher = DEFAULT_MATCHER
+    cache: ResultCache | None = None
+    # only these lines are checked in incremental mode
+    changed_lines: ChangedLines | None = None
+    stats: Stats | None = None
+    report_writer: Report | None = None
+    baseline: Baseline | None = None
+    coverage: Coverage | None = None
+    # module names are resolved to find the calls of wrappers of the project
+    project = False
+
+    def __init__(
+            self,
+            tree: ast.AST | None,
+            lines: list[str] | None = None,
+            filename: str | None = None,
+    ):
+        # the standalone runner passes no tree, the file is only parsed when
+        # it is not filtered out or cached
+        self._tree = tree
+        self._lines = lines
+        self._filename = filename
+        self._visitor: Visitor | None = None
+
+    @classmethod
+    def add_options(
+            cls,
+            option_manager: 'OptionManager | _CLIOptionManager',
+    ) -> None:
+        option_manager.add_option(
+            '--timeout-funcs',
+            default=DEFAULT_TRACKED_FUNCTIONS,
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of fully qualified function names to '
+                'check for timeout. This OVERRIDES the defaults. '
+                'Format: "module.function[:index][@keyword,...]" where '
+                'index is the positional argument index for timeout and the '
+                'keywords replace "timeout" '
+                '(e.g., "foo.bar.baz,my.func:2,redis.Redis@socket_timeout"). '
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-extend-funcs',
+            default='',
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of additional fully qualified function '
+                'names to check for timeout. This EXTENDS the default list. '
+                'Format: "module.function[:index][@keyword,...]" where '
+                'index is the positional argument index for timeout and the '
+                'keywords replace "timeout" '
+                '(e.g., "foo.bar.baz,my.func:2,redis.Redis@socket_timeout").'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-client-funcs',
+            default=DEFAULT_CLIENTS,
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of fully qualified names of functions '
+                'or classes that return a client (e.g., "requests.Session"). '
+                'Names bound to their result, by assignment, "with ... as" or '
+                'an annotation, resolve to this name so their methods can be '
+                'tracked, e.g. "requests.Session.get". '
+                '(Default: %(default)s)'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-pool-funcs',
+            default=DEFAULT_POOLS,
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of fully qualified names of functions '
+                'or classes that create a connection pool. Creating one in a '
+                'loop or on every call of a function is reported (TIM201), '
+                'as are the other tracked functions of their modules in '
+                'functions called in a loop (TIM202). '
+                '(Default: %(default)s)'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-blocking-funcs',
+            default=DEFAULT_BLOCKING,
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of fully qualified names of '
+                'synchronous functions which block the event loop when they '
+                'are called in an async function (TIM300). '
+                '(Default: %(default)s)'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-presets',
+            default='',
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of presets of functions and clients to '
+                'check in addition to the ones above. '
+                f'Available: {", ".join(PRESETS)}.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-max',
+            type=float,
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Report timeouts of tracked functions which are larger than '
+                'this many seconds (TIM101). Timeouts are evaluated if they '
+                'are constant, including arithmetic like "5 * 60" and '
+                '(connect, read) tuples.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-max-connect',
+            type=float,
+            default=None,
+            parse_from_config=True,
+            help='The maximum connect timeout, overrides --timeout-max.',
+        )
+        option_manager.add_option(
+            '--timeout-max-read',
+            type=float,
+            default=None,
+            parse_from_config=True,
+            help='The maximum read timeout, overrides --timeout-max.',
+        )
+        option_manager.add_option(
+            '--timeout-max-funcs',
+            default='',
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of maximum timeouts of single tracked '
+                'functions, overriding the options above. '
+                'Format: "module.function=seconds" or '
+                '"module.function=connect/read" '
+                '(e.g., "requests.get=30,subprocess.run=600,httpx.get=5/60").'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-settings-modules',
+            default='',
+            parse_from_config=True,
+            comma_separated_list=True,
+            help=(
+                'Comma-separated list of modules containing constants, e.g. '
+                '"myproject.settings,django.conf.settings". Names imported '
+                'from them count as timeouts, their values are unknown so '
+                'they are not checked against the maximums.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-project-index',
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Summarize the functions of all files of the project before '
+                'checking the given files '
+                'and track the functions which pass their timeout on to a '
+                'tracked function, e.g. "def fetch(url, **kwargs): return '
+                'requests.get(url, **kwargs)". The summaries are stored in '
+                'this file, only changed files are summarized again.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-cache',
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Path of a file to cache the results in. Unchanged files are '
+                'not analyzed again in later runs.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-cache-size',
+            default=100_000,
+            type=int,
+            parse_from_config=True,
+            help=(
+                'Maximum number of files kept in the cache, the least '
+                'recently used are evicted. (Default: %(default)s)'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-diff-ref',
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Only report calls on lines changed since this git ref '
+                '(e.g. "origin/main" or "HEAD"), unchanged files are skipped.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-changed-lines',
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Only report calls on the lines listed in this file, one '
+                '"path", "path:line" or "path:start-end" per line.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-report',
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Write all results with the called function, the status of '
+                'the timeout (missing, none, negative, non-constant or '
+                'too-large) and the enclosing function to this path at the '
+                'end of the run. Results ignored by noqa comments are '
+                'included.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-report-format',
+            default='jsonl',
+            choices=Report.FORMATS,
+            parse_from_config=True,
+            help='Format of --timeout-report. (Default: %(default)s)',
+        )
+        option_manager.add_option(
+            '--timeout-baseline',
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Path of a file with the fingerprints of known results, '
+                'which are not reported. A fingerprint consists of the file, '
+                'the enclosing function, the called function, the code and '
+                'the source of the call, so it does not change when the call '
+                'moves to another line.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-baseline-update',
+            action='store_true',
+            help=(
+                'Write the fingerprints of all results to the '
+                '--timeout-baseline file instead of reporting them.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-coverage',
+            default=None,
+            parse_from_config=True,
+            help=(
+                'Write the number of tracked calls by the kind of their '
+                'timeout (literal, constant, dynamic, forwarded, too-large, '
+                'none, negative, non-constant or missing) in total, per '
+                'package, module and called function to this path at the end '
+                'of the run.'
+            ),
+        )
+        option_manager.add_option(
+            '--timeout-coverage-format',
+            default='json',
+            choices=Coverage.FORMATS,
+            parse_from_config=True,
+            help='Format of --timeout-coverage. (Default: %(default)s)',
+        )
+        option_manager.add_option(
+            '--timeout-stats',
+            default=os.environ.get('FLAKE8_TIMEOUT_STATS'),
+            parse_from_config=True,
+            help=(
+                'Write the time spent, the number of nodes, calls, imports '
+                'and matches of all files and the slowest files as JSON to '
+                'this path at the end of the run. Also enabled by the '
+                'FLAKE8_TIMEOUT_STATS environment variable.'
+            ),
+        )
+
+    @classmethod
+    def parse_options(cls, options: Namespace) -> None:
+        if options.timeout_extend_funcs:
+            # Validate the overriding specs even though they are unused
+            for spec in join_keyword_specs(options.timeout_funcs):
+                parse_function_spec(spec)
+            # Extension mode: use defaults + extensions
+            specs = [*DEFAULT_TRACKED_FUNCTIONS, *options.timeout_extend_funcs]
+        else:
+            # Override mode or default mode
+            specs = options.timeout_funcs
+
+        presets = resolve_presets(options.timeout_presets)
+        specs = [*specs, *presets.funcs]
+        clients = [*options.timeout_client_funcs, *presets.clients]
+        limit = (
+            options.timeout_max_connect
+            if options.timeout_max_connect is not None else
+            options.timeout_max,
+            options.timeout_max_read
+            if options.timeout_max_read is not None else
+            options.timeout_max,
+        )
+        cls.matcher = Matcher.compile(
+            specs,
+            clients,
+            limit,
+            options.timeout_max_funcs,
+            options.timeout_settings_modules,
+            pools=options.timeout_pool_funcs,
+            blocking=options.timeout_blocking_funcs,
+        )
+
+        cls.project = bool(options.timeout_project_index)
+        if options.timeout_project_index:
+            # the wrappers can be defined anywhere in the project, not only
+            # in the files which are checked, e.g. by a pre-commit hook
+            filenames = _expand_paths(
+                [os.path.relpath(project_root())],
+                [
+                    *getattr(options, 'exclude', DEFAULT_EXCLUDE),
+                    *getattr(options, 'extend_exclude', ()),
+                ],
+            )
+            summaries = load_summaries(
+                options.timeout_project_index,
+                filenames,
+                cls.matcher,
+                _n_jobs(getattr(options, 'jobs', 1)),
+            )
+            wrappers = resolve_wrappers(summaries, cls.matcher.tracked())
+            if wrappers:
+                cls.matcher = Matcher.compile(
+                    specs,
+                    clients,
+                    limit,
+                    options.timeout_max_funcs,
+                    options.timeout_settings_modules,
+                    wrappers,
+                    options.timeout_pool_funcs,
+                    options.timeout_blocking_funcs,
+                )
+
+        atexit.unregister(cls.report)
+        cls.cache = cls.stats = cls.report_writer = cls.baseline = None
+        cls.coverage = None
+        if (
+                options.timeout_cache or
+                options.timeout_stats or
+                options.timeout_report or
+                options.timeout_baseline or
+                options.timeout_coverage
+        ):
+            run, owner = _start_run()
+            if options.timeout_cache:
+                cls.cache = ResultCache(
+                    options.timeout_cache,
+                    options.timeout_cache_size,
+                    cls.matcher.fingerprint,
+                    run,
+                )
+            if options.timeout_stats:
+                cls.stats = Stats(options.timeout_stats, run)
+            if options.timeout_report:
+                cls.report_writer = Report(
+                    options.timeout_report,
+                    run,
+                    options.timeout_report_format,
+                )
+            if options.timeout_baseline:
+                cls.baseline = Baseline(
+                    options.timeout_baseline,
+                    run,
+                    options.timeout_baseline_update,
+                )
+            if options.timeout_coverage:
+                cls.coverage = Coverage(
+                    options.timeout_coverage,
+                    run,
+                    options.timeout_coverage_format,
+                )
+            if owner:
+                atexit.register(cls.report)
+
+        if options.timeout_diff_ref:
+            cls.changed_lines = git_changed_lines(options.timeout_diff_ref)
+        elif options.timeout_changed_lines:
+            cls.changed_lines = read_changed_lines(
+                options.timeout_changed_lines,
+            )
+        else:
+            cls.changed_lines = None
+
+    @classmethod
+    def report(cls) -> None:
+        # called once at the end of the run by the process owning it
+        if cls.cache is not None:
+            cls.cache.report()
+        if cls.stats is not None:
+            cls.stats.report()
+        if cls.report_writer is not None:
+            cls.report_writer.report()
+        if cls.baseline is not None:
+            cls.baseline.report()
+        if cls.coverage is not None:
+            cls.coverage.report()
+
+    def run(self) -> Generator[tuple[int, int, str, type[Any]], None, None]:
+        if self.stats is None:
+            yield from self._run()
+            return
+
+        start = time.perf_counter()
+        matches = 0
+        for result in self._run():
+            matches += 1
+            yield result
+        self.stats.record(
+            self._filename,
+            time.perf_counter() - start,
+            self._visitor,
+            matches,
+        )
+
+    def _run(self) -> Generator[tuple[int, int, str, type[Any]], None, None]:
+        changed = None
+        if self.changed_lines is not None and self._filename is not None:
+            changed = self.changed_lines.get(os.path.realpath(self._filename))
+            if changed is None:
+                return
+
+        if (
+                self._lines is not None and
+                not self.matcher.prefilter.search(''.join(self._lines))
+        ):
+            return
+
+        module = package = None
+        if self.project and self._filename is not None:
+            module, package = module_name(self._filename)
+
+        results: Iterable[Result]
+        if (
+                self.cache is not None and
+                self._lines is not None and
+                # only the results are cached, not the calls which pass
+                self.coverage is None
+        ):
+            # the functions defined in the file depend on its module name
+            key = self.cache.key(self._lines, '.'.join(module or ()))
+            cached = self.cache.get(key)
+            if cached is None:
+                cached = list(self._results(module, package))
+                self.cache.put(key, cached)
+            results = cached
+        else:
+            results = self._results(module, package)
+        if self.baseline is not None:
+            results = self.baseline.filter(
+                self._filename, results, self._lines,
+            )
+
+        for result in results:
+            # imports are resolved in the whole file but only calls which
+            # overlap a changed hunk are reported
+            if changed is None or _overlaps(result, changed):
+                if self.report_writer is not None:
+                    self.report_writer.write(self._filename, result)
+                yield result.line, result.col, result.msg, type(self)
+
+    def _results(
+            self,
+            module: tuple[str, ...] | None = None,
+            package: tuple[str, ...] | None = None,
+    ) -> Generator[Result, None, None]:
+        if self._tree is None:
+            assert self._lines is not None
+            self._tree = ast.parse(''.join(self._lines))
+
+        self._visitor = Visitor(self.matcher, module, package)
+        if self.coverage is not None:
+            self._visitor.coverage = {}
+        for v in self._visitor.visit(self._tree):
+            yield Result.from_violation(v)
+        if self.coverage is not None and self._visitor.coverage is not None:
+            self.coverage.record(self._filename, self._visitor.coverage)
+
+
+DEFAULT_EXCLUDE = (
+    '.svn', 'CVS', '.bzr', '.hg', '.git', '__pycache__', '.tox', '.nox',
+    '.eggs', '*.egg',
+)
+CONFIG_FILES = ('setup.cfg', 'tox.ini', '.flake8')
+# the codes flake8 ignores unless --ignore is given
+DEFAULT_IGNORE = (
+    'E121', 'E123', 'E126', 'E226', 'E24', 'E704', 'W503', 'W504',
+)
+# the codes this plugin reports and E902 for the files which can't be read
+DEFAULT_SELECT = ('E', 'TIM')
+# the same as flake8's
+NOQA_RE = re.compile(
+    r'# noqa'
+    r'(?::[\s]?(?P<codes>([A-Z]+[0-9]+(?:[,\s]+)?)+))?',
+    re.IGNORECASE,
+)
+
+
+def _parse_list(value: str) -> list[str]:
+    # the same as flake8's comma separated lists
+    return [item for item in re.split(r'[,\s]', value) if item]
+
+
+def _parse_per_file_ignores(value: str) -> list[tuple[str, list[str]]]:
+    # the same as flake8's per-file-ignores, e.g. "tests/*:TIM100,TIM200" or
+    # "a.py b.py: TIM" on one or more lines
+    ret: list[tuple[str, list[str]]] = []
+    filenames: list[str] = []
+    codes: list[str] = []
+    colon = False
+    for token in re.findall(r':|[^\s,:]+', value):
+        if token == ':':
+            colon = True
+        elif colon and re.fullmatch(r'[A-Z]+[0-9]*', token):
+            codes.append(token)
+        else:
+            if codes:
+                ret.extend((filename, codes) for filename in filenames)
+                filenames, codes = [], []
+            colon = False
+            filenames.append(token)
+    if codes:
+        ret.extend((filename, codes) for filename in filenames)
+    return ret
+
+
+def _prefix(code: str, prefixes: Sequence[str]) -> int:
+    # the length of the longest of the prefixes the code starts with
+    return max((len(p) for p in prefixes if code.startswith(p)), default=-1)
+
+
+class _Decider:
+    # flake8's decision whether a code is reported by --select, --ignore,
+    # their --extend- variants and --per-file-ignores
+    def __init__(
+            self,
+            select: Sequence[str] | None,
+            extend_select: Sequence[str],
+            ignore: Sequence[str] | None,
+            extend_ignore: Sequence[str],
+            per_file_ignores: Sequence[tuple[str, list[str]]],
+    ) -> None:
+        self.explicit_select = (*(select or ()), *extend_select)
+        self.select = (
+            self.explicit_select if select is not None else
+            (*DEFAULT_SELECT, *extend_select)
+        )
+        self.explicit_ignore = (*(ignore or ()), *extend_ignore)
+        self.ignore = (
+            self.explicit_ignore if ignore is not None else
+            (*DEFAULT_IGNORE, *extend_ignore)
+        )
+        self.per_file_ignores = per_file_ignores
+
+    def _file_ignores(self, filename: str) -> list[str]:
+        # only the codes of the longest matching pattern are ignored
+        matching = [
+            (len(pattern), codes)
+            for pattern, codes in self.per_file_ignores
+            if _excluded(filename, (pattern,))
+        ]
+        return max(matching, key=operator.itemgetter(0))[1] if matching else []
+
+    def reported(self, code: str, filename: str) -> bool:
+        file_ignores = self._file_ignores(filename)
+        explicit_ignore = (*self.explicit_ignore, *file_ignores)
+        select = _prefix(code, self.select)
+        ignore = _prefix(code, (*self.ignore, *file_ignores))
+        if ignore < 0:
+            return select >= 0
+        elif select < 0:
+            return False
+
+        explicitly_selected = _prefix(code, self.explicit_select) >= 0
+        explicitly_ignored = _prefix(code, explicit_ignore) >= 0
+        if explicitly_selected != explicitly_ignored:
+            return explicitly_selected
+        # selected and ignored the same way, the longest prefix wins
+        return select > ignore
+
+
+class _CLIOptionManager:
+    # provides the part of flake8's OptionManager used by Plugin.add_options
+    def __init__(self, parser: argparse.ArgumentParser) -> None:
+        self.parser = parser
+        self.config_options: dict[str, argparse.Action] = {}
+
+    def add_option(
+            self,
+            *args: str,
+            parse_from_config: bool = False,
+            comma_separated_list: bool = False,
+            **kwargs: Any,
+    ) -> None:
+        if comma_separated_list:
+            kwargs['type'] = _parse_list
+        action = self.parser.add_argument(*args, **kwargs)
+        if parse_from_config:
+            self.config_options[action.dest] = action
+
+    def load_config(self, filename: str | None) -> None:
+        if filename is None:
+            filename = _find_config()
+            if filename is None:
+                return
+
+        import configparser
+
+        cfg = configparser.RawConfigParser()
+        cfg.read(filename, encoding='UTF-8')
+        if not cfg.has_section('flake8'):
+            return
+
+        defaults = {}
+        for key, value in cfg.items('flake8'):
+            action = self.config_options.get(key.replace('-', '_'))
+            if action is not None:
+                defaults[action.dest] = (
+                    action.type(value) if callable(action.type) else value
+                )
+        self.parser.set_defaults(**defaults)
+
+
+def _find_config() -> str | None:
+    # like flake8, use the first file with a [flake8] section found in the
+    # current directory or any of its parents
+    import configparser
+
+    path = os.path.abspath('.')
+    while True:
+        for name in CONFIG_FILES:
+            filename = os.path.join(path, name)
+            cfg = configparser.RawConfigParser()
+            try:
+                cfg.read(filename, encoding='UTF-8')
+            except (UnicodeDecodeError, configparser.ParsingError):
+                continue
+            if cfg.has_section('flake8'):
+                return filename
+
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def _excluded(path: str, exclude: Sequence[str]) -> bool:
+    import fnmatch
+
+    basename = os.path.basename(path)
+    absolute = os.path.abspath(path)
+    return any(
+        fnmatch.fnmatch(basename, pattern) or
+        fnmatch.fnmatch(absolute, os.path.abspath(pattern))
+        for pattern in exclude
+    )
+
+
+def _expand_paths(
+        paths: Sequence[str],
+        exclude: Sequence[str],
+) -> Generator[str, None, None]:
+    for path in paths:
+        if not os.path.isdir(path):
+            # explicitly passed files are always checked
+            yield path
+            continue
+
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(
+                d for d in dirs
+                if not _excluded(os.path.join(root, d), exclude)
+            )
+            for filename in sorted(files):
+                filename = os.path.join(root, filename)
+                if (
+                        filename.endswith('.py') and
+                        not _excluded(filename, exclude)
+                ):
+                    yield filename
+
+
+def _n_jobs(jobs: Any) -> int:
+    # flake8 passes its JobsArgument, the standalone command an int
+    if getattr(jobs, 'is_auto', False):
+        return os.cpu_count() or 1
+    return max(int(getattr(jobs, 'n_jobs', jobs)), 1)
+
+
+def _init_worker(
+        matcher: Matcher,
+        cache: ResultCache | None,
+        changed_lines: ChangedLines | None,
+        stats: Stats | None,
+        report_writer: Report | None,
+        baseline: Baseline | None,
+        coverage: Coverage | None,
+        project: bool,
+) -> None:
+    # the compiled configuration is sent to every worker only once
+    Plugin.matcher = matcher
+    Plugin.cache = cache
+    # sent along since workers which are not forked don't inherit it
+    Plugin.changed_lines = changed_lines
+    Plugin.stats = stats
+    Plugin.report_writer = report_writer
+    Plugin.baseline = baseline
+    Plugin.coverage = coverage
+    Plugin.project = project
+
+
+_T = TypeVar('_T')
+
+
+def _map_files(
+        func: Callable[[str], _T],
+        filenames: list[str],
+        jobs: int,
+) -> Generator[_T, None, None]:
+    # the results of func for the files as soon as they are done, by -j
+    # workers configured like this process
+    jobs = max(min(jobs, len(filenames)), 1)
+    if jobs == 1:
+        yield from map(func, filenames)
+        return
+
+    import multiprocessing
+
+    pool = multiprocessing.Pool(
+        jobs,
+        _init_worker,
+        initargs=(
+            Plugin.matcher,
+            Plugin.cache,
+            Plugin.changed_lines,
+            Plugin.stats,
+            Plugin.report_writer,
+            Plugin.baseline,
+            Plugin.coverage,
+            Plugin.project,
+        ),
+    )
+    chunksize = min(max(len(filenames) // (jobs * 4), 1), 64)
+    try:
+        yield from pool.imap_unordered(func, filenames, chunksize)
+    except BaseException:
+        pool.terminate()
+        pool.join()
+        raise
+    # the workers flush the counts of the cache when they exit
+    pool.close()
+    pool.join()
+
+
+def _check_file(
+        filename: str,
+        decider: _Decider | None = None,
+) -> tuple[str, list[tuple[int, int, str]]]:
+    import tokenize
+
+    try:
+        with tokenize.open(filename) as f:
+            lines = f.readlines()
+        plugin = Plugin(None, lines, filename)
+        results = sorted(result[:3] for result in plugin.run())
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+        lines = []
+        results = [(1, 0, f'E902 {type(e).__name__}: {e}')]
+
+    if decider is not None:
+        results = [
+            result for result in results
+            if decider.reported(result[2].split(maxsplit=1)[0], filename)
+        ]
+    if results and lines:
+        noqa_lines = _noqa_lines(lines)
+        results = [
+            result for result in results
+            if not _noqa(result[2], noqa_lines.get(result[0], ''))
+        ]
+    return filename, results
+
+
+def _noqa_lines(lines: list[str]) -> dict[int, str]:
+    # like flake8, a noqa comment applies to all the lines of a token spread
+    # over several lines, e.g. a multi-line string argument of a call
+    import tokenize
+
+    ret = {}
+    start, end = len(lines) + 2, -1
+    for token in tokenize.generate_tokens(iter(lines).__next__):
+        if token.type in {tokenize.ENDMARKER, tokenize.DEDENT}:
+            continue
+
+        start = min(start, token.start[0])
+        end = max(end, token.end[0])
+        if token.type in {tokenize.NL, tokenize.NEWLINE}:
+            joined = ''.join(lines[start - 1:end])
+            ret.update(dict.fromkeys(range(start, end + 1), joined))
+            start, end = len(lines) + 2, -1
+    return ret
+
+
+def _noqa(msg: str, line: str) -> bool:
+    match = NOQA_RE.search(line)
+    if match is None:
+        return False
+    elif match['codes'] is None:
+        return True
+
+    code = msg.split(maxsplit=1)[0]
+    return code.startswith(tuple(_parse_list(match['codes'])))
+
+
+def _insertion(
+        tokens: 'list[tokenize.TokenInfo]',
+        close: int,
+        lines: list[str],
+        positional: int | None,
+        keyword: str,
+        value: str,
+) -> tuple[tuple[int, int], str] | None:
+    # the position and the text which adds the timeout to the call closed by
+    # tokens[close], None if it cannot be added safely
+    import tokenize
+
+    non_code = {
+        tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT,
+        tokenize.DEDENT,
+    }
+    depth = 0
+    start = close
+    while True:
+        start -= 1
+        token = tokens[start]
+        if token.type != tokenize.OP:
+            continue
+        elif token.string in {')', ']', '}'}:
+            depth += 1
+        elif token.string in {'(', '[', '{'}:
+            if depth == 0:
+                break
+            depth -= 1
+
+    args: list[list[tokenize.TokenInfo]] = [[]]
+    last = tokens[start]
+    for token in tokens[start + 1:close]:
+        if token.type in non_code:
+            continue
+        last = token
+        if token.type == tokenize.OP:
+            if depth == 0 and token.string == ',':
+                args.append([])
+                continue
+            elif token.string in {'(', '[', '{'}:
+                depth += 1
+            elif token.string in {')', ']', '}'}:
+                depth -= 1
+        elif depth == 0 and token.string == 'for':
+            # the only argument is a generator expression
+            return None
+        args[-1].append(token)
+
+    n_positional = 0
+    keywords = False
+    for arg in args:
+        if not arg:
+            continue
+        elif arg[0].string == '**':
+            # it may contain a timeout already
+            return None
+        elif arg[0].string == '*' or arg[1:2] and arg[1].string == '=':
+            keywords = True
+        else:
+            n_positional += 1
+    if n_positional == positional and not keywords:
+        text = value
+    else:
+        text = f'{keyword}={value}'
+
+    if last is tokens[start]:
+        return last.end, text
+    elif last.string != ',':
+        return last.end, f', {text}'
+    elif last.end[0] == tokens[close].start[0]:
+        return last.end, f' {text}'
+    # a trailing comma before a closing paren on its own line, the timeout
+    # is added on a new line below the last argument
+    first = next(arg for arg in reversed(args) if arg)[0]
+    line = lines[first.start[0] - 1]
+    indent = line[:len(line) - len(line.lstrip())]
+    comma_line = lines[last.end[0] - 1]
+    newline = comma_line[len(comma_line.rstrip('\r\n')):] or '\n'
+    return (last.end[0] + 1, 0), f'{indent}{text},{newline}'
+
+
+def fix_source(
+        source: str,
+        results: Iterable[Result],
+        matcher: Matcher,
+        value: str,
+) -> tuple[str, int, list[Result]]:
+    # adds the first timeout keyword of the spec, e.g. timeout=value, to the
+    # calls of the results without a timeout, returns the fixed source, the
+    # number of calls fixed and the results of the calls which are not. Only
+    # tokens are inserted, the rest of the source is unchanged
+    import io
+    import tokenize
+
+    lines = io.StringIO(source).readlines()
+    tokens = list(tokenize.generate_tokens(io.StringIO(source).readline))
+    closing = {
+        token.start: index for index, token in enumerate(tokens)
+        if token.type == tokenize.OP and token.string == ')'
+    }
+
+    edits = []
+    unfixed = []
+    for result in results:
+        if result.msg != MSG:
+            continue
+        elif result.status != STATUS_MISSING:
+            # an explicit None or a timeout which isn't constant is kept
+            unfixed.append(result)
+            continue
+        spec = matcher.lookup(result.spec.split('.'))
+        # the column after the call is an offset of the utf-8 encoded line
+        line = lines[result.end_line - 1]
+        col = len(line.encode()[:result.end_col].decode()) - 1
+        close = closing.get((result.end_line, col))
+        edit = None
+        if spec is not None and close is not None:
+            edit = _insertion(
+                tokens,
+                close,
+                lines,
+                spec.positional,
+                spec.keywords[0],
+                value,
+            )
+        if edit is None:
+            unfixed.append(result)
+        else:
+            edits.append(edit)
+
+    # from the end, so the positions of the other edits stay the same
+    for (row, col), text in sorted(edits, reverse=True):
+        lines[row - 1] = f'{lines[row - 1][:col]}{text}{lines[row - 1][col:]}'
+    fixed = ''.join(lines)
+    if edits:
+        try:
+            ast.parse(fixed)
+        except SyntaxError as e:
+            raise ValueError(f'the fixed source does not parse: {e}')
+    return fixed, len(edits), unfixed
+
+
+class _Fix(NamedTuple):
+    filename: str
+    n_fixed: int
+    diff: str
+    # the calls without a timeout which are not fixed, or the error
+    unfixed: list[tuple[int, int, str]]
+
+
+def _fix_file(filename: str, value: str, write: bool) -> _Fix:
+    import io
+    import shutil
+    import tempfile
+    import tokenize
+
+    try:
+        with open(filename, 'rb') as f:
+            data = f.read()
+        encoding, _ = tokenize.detect_encoding(io.BytesIO(data).readline)
+        source = data.decode(encoding)
+        if not Plugin.matcher.prefilter.search(source):
+            return _Fix(filename, 0, '', [])
+
+        module = package = None
+        if Plugin.project:
+            module, package = module_name(filename)
+        lines = io.StringIO(source).readlines()
+        plugin = Plugin(None, lines, filename)
+        results = list(plugin._results(module, package))
+        if Plugin.changed_lines is not None:
+            changed = Plugin.changed_lines.get(os.path.realpath(filename), [])
+            results = [
+                result for result in results if _overlaps(result, changed)
+            ]
+        fixed, n_fixed, unfixed = fix_source(
+            source, results, Plugin.matcher, value,
+        )
+        diff = ''
+        if fixed == source:
+            pass
+        elif write:
+            # replaced at once, an interrupted run never leaves a partial file
+            fd, tmp = tempfile.mkstemp(
+                suffix='.tmp', prefix='.', dir=os.path.dirname(filename),
+            )
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(fixed.encode(encoding))
+                shutil.copymode(filename, tmp)
+                os.replace(tmp, filename)
+            except BaseException:
+                os.remove(tmp)
+                raise
+        else:
+            import difflib
+
+            diff = ''.join(
+                difflib.unified_diff(
+                    io.StringIO(source).readlines(),
+                    io.StringIO(fixed).readlines(),
+                    f'a/{filename}',
+                    f'b/{filename}',
+                ),
+            )
+    except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+        return _Fix(filename, 0, '', [(1, 0, f'E902 {type(e).__name__}: {e}')])
+    else:
+        return _Fix(
+            filename,
+            n_fixed,
+            diff,
+            [(result.line, result.col, result.msg) for result in unfixed],
+        )
+
+
+def _fix_files(
+        filenames: list[str],
+        jobs: int,
+        value: str,
+        write: bool,
+) -> int:
+    import functools
+
+    fix_file = functools.partial(_fix_file, value=value, write=write)
+    ret = 0
+    n_fixed = n_files = 0
+    for fix in _map_files(fix_file, filenames, jobs):
+        if fix.n_fixed:
+            n_fixed += fix.n_fixed
+            n_files += 1
+            if not write:
+                # like a check, --diff fails if there is anything to fix
+                ret = 1
+        sys.stdout.write(fix.diff)
+        for line, col, msg in fix.unfixed:
+            print(f'{fix.filename}:{line}:{col + 1}: {msg}', flush=True)
+            ret = 1
+
+    action = 'Fixed' if write else 'Would fix'
+    print(
+        f'{action} {n_fixed} call(s) in {n_files} file(s)', file=sys.stderr,
+    )
+    return ret
+
+
+class _Statement(NamedTuple):
+    # the results of top level statements with lines relative to their start
+    # and what they add to the module for the statements after them
+    text: str
+    # number of chunks of split_statements the statements span
+    chunks: int
+    results: list[Result]
+    one_shot_calls: dict[str, list[Result]]
+    called_in_loop: set[str]
+    names: dict[str, tuple[str, ...] | Const | None]
+    # the calls checked again with the names of the whole module
+    deferred: list[tuple[ast.Call, Spec, Scope]]
+
+
+# lines which continue the statement before them even though they are not
+# indented
+_CLAUSE_RE = re.compile(r'(?:else|elif|except|finally)\b')
+_DEFINITION_RE = re.compile(r'(?:async\s+)?(?:def|class)\b')
+
+
+def split_statements(lines: list[str]) -> list[tuple[int, str]]:
+    # the source of the top level statements (and the comments after them)
+    # with their first line, found without parsing: each line which isn't
+    # indented starts one. A wrong guess, e.g. in a multi-line string, leaves
+    # the statement before it incomplete, which does not parse
+    chunks: list[tuple[int, list[str]]] = []
+    decorators = False
+    for lineno, line in enumerate(lines, start=1):
+        if not chunks and line.lstrip()[:1] in {'', '#'}:
+            # nothing to parse before the first statement
+            continue
+        elif (
+                not chunks or
+                not decorators and
+                line[:1] not in ' \t\r\n#)]}' and
+                not _CLAUSE_RE.match(line)
+        ):
+            chunks.append((lineno, [line]))
+            decorators = line.startswith('@')
+        else:
+            chunks[-1][1].append(line)
+            if decorators and _DEFINITION_RE.match(line):
+                decorators = False
+    return [(lineno, ''.join(chunk)) for lineno, chunk in chunks]
+
+
+class Server:
+    # checks buffers of an editor with the options parsed once. The results
+    # of each top level statement are kept per document and reused while its
+    # source and the names bound by the statements before it don't change,
+    # only the other statements are parsed and analyzed
+    def __init__(self, matcher: Matcher, project: bool = False) -> None:
+        self.matcher = matcher
+        self.project = project
+        self.documents: dict[str, dict[tuple[Any, ...], _Statement]] = {}
+        # instrumentation, the number of statements analyzed again
+        self.n_analyzed = 0
+
+    def check(self, filename: str, source: str) -> list[Result]:
+        import io
+
+        if not self.matcher.prefilter.search(source):
+            self.documents.pop(filename, None)
+            return []
+
+        module = package = None
+        if self.project:
+            module, package = module_name(filename)
+        visitor = Visitor(self.matcher, module, package)
+        names = visitor.module_scope.names
+        previous = self.documents.get(filename, {})
+        statements: dict[tuple[Any, ...], _Statement] = {}
+        results: list[Result] = []
+        one_shot_calls: dict[str, list[Result]] = {}
+        called_in_loop: set[str] = set()
+        deferred: list[tuple[int, list[tuple[ast.Call, Spec, Scope]]]] = []
+        chunks = split_statements(io.StringIO(source).readlines())
+        index = 0
+        while index < len(chunks):
+            start, text = chunks[index]
+            key = (text, tuple(names.items()))
+            statement = previous.get(key) or statements.get(key)
+            if statement is not None and statement.chunks > 1:
+                end = index + statement.chunks
+                if ''.join(c for _, c in chunks[index:end]) != statement.text:
+                    statement = None
+            if statement is None:
+                end = index + 1
+                while True:
+                    try:
+                        tree = ast.parse(text, filename)
+                    except SyntaxError:
+                        if end == len(chunks):
+                            # raises the error with the right location
+                            ast.parse(source, filename)
+                            raise
+                        text += chunks[end][1]
+                        end += 1
+                    else:
+                        break
+                statement = self._analyze(visitor, tree, text, end - index)
+            else:
+                names.clear()
+                names.update(statement.names)
+            statements[key] = statement
+            index += statement.chunks
+
+            offset = start - 1
+            results.extend(r.shift(offset) for r in statement.results)
+            for name, calls in statement.one_shot_calls.items():
+                one_shot_calls.setdefault(name, []).extend(
+                    r.shift(offset) for r in calls
+                )
+            called_in_loop.update(statement.called_in_loop)
+            if statement.deferred:
+                deferred.append((offset, statement.deferred))
+        self.documents[filename] = statements
+
+        for offset, deferred_calls in deferred:
+            for _, _, scope in deferred_calls:
+                # the scopes of a statement analyzed by an earlier check
+                # belong to the module scope of that check
+                while (
+                        scope.parent is not None and
+                        scope.parent.parent is not None
+                ):
+                    scope = scope.parent
+                scope.parent = visitor.module_scope
+            visitor.deferred = deferred_calls
+            results.extend(
+                Result.from_violation(v).shift(offset)
+                for v in visitor.recheck()
+            )
+
+        for name in called_in_loop.intersection(one_shot_calls):
+            results.extend(one_shot_calls[name])
+        results.sort()
+        return results
+
+    def _analyze(
+            self,
+            visitor: Visitor,
+            tree: ast.Module,
+            text: str,
+            chunks: int,
+    ) -> _Statement:
+        self.n_analyzed += 1
+        visitor.one_shot_calls = {}
+        visitor.called_in_loop = set()
+        visitor.deferred = []
+        results = [Result.from_violation(v) for v in visitor.walk(tree)]
+        return _Statement(
+            text,
+            chunks,
+            results,
+            {
+                name: [Result.from_violation(v) for v in calls]
+                for name, calls in visitor.one_shot_calls.items()
+            },
+            visitor.called_in_loop,
+            dict(visitor.module_scope.names),
+            visitor.deferred,
+        )
+
+    def handle(self, request: Any) -> dict[str, Any] | None:
+        if not isinstance(request, dict):
+            raise TypeError(
+                f'expected an object, got {type(request).__name__}',
+            )
+        import tokenize
+
+        method = request.get('method', 'check')
+        response: dict[str, Any] = {'id': request.get('id')}
+        if method == 'check':
+            filename = request['filename']
+            if not isinstance(filename, str):
+                # an int would be opened as a file descriptor
+                raise TypeError('filename must be a string')
+            t0 = time.perf_counter()
+            try:
+                source = request.get('source')
+                if source is None:
+                    with tokenize.open(filename) as f:
+                        source = f.read()
+                results = self.check(filename, source)
+            except (OSError, SyntaxError, UnicodeDecodeError, ValueError) as e:
+                response['error'] = f'{type(e).__name__}: {e}'
+            else:
+                response['results'] = [r.record() for r in results]
+            response['time_ms'] = (time.perf_counter() - t0) * 1e3
+        elif method == 'close':
+            self.documents.pop(request['filename'], None)
+        elif method == 'shutdown':
+            return None
+        else:
+            response['error'] = f'Unknown method: {method!r}'
+        return response
+
+
+def serve(stdin: IO[str], stdout: IO[str]) -> int:
+    # one JSON request per line, each is answered by one JSON line with the
+    # same id until a shutdown request or the end of the input
+    server = Server(Plugin.matcher, Plugin.project)
+    for line in stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            response = server.handle(request)
+        except (KeyError, TypeError, ValueError) as e:
+            response = {'id': None, 'error': f'Invalid request: {e}'}
+        if response is None:
+            break
+        stdout.write(json.dumps(response))
+        stdout.write('\n')
+        stdout.flush()
+    return 0
+
+
+def main(argv: Sequence[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog='flake8-timeout',
+        description=(
+            'Check for missing timeouts in network calls without running '
+            'flake8. Reads the [flake8] section of the flake8 config files.'
+        ),
+    )
+    parser.add_argument('filenames', nargs='*', default=['.'])
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='Number of processes used to check the files.',
+    )
+    parser.add_argument(
+        '--config', help='Path to the config file, instead of searching one.',
+    )
+    parser.add_argument(
+        '--serve',
+        action='store_true',
+        help=(
+            'Keep running and check the files or buffers sent as JSON '
+            'lines on stdin, e.g. by an editor.'
+        ),
+    )
+    parser.add_argument(
+        '--fix',
+        action='store_true',
+        help=(
+            'Add the --timeout-fix-value timeout to the calls without one '
+            'instead of reporting them.'
+        ),
+    )
+    parser.add_argument(
+        '--diff',
+        action='store_true',
+        help=(
+            'Print the fixes as a diff instead of writing them, exits 1 if '
+            'there are any.'
+        ),
+    )
+    option_manager = _CLIOptionManager(parser)
+    option_manager.add_option(
+        '--exclude',
+        default=','.join(DEFAULT_EXCLUDE),
+        parse_from_config=True,
+        comma_separated_list=True,
+        help='Comma-separated list of files or directories to exclude.',
+    )
+    option_manager.add_option(
+        '--extend-exclude',
+        default='',
+        parse_from_config=True,
+        comma_separated_list=True,
+        help=(
+            'Comma-separated list of additional files or directories to '
+            'exclude.'
+        ),
+    )
+    option_manager.add_option(
+        '--timeout-fix-value',
+        default='',
+        parse_from_config=True,
+        help=(
+            'The timeout added by --fix, a number or an expression like the '
+            'name of a constant, e.g. DEFAULT_TIMEOUT.'
+        ),
+    )
+    option_manager.add_option(
+        '--select',
+        parse_from_config=True,
+        comma_separated_list=True,
+        help='Comma-separated list of error codes to report, like flake8.',
+    )
+    option_manager.add_option(
+        '--extend-select',
+        default='',
+        parse_from_config=True,
+        comma_separated_list=True,
+        help='Comma-separated list of error codes to report additionally.',
+    )
+    option_manager.add_option(
+        '--ignore',
+        parse_from_config=True,
+        comma_separated_list=True,
+        help='Comma-separated list of error codes to ignore, like flake8.',
+    )
+    option_manager.add_option(
+        '--extend-ignore',
+        default='',
+        parse_from_config=True,
+        comma_separated_list=True,
+        help='Comma-separated list of error codes to ignore additionally.',
+    )
+    option_manager.add_option(
+        '--per-file-ignores',
+        default='',
+        parse_from_config=True,
+        type=_parse_per_file_ignores,
+        help=(
+            'Error codes to ignore in the files matching a pattern, e.g. '
+            '"tests/*:TIM100,TIM200", like flake8.'
+        ),
+    )
+    Plugin.add_options(option_manager)
+    # only the --config option is needed to find the configuration
+    pre_args, _ = parser.parse_known_args(argv)
+    option_manager.load_config(pre_args.config)
+    args = parser.parse_args(argv, namespace=Namespace())
+
+    try:
+        Plugin.parse_options(args)
+    except ValueError as e:
+        parser.error(str(e))
+    fix = args.fix or args.diff
+    if fix and not args.timeout_fix_value:
+        parser.error('--fix and --diff need a --timeout-fix-value')
+    elif fix:
+        try:
+            ast.parse(args.timeout_fix_value, mode='eval')
+        except SyntaxError:
+            parser.error(
+                f'--timeout-fix-value is not an expression: '
+                f'{args.timeout_fix_value!r}',
+            )
+    if args.serve:
+        return serve(sys.stdin, sys.stdout)
+
+    filenames = list(
+        _expand_paths(args.filenames, [*args.exclude, *args.extend_exclude]),
+    )
+    if Plugin.changed_lines is not None:
+        # the cost is proportional to the diff, not the size of the project
+        filenames = [
+            filename for filename in filenames
+            if os.path.realpath(filename) in Plugin.changed_lines
+        ]
+    if fix:
+        return _fix_files(
+            filenames, args.jobs, args.timeout_fix_value, not args.diff,
+        )
+
+    import functools
+
+    decider = _Decider(
+        args.select,
+        args.extend_select,
+        args.ignore,
+        args.extend_ignore,
+        args.per_file_ignores,
+    )
+    check_file = functools.partial(_check_file, decider=decider)
+    ret = 0
+    # results are streamed as soon as a file has been checked
+    results = _map_files(check_file, filenames, args.jobs)
+    for filename, file_results in results:
+        for line, col, msg in file_results:
+            print(f'{filename}:{line}:{col + 1}: {msg}', flush=True)
+            ret = 1
+
+    atexit.unregister(Plugin.report)
+    Plugin.report()
 
-        visitor = Visitor(tracked_functions, timeout_positional)
-        visitor.visit(self._tree)
-        for line, col in visitor.assignments:
-            yield line, col, MSG, type(self)
+    return ret
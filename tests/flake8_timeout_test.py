@@ -1,10 +1,52 @@
 import ast
+import atexit
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
 
 import pytest
 from flake8.options.manager import OptionManager
 
+import flake8_timeout
+from flake8_timeout import Baseline
+from flake8_timeout import DEFAULT_MATCHER
+from flake8_timeout import DEFAULT_TRACKED_FUNCTIONS
+from flake8_timeout import fix_source
+from flake8_timeout import join_keyword_specs
+from flake8_timeout import main
+from flake8_timeout import Matcher
+from flake8_timeout import module_name
+from flake8_timeout import MSG
+from flake8_timeout import parse_diff
 from flake8_timeout import parse_function_spec
 from flake8_timeout import Plugin
+from flake8_timeout import read_changed_lines
+from flake8_timeout import resolve_wrappers
+from flake8_timeout import Result
+from flake8_timeout import RUN_ENV
+from flake8_timeout import serve
+from flake8_timeout import Server
+from flake8_timeout import Spec
+from flake8_timeout import Visitor
+
+
+@pytest.fixture(autouse=True)
+def restore_plugin_options(monkeypatch):
+    # parse_options configures the Plugin class for the whole process
+    for attr in (
+            'matcher',
+            'cache',
+            'changed_lines',
+            'stats',
+            'report_writer',
+            'baseline',
+            'coverage',
+            'project',
+    ):
+        monkeypatch.setattr(Plugin, attr, getattr(Plugin, attr))
 
 
 def results(s):
@@ -33,6 +75,8 @@ def results(s):
             'unknown.method("url")',
             id='unimported-attribute-call',
         ),
+        pytest.param('requests.get("url")', id='module-not-imported'),
+        pytest.param('urlopen("url")', id='function-not-imported'),
         pytest.param(
             'urllib.request.unknown("url")',
             id='nested-untracked-attribute',
@@ -45,6 +89,22 @@ def results(s):
             'funcs = [lambda x: x]\nfuncs[0]("url")',
             id='call-on-subscript',
         ),
+        pytest.param(
+            'def f(requests):\n    requests.get("url")',
+            id='parameter-named-like-module',
+        ),
+        pytest.param(
+            'def f():\n    requests = make_client()\n    requests.get("url")',
+            id='local-named-like-module',
+        ),
+        pytest.param(
+            'def f(urllib):\n    urllib.request.urlopen("url")',
+            id='parameter-named-like-package',
+        ),
+        pytest.param(
+            'f = lambda urllib: urllib.request.urlopen("url")',
+            id='lambda-parameter-named-like-package',
+        ),
         pytest.param(
             'def get_client():\n import requests\n return requests\nget_client().get("url")',  # noqa: E501
             id='call-on-call-result',
@@ -308,6 +368,10 @@ def test_call_as_func_arg_default(s):
             'import urllib.request as ur\nur.urlopen("google.com")',
             id='import-urllib-request-with-alias',
         ),
+        pytest.param(
+            '# not imported\nurllib.request.urlopen("google.com")',
+            id='dotted-path-without-import',
+        ),
     ),
 )
 def test_different_import_styles_no_timeout(s):
@@ -444,6 +508,424 @@ def test_option_parsing_positional_arg_timeout(manager: OptionManager) -> None:
     assert not results(s)
 
 
+def test_option_parsing_compiles_matcher_once(manager: OptionManager) -> None:
+    options = manager.parse_args(['--timeout-extend-funcs=my.func:3'])
+    Plugin.parse_options(options)
+
+    first = Plugin(ast.parse(''))
+    second = Plugin(ast.parse(''))
+    assert first.matcher is second.matcher is Plugin.matcher
+    assert Plugin.matcher.lookup(('my', 'func')) == Spec(
+        'my.func', ('my', 'func'), positional=3, tracked=True,
+    )
+    assert Plugin.matcher.lookup(('requests', 'Session')) == Spec(
+        'requests.Session', ('requests', 'Session'), client=True, pool=True,
+    )
+    get = Plugin.matcher.lookup(('requests', 'get'))
+    assert get is not None and get.one_shot
+    session_get = Plugin.matcher.lookup(('requests', 'Session', 'get'))
+    assert session_get is not None and not session_get.one_shot
+
+
+def test_option_parsing_invalid_spec(manager: OptionManager) -> None:
+    options = manager.parse_args(['--timeout-extend-funcs=invalid'])
+    with pytest.raises(ValueError):
+        Plugin.parse_options(options)
+
+
+def test_matcher_is_picklable():
+    matcher = Matcher.compile(['requests.get', 'urllib.request.urlopen:2'])
+    assert pickle.loads(pickle.dumps(matcher)) == matcher
+    clients = Matcher.compile(['requests.get'], ['requests.Session'])
+    assert clients.fingerprint != matcher.fingerprint
+
+
+@pytest.mark.parametrize(
+    ('presets', 's', 'expected'),
+    (
+        pytest.param(
+            'httpx',
+            'import httpx\nhttpx.get("url")',
+            {'2:0: TIM100 request call has no timeout'},
+            id='httpx',
+        ),
+        pytest.param(
+            'httpx',
+            'import httpx\nwith httpx.Client(timeout=5) as c:\n    c.get("u")',
+            set(),
+            id='httpx-client-with-timeout',
+        ),
+        pytest.param(
+            'aiohttp',
+            'import aiohttp\naiohttp.ClientSession()',
+            {'2:0: TIM100 request call has no timeout'},
+            id='aiohttp',
+        ),
+        pytest.param(
+            'urllib3',
+            'import urllib3\nurllib3.HTTPConnectionPool("h", 80, 5)',
+            set(),
+            id='urllib3-positional',
+        ),
+        pytest.param(
+            'stdlib-net',
+            'import socket\nsocket.create_connection(("h", 80))',
+            {'2:0: TIM100 request call has no timeout'},
+            id='socket',
+        ),
+        pytest.param(
+            'stdlib-net',
+            'from smtplib import SMTP\nSMTP("h", 25, None, 5)',
+            set(),
+            id='smtplib-positional',
+        ),
+        pytest.param(
+            'stdlib-net',
+            'import ftplib\nftplib.FTP("h")',
+            {'2:0: TIM100 request call has no timeout'},
+            id='ftplib',
+        ),
+        pytest.param(
+            'stdlib-net,subprocess',
+            'import subprocess\nsubprocess.run(["ls"])',
+            {'2:0: TIM100 request call has no timeout'},
+            id='subprocess',
+        ),
+        pytest.param(
+            'stdlib-net',
+            'import subprocess\nsubprocess.run(["ls"])',
+            set(),
+            id='not-enabled',
+        ),
+    ),
+)
+def test_presets(manager, presets, s, expected):
+    Plugin.parse_options(
+        manager.parse_args([f'--timeout-presets={presets}']),
+    )
+    assert results(s) == expected
+
+
+def test_presets_extend_overridden_functions(manager):
+    Plugin.parse_options(manager.parse_args([
+        '--timeout-funcs=foo.bar', '--timeout-presets=requests',
+    ]))
+    assert results('import foo\nfoo.bar()')
+    assert results('import requests\nrequests.Session().get("url")')
+    assert not results('from urllib.request import urlopen\nurlopen("url")')
+
+
+def test_presets_unknown(manager):
+    options = manager.parse_args(['--timeout-presets=requests,nope'])
+    with pytest.raises(ValueError) as excinfo:
+        Plugin.parse_options(options)
+    msg, = excinfo.value.args
+    assert msg == (
+        "Unknown preset: 'nope' (available: aiohttp, httpx, requests, "
+        'stdlib-net, subprocess, urllib3)'
+    )
+
+
+@pytest.mark.parametrize(
+    ('timeout', 'expected'),
+    (
+        pytest.param('5 * 60', None, id='arithmetic'),
+        pytest.param('(5, 30)', None, id='tuple'),
+        pytest.param('-1 + 2.5 / 5 // 1 + 2', None, id='operators'),
+        pytest.param('(None, None)', MSG, id='tuple-none'),
+        pytest.param('(5, None)', MSG, id='tuple-read-none'),
+        pytest.param('(None, 5)', MSG, id='tuple-connect-none'),
+        pytest.param('-1', MSG, id='negative'),
+        pytest.param('(5, -1)', MSG, id='tuple-negative'),
+        pytest.param('5 - 10', MSG, id='negative-arithmetic'),
+        pytest.param('0', None, id='zero'),
+        pytest.param('(5, x)', MSG, id='tuple-not-constant'),
+        pytest.param('5 ** 2', MSG, id='unsupported-operator'),
+        pytest.param('1 / 0', MSG, id='zero-division'),
+        pytest.param('True', MSG, id='bool'),
+        pytest.param('"5"', MSG, id='string'),
+    ),
+)
+def test_timeout_evaluated(timeout, expected):
+    s = f'import requests\nrequests.get("url", timeout={timeout})'
+    assert results(s) == ({f'2:0: {expected}'} if expected else set())
+
+
+@pytest.mark.parametrize(
+    ('args', 'timeout', 'expected'),
+    (
+        pytest.param(['--timeout-max=60'], '60', None, id='equal'),
+        pytest.param(
+            ['--timeout-max=60'],
+            '2 * 60',
+            'TIM101 timeout of 120s exceeds the maximum of 60s',
+            id='scalar',
+        ),
+        pytest.param(
+            ['--timeout-max=60'],
+            '(5, 600)',
+            'TIM101 read timeout of 600s exceeds the maximum of 60s',
+            id='read',
+        ),
+        pytest.param(
+            ['--timeout-max=60'],
+            '(5, None)',
+            MSG,
+            id='read-none',
+        ),
+        pytest.param(
+            ['--timeout-max=60', '--timeout-max-connect=5'],
+            '10',
+            'TIM101 connect timeout of 10s exceeds the maximum of 5s',
+            id='connect',
+        ),
+        pytest.param(
+            ['--timeout-max-read=5'], '(60, 5)', None, id='only-read',
+        ),
+        pytest.param(
+            ['--timeout-max=60', '--timeout-max-funcs=requests.get=5/300'],
+            '(5, 300)',
+            None,
+            id='per-function',
+        ),
+        pytest.param(
+            ['--timeout-max-funcs=requests.post=1,requests.get=2'],
+            '3',
+            'TIM101 timeout of 3s exceeds the maximum of 2s',
+            id='per-function-scalar',
+        ),
+    ),
+)
+def test_timeout_max(manager, args, timeout, expected):
+    Plugin.parse_options(manager.parse_args(args))
+    s = f'import requests\nrequests.get("url", timeout={timeout})'
+    assert results(s) == ({f'2:0: {expected}'} if expected else set())
+
+
+def test_timeout_max_positional(manager):
+    Plugin.parse_options(manager.parse_args(['--timeout-max=60']))
+    s = '''\
+import urllib.request
+urllib.request.urlopen("url", None, 600)
+urllib.request.urlopen("url", None, TIMEOUT)
+urllib.request.urlopen("url", None, None)
+'''
+    assert results(s) == {
+        '2:0: TIM101 timeout of 600s exceeds the maximum of 60s',
+        f'4:0: {MSG}',
+    }
+
+
+@pytest.mark.parametrize(
+    ('spec', 'error_msg'),
+    (
+        pytest.param(
+            'requests.get',
+            "Limit spec must be 'module.function=limit': requests.get",
+            id='no-limit',
+        ),
+        pytest.param(
+            'requests.get=5/x',
+            "Limit must be 'seconds' or 'connect/read' seconds: 5/x",
+            id='invalid-limit',
+        ),
+        pytest.param(
+            'requests.Session=5',
+            'Limit for a function not tracked: requests.Session=5',
+            id='not-tracked',
+        ),
+    ),
+)
+def test_timeout_max_funcs_invalid(manager, spec, error_msg):
+    options = manager.parse_args([f'--timeout-max-funcs={spec}'])
+    with pytest.raises(ValueError) as excinfo:
+        Plugin.parse_options(options)
+    msg, = excinfo.value.args
+    assert msg == error_msg
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param(
+            'TIMEOUT = 10\nrequests.get("url", timeout=TIMEOUT)',
+            id='module-constant',
+        ),
+        pytest.param(
+            'TIMEOUT: float = 10\nrequests.get("url", timeout=TIMEOUT)',
+            id='annotated-constant',
+        ),
+        pytest.param(
+            'A = 5\nB = A * 60\nrequests.get("url", timeout=(A, B))',
+            id='constant-arithmetic',
+        ),
+        pytest.param(
+            'T = (5, 30)\n'
+            'def f():\n'
+            '    requests.get("url", timeout=T)',
+            id='constant-in-function',
+        ),
+        pytest.param(
+            'class C:\n'
+            '    TIMEOUT = 5\n'
+            '    def f(self):\n'
+            '        requests.get("url", timeout=self.TIMEOUT)',
+            id='class-constant',
+        ),
+        pytest.param(
+            'requests.get("url", **{"timeout": 5, "verify": False})',
+            id='kwargs-dict',
+        ),
+        pytest.param(
+            'KW = {"timeout": 5}\nrequests.get("url", **KW)',
+            id='kwargs-dict-constant',
+        ),
+        pytest.param(
+            'def f():\n'
+            '    kw = dict(timeout=5)\n'
+            '    requests.get("url", **kw)',
+            id='kwargs-dict-call',
+        ),
+    ),
+)
+def test_constant_timeout(s):
+    assert not results(f'import requests\n{s}\n')
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param(
+            'TIMEOUT = None\nrequests.get("url", timeout=TIMEOUT)',
+            id='none-constant',
+        ),
+        pytest.param(
+            'TIMEOUT = 10\n'
+            'def f(TIMEOUT):\n'
+            '    requests.get("url", timeout=TIMEOUT)',
+            id='shadowed-by-argument',
+        ),
+        pytest.param(
+            'TIMEOUT = 10\n'
+            'TIMEOUT = get_timeout()\n'
+            'requests.get("url", timeout=TIMEOUT)',
+            id='reassigned',
+        ),
+        pytest.param(
+            'class C:\n'
+            '    TIMEOUT = 5\n'
+            '    def f(self):\n'
+            '        requests.get("url", timeout=TIMEOUT)',
+            id='class-constant-not-in-scope',
+        ),
+        pytest.param(
+            'requests.get("url", **{"verify": False})',
+            id='kwargs-without-timeout',
+        ),
+        pytest.param(
+            'requests.get("url", **{"timeout": None})',
+            id='kwargs-timeout-none',
+        ),
+        pytest.param(
+            'def f(**kw):\n    requests.get("url", **kw)',
+            id='kwargs-unknown',
+        ),
+        pytest.param(
+            'from settings import TIMEOUT\n'
+            'requests.get("url", timeout=TIMEOUT)',
+            id='settings-not-configured',
+        ),
+    ),
+)
+def test_constant_timeout_missing(s):
+    assert results(f'import requests\n{s}\n')
+
+
+DEFINED_LATER = '''\
+import requests
+def f():
+    requests.get('url', timeout=TIMEOUT)
+    requests.get('url', **KWARGS)
+    requests.get('url', timeout=UNDEFINED)
+    lambda: requests.get('url', timeout=TIMEOUT)
+requests.get('url', timeout=TIMEOUT)
+TIMEOUT = 5
+KWARGS = {'timeout': TIMEOUT}
+'''
+
+
+def test_constant_defined_after_function():
+    # function bodies run once the module has been executed
+    assert results(DEFINED_LATER) == {
+        '5:4: TIM100 request call has no timeout',
+        '7:0: TIM100 request call has no timeout',
+    }
+    assert results(DEFINED_LATER.replace('= 5', '= None')) == {
+        '3:4: TIM100 request call has no timeout',
+        '4:4: TIM100 request call has no timeout',
+        '5:4: TIM100 request call has no timeout',
+        '6:12: TIM100 request call has no timeout',
+        '7:0: TIM100 request call has no timeout',
+    }
+
+
+def test_constant_timeout_max(manager):
+    Plugin.parse_options(manager.parse_args(['--timeout-max=60']))
+    s = '''\
+import requests
+HOUR = 60 * 60
+TIMEOUTS = {'timeout': (5, HOUR)}
+requests.get('url', timeout=HOUR)
+requests.get('url', **TIMEOUTS)
+'''
+    assert results(s) == {
+        '4:0: TIM101 timeout of 3600s exceeds the maximum of 60s',
+        '5:0: TIM101 read timeout of 3600s exceeds the maximum of 60s',
+    }
+
+
+def test_settings_modules(manager):
+    Plugin.parse_options(manager.parse_args([
+        '--timeout-max=60',
+        '--timeout-settings-modules=project.settings,django.conf.settings',
+    ]))
+    s = '''\
+import requests
+from django.conf import settings
+from project.settings import TIMEOUT
+from project import settings as project_settings
+requests.get('url', timeout=TIMEOUT)
+requests.get('url', timeout=(TIMEOUT, 2 * TIMEOUT))
+requests.get('url', timeout=settings.HTTP_TIMEOUT)
+requests.get('url', timeout=project_settings.TIMEOUT)
+requests.get('url', timeout=project_settings)
+'''
+    assert results(s) == {f'9:0: {MSG}'}
+
+
+def test_settings_module_single_name(manager):
+    Plugin.parse_options(manager.parse_args([
+        '--timeout-settings-modules=config',
+    ]))
+    s = '''\
+import config
+import requests
+from config import TIMEOUT
+requests.get('url', timeout=TIMEOUT)
+requests.get('url', timeout=config.HTTP_TIMEOUT)
+requests.get('url', timeout=config)
+'''
+    assert results(s) == {f'6:0: {MSG}'}
+
+
+def test_settings_module_invalid(manager):
+    options = manager.parse_args(['--timeout-settings-modules=my-config'])
+    with pytest.raises(ValueError) as excinfo:
+        Plugin.parse_options(options)
+    msg, = excinfo.value.args
+    assert msg == 'Module must be a dotted name: my-config'
+
+
 def test_custom_tracked_function_no_timeout(manager: OptionManager) -> None:
     options = manager.parse_args(
         ['--timeout-extend-funcs=foo.bar.baz'],
@@ -528,6 +1010,16 @@ def test_custom_positional_timeout_missing(manager: OptionManager) -> None:
             (('foo', 'bar'), 5),
             id='index-five',
         ),
+        pytest.param(
+            'redis.Redis@socket_timeout,socket_connect_timeout',
+            (('redis', 'Redis'), None),
+            id='keywords',
+        ),
+        pytest.param(
+            'my.func:1@timeout_ms',
+            (('my', 'func'), 1),
+            id='index-and-keyword',
+        ),
     ),
 )
 def test_parse_function_spec_valid(spec, expected):
@@ -552,6 +1044,21 @@ def test_parse_function_spec_valid(spec, expected):
             'Positional index must be an integer in spec: foo.bar:notanumber',
             id='invalid-index-text',
         ),
+        pytest.param(
+            'foo.bar@',
+            'Timeout keywords must be identifiers in spec: foo.bar@',
+            id='empty-keyword',
+        ),
+        pytest.param(
+            'foo.bar@a,b-c',
+            'Timeout keywords must be identifiers in spec: foo.bar@a,b-c',
+            id='invalid-keyword',
+        ),
+        pytest.param(
+            'foo.bar@a:1',
+            'Timeout keywords must be identifiers in spec: foo.bar@a:1',
+            id='index-after-keyword',
+        ),
     ),
 )
 def test_parse_function_spec_invalid(spec, error_msg):
@@ -561,6 +1068,58 @@ def test_parse_function_spec_invalid(spec, error_msg):
     assert msg == error_msg
 
 
+@pytest.mark.parametrize(
+    ('items', 'expected'),
+    (
+        (['a.b', 'c.d'], ['a.b', 'c.d']),
+        (['a.b@x', 'y', 'c.d:1@z'], ['a.b@x,y', 'c.d:1@z']),
+        (['a.b:1', 'y'], ['a.b:1', 'y']),
+    ),
+)
+def test_join_keyword_specs(items, expected):
+    assert join_keyword_specs(items) == expected
+
+
+def test_timeout_keywords(manager):
+    options = manager.parse_args([
+        '--timeout-extend-funcs='
+        'redis.Redis@socket_timeout,socket_connect_timeout,'
+        'psycopg.connect:1@connect_timeout',
+        '--timeout-max=60',
+    ])
+    Plugin.parse_options(options)
+    assert Plugin.matcher.lookup(('redis', 'Redis')) == Spec(
+        'redis.Redis',
+        ('redis', 'Redis'),
+        keywords=('socket_timeout', 'socket_connect_timeout'),
+        tracked=True,
+        limit=(60, 60),
+    )
+
+    s = '''\
+import psycopg
+import redis
+redis.Redis(socket_timeout=5)
+redis.Redis(socket_connect_timeout=5)
+redis.Redis(timeout=5)
+redis.Redis(socket_timeout=None)
+psycopg.connect(dsn, 5)
+psycopg.connect(dsn, connect_timeout=600)
+redis.Redis(**{'socket_timeout': 5})
+redis.Redis(**dict(socket_connect_timeout=5))
+redis.Redis(**{'timeout': 5})
+kwargs = {'timeout': 5}
+redis.Redis(**kwargs)
+'''
+    assert results(s) == {
+        '5:0: TIM100 request call has no timeout',
+        '6:0: TIM100 request call has no timeout',
+        '8:0: TIM101 timeout of 600s exceeds the maximum of 60s',
+        '11:0: TIM100 request call has no timeout',
+        '13:0: TIM100 request call has no timeout',
+    }
+
+
 def test_complex_nested_expression():
     s = '''\
 import requests
@@ -572,3 +1131,1954 @@ def outer():
 '''
     msg, = results(s)
     assert msg == '5:8: TIM100 request call has no timeout'
+
+
+@pytest.mark.parametrize(
+    ('s', 'expected'),
+    (
+        pytest.param('import requests\n', True, id='match'),
+        pytest.param('from urllib import request\n', True, id='root-module'),
+        pytest.param('import requests_mock\n', False, id='prefix-only'),
+        pytest.param('x = 1\n', False, id='no-match'),
+    ),
+)
+def test_prefilter(s, expected):
+    assert bool(DEFAULT_MATCHER.prefilter.search(s)) is expected
+
+
+def test_prefilter_skips_walk():
+    tree = ast.parse('import requests\nrequests.get("url")')
+    lines = ['import foo\n', 'foo.get("url")\n']
+    assert not list(Plugin(tree, lines).run())
+    lines = ['import requests\n', 'requests.get("url")\n']
+    assert list(Plugin(tree, lines).run()) == [(2, 0, MSG, Plugin)]
+
+
+@pytest.fixture
+def cache(manager, tmp_path, monkeypatch):
+    monkeypatch.delenv(RUN_ENV, raising=False)
+    options = manager.parse_args([
+        f'--timeout-cache={tmp_path / "cache.db"}',
+        '--timeout-cache-size=1',
+    ])
+    Plugin.parse_options(options)
+    assert Plugin.cache is not None
+    atexit.unregister(Plugin.report)
+    yield Plugin.cache
+    Plugin.parse_options(manager.parse_args([]))
+
+
+def test_cache_hit_skips_analysis(cache, capsys):
+    lines = ['import requests\n', 'requests.get("url")\n']
+    tree = ast.parse(''.join(lines))
+    assert list(Plugin(tree, lines).run()) == [(2, 0, MSG, Plugin)]
+    # the tree is not looked at for unchanged content
+    assert list(Plugin(ast.parse(''), lines).run()) == [(2, 0, MSG, Plugin)]
+
+    cache.report()
+    _, err = capsys.readouterr()
+    assert err == 'flake8-timeout cache: 1 hits, 1 misses\n'
+
+
+def test_cache_key_depends_on_content_and_config(cache):
+    lines = ['import requests\n', 'requests.get("url")\n']
+    key = cache.key(lines)
+    assert cache.key(lines) == key
+    assert cache.key(['import requests\n']) != key
+
+    other = Matcher.compile(['requests.post'])
+    other_cache = type(cache)(cache.path, 1, other.fingerprint, cache.run)
+    assert other_cache.key(lines) != key
+
+
+def test_cache_evicts_least_recently_used(cache, capsys):
+    cache.put('old', [])
+    result = Result(1, 0, 1, 19, MSG, 'requests.get', 'missing', None)
+    cache.put('new', [result])
+    with cache.db:
+        cache.db.execute('UPDATE results SET used = 0 WHERE key = "old"')
+    cache.report()
+
+    assert cache.get('old') is None
+    assert cache.get('new') == [result]
+
+
+def test_cache_get_does_not_write(cache, capsys):
+    cache.put('key', [])
+    with cache.db:
+        cache.db.execute('UPDATE results SET used = 0')
+    assert cache.get('key') == []
+    assert cache.get('other') is None
+    assert cache.db.execute('SELECT used FROM results').fetchall() == [(0,)]
+    assert not cache.db.execute('SELECT * FROM stats').fetchall()
+
+    cache.report()
+    assert cache.db.execute('SELECT used FROM results').fetchone()[0] > 0
+    _, err = capsys.readouterr()
+    assert err == 'flake8-timeout cache: 1 hits, 1 misses\n'
+
+
+def test_deeply_nested_expression_does_not_recurse():
+    tree = ast.parse('import requests\nx = requests.get("url")')
+    assign = tree.body[1]
+    assert isinstance(assign, ast.Assign)
+    call = assign.value
+    # deeper than the recursion limit, like some generated code
+    for _ in range(10_000):
+        call = ast.BinOp(left=call, op=ast.Add(), right=ast.Constant(1))
+    assign.value = call
+
+    assert list(Plugin(tree).run()) == [(2, 4, MSG, Plugin)]
+
+
+@pytest.mark.parametrize(
+    ('s', 'depth'),
+    (
+        pytest.param(
+            'for url in urls:\n    requests.get(url, timeout=5)',
+            1,
+            id='for',
+        ),
+        pytest.param(
+            'async def f():\n'
+            '    async for url in urls:\n'
+            '        requests.get(url, timeout=5)',
+            1,
+            id='async-for',
+        ),
+        pytest.param(
+            'while True:\n    requests.get("url", timeout=5)',
+            1,
+            id='while-body',
+        ),
+        pytest.param(
+            'while requests.get("url", timeout=5).ok:\n    pass',
+            1,
+            id='while-test',
+        ),
+        pytest.param(
+            'for a in b:\n'
+            '    for url in a:\n'
+            '        requests.get(url, timeout=5)',
+            2,
+            id='nested',
+        ),
+        pytest.param(
+            '[requests.get(url, timeout=5) for url in urls]',
+            1,
+            id='list-comprehension',
+        ),
+        pytest.param(
+            '{url: requests.get(url, timeout=5) for url in urls}',
+            1,
+            id='dict-comprehension',
+        ),
+        pytest.param(
+            '[url for url in urls if requests.head(url, timeout=5)]',
+            1,
+            id='comprehension-condition',
+        ),
+        pytest.param(
+            '[requests.get(u, timeout=5) for a in b for u in a]',
+            2,
+            id='comprehension-generators',
+        ),
+        pytest.param(
+            '[x for a in b for x in requests.get(a, timeout=5).json()]',
+            1,
+            id='comprehension-inner-iterable',
+        ),
+        pytest.param(
+            'for a in b:\n'
+            '    class C:\n'
+            '        r = requests.get("url", timeout=5)',
+            1,
+            id='class-body',
+        ),
+    ),
+)
+def test_call_in_loop(s, depth):
+    line, col = next(
+        (lineno, line.index('requests.'))
+        for lineno, line in enumerate(s.splitlines(), start=2)
+        if 'requests.' in line
+    )
+    ret = results(f'import requests\n{s}\n')
+    assert {r for r in ret if 'TIM300' not in r} == {
+        f'{line}:{col}: TIM200 request call inside a loop '
+        f'(loop depth {depth})',
+    }
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param(
+            'for url in requests.get("url", timeout=5).json():\n    pass',
+            id='for-iterable',
+        ),
+        pytest.param(
+            'for url in urls:\n    pass\nelse:\n'
+            '    requests.get("url", timeout=5)',
+            id='for-else',
+        ),
+        pytest.param(
+            '[url for url in requests.get("url", timeout=5).json()]',
+            id='comprehension-iterable',
+        ),
+        pytest.param(
+            'for url in urls:\n'
+            '    def f():\n'
+            '        requests.get(url, timeout=5)',
+            id='function-in-loop',
+        ),
+        pytest.param(
+            'for url in urls:\n'
+            '    f = lambda: requests.get(url, timeout=5)',
+            id='lambda-in-loop',
+        ),
+        pytest.param(
+            'for url in urls:\n    print(url)\nrequests.get("url", timeout=5)',
+            id='after-loop',
+        ),
+    ),
+)
+def test_call_not_in_loop(s):
+    assert not results(f'import requests\n{s}\n')
+
+
+def test_call_in_loop_without_timeout():
+    s = '''\
+import requests
+def f(urls):
+    for url in urls:
+        requests.get(url)
+'''
+    assert results(s) == {
+        '4:8: TIM100 request call has no timeout',
+        '4:8: TIM200 request call inside a loop (loop depth 1)',
+    }
+
+
+@pytest.mark.parametrize(
+    ('s', 'expected'),
+    (
+        pytest.param(
+            'for url in urls:\n'
+            '    with requests.Session() as s:\n'
+            '        pass',
+            '3:9: TIM201 requests.Session creates a new connection pool '
+            'inside a loop',
+            id='loop',
+        ),
+        pytest.param(
+            'def fetch(url):\n'
+            '    with requests.Session() as s:\n'
+            '        return s.get(url, timeout=5)',
+            '3:9: TIM201 requests.Session creates a new connection pool '
+            'on every call of fetch()',
+            id='function',
+        ),
+        pytest.param(
+            'class C:\n'
+            '    def session(self):\n'
+            '        return requests.Session()',
+            '4:15: TIM201 requests.Session creates a new connection pool '
+            'on every call of C.session()',
+            id='method-returning-it',
+        ),
+        pytest.param(
+            'def f():\n'
+            '    def make():\n'
+            '        return requests.Session()',
+            '4:15: TIM201 requests.Session creates a new connection pool '
+            'on every call of f.make()',
+            id='nested-factory',
+        ),
+        pytest.param(
+            'from urllib3 import PoolManager\n'
+            'def fetch(url):\n'
+            '    return PoolManager().request("GET", url, timeout=5)',
+            '4:11: TIM201 urllib3.PoolManager creates a new connection pool '
+            'on every call of fetch()',
+            id='from-import',
+        ),
+    ),
+)
+def test_pool_created_repeatedly(s, expected):
+    assert results(f'import requests\n{s}\n') == {expected}
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param('SESSION = requests.Session()', id='module-level'),
+        pytest.param(
+            'class C:\n    session = requests.Session()',
+            id='class-attribute',
+        ),
+        pytest.param(
+            'def make_session():\n'
+            '    s = requests.Session()\n'
+            '    s.headers["User-Agent"] = "me"\n'
+            '    return s',
+            id='module-level-factory',
+        ),
+        pytest.param(
+            'def session():\n    yield requests.Session()',
+            id='module-level-generator',
+        ),
+        pytest.param(
+            'import functools\n'
+            'class C:\n'
+            '    @functools.cached_property\n'
+            '    def session(self):\n'
+            '        return requests.Session()',
+            id='cached-property',
+        ),
+        pytest.param(
+            'from functools import lru_cache\n'
+            'class C:\n'
+            '    @lru_cache(maxsize=1)\n'
+            '    def session(self):\n'
+            '        return requests.Session()',
+            id='lru-cache',
+        ),
+        pytest.param(
+            'class C:\n'
+            '    def __init__(self):\n'
+            '        self.session = requests.Session()',
+            id='attribute',
+        ),
+        pytest.param(
+            'class C:\n'
+            '    def __init__(self):\n'
+            '        s = requests.Session()\n'
+            '        self.session = s',
+            id='attribute-by-name',
+        ),
+        pytest.param(
+            '_session = None\n'
+            'def session():\n'
+            '    global _session\n'
+            '    if _session is None:\n'
+            '        _session = requests.Session()\n',
+            id='global',
+        ),
+        pytest.param(
+            'def mount_all(urls, adapter):\n'
+            '    with requests.Session() as s:\n'
+            '        for url in urls:\n'
+            '            s.mount(url, adapter)',
+            id='reused-in-loop',
+        ),
+    ),
+)
+def test_pool_not_created_repeatedly(s):
+    assert not results(f'import requests\n{s}\n')
+
+
+def test_pool_constructor_tracked(manager):
+    options = manager.parse_args(['--timeout-presets=httpx'])
+    Plugin.parse_options(options)
+    s = '''\
+import httpx
+for url in urls:
+    httpx.Client()
+'''
+    # the timeout of the client is checked but it is not a request
+    assert results(s) == {
+        '3:4: TIM100 request call has no timeout',
+        '3:4: TIM201 httpx.Client creates a new connection pool inside a '
+        'loop',
+    }
+
+
+def test_pool_funcs_option(manager):
+    options = manager.parse_args(['--timeout-pool-funcs=my.Pool'])
+    Plugin.parse_options(options)
+    s = '''\
+import my
+import requests
+def f():
+    my.Pool()
+    requests.Session()
+'''
+    assert results(s) == {
+        '4:4: TIM201 my.Pool creates a new connection pool on every call of '
+        'f()',
+    }
+
+
+def test_one_shot_call_in_function_called_in_loop():
+    s = '''\
+import requests
+def fetch(url):
+    return requests.get(url, timeout=5)
+def fetch_all(urls):
+    return [fetch(url) for url in urls]
+def post(url):
+    def inner():
+        requests.post(url, timeout=5)
+    inner()
+def post_all(urls):
+    for url in urls:
+        post(url)
+'''
+    assert results(s) == {
+        '3:11: TIM202 requests.get opens a new connection on every call of '
+        'fetch() which is called in a loop',
+        '8:8: TIM202 requests.post opens a new connection on every call of '
+        'post() which is called in a loop',
+    }
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param(
+            'def fetch(url):\n'
+            '    return requests.get(url, timeout=5)\n'
+            'fetch("url")',
+            id='not-in-loop',
+        ),
+        pytest.param(
+            'def fetch(s, url):\n'
+            '    return s.get(url, timeout=5)\n'
+            'with requests.Session() as s:\n'
+            '    for url in urls:\n'
+            '        fetch(s, url)',
+            id='session',
+        ),
+        pytest.param(
+            'def fetch(url):\n'
+            '    return urllib.request.urlopen(url, timeout=5)\n'
+            'for url in urls:\n'
+            '    fetch(url)',
+            id='no-pool-in-module',
+        ),
+        pytest.param(
+            'def fetch(url):\n'
+            '    return requests.get(url, timeout=5)\n'
+            'def g(fetch):\n'
+            '    for url in urls:\n'
+            '        fetch(url)',
+            id='argument-of-the-same-name',
+        ),
+        pytest.param(
+            'def fetch(url):\n'
+            '    return requests.get(url, timeout=5)\n'
+            'def g():\n'
+            '    fetch = make_fetch()\n'
+            '    for url in urls:\n'
+            '        fetch(url)',
+            id='local-of-the-same-name',
+        ),
+    ),
+)
+def test_one_shot_call_not_reported(s):
+    assert not results(f'import requests\nimport urllib.request\n{s}\n')
+
+
+@pytest.mark.parametrize(
+    ('s', 'expected'),
+    (
+        pytest.param(
+            'async def f():\n    requests.get("url", timeout=5)',
+            '3:4: TIM300 requests.get blocks the event loop in async '
+            'function f()',
+            id='function',
+        ),
+        pytest.param(
+            'class C:\n'
+            '    async def f(self, s: requests.Session):\n'
+            '        s.post("url", timeout=5)',
+            '4:8: TIM300 requests.Session.post blocks the event loop in '
+            'async function C.f()',
+            id='session-method',
+        ),
+        pytest.param(
+            'from urllib.request import urlopen\n'
+            'async def f():\n'
+            '    urlopen("url", None, 5)',
+            '4:4: TIM300 urllib.request.urlopen blocks the event loop in '
+            'async function f()',
+            id='urlopen',
+        ),
+        pytest.param(
+            'def f():\n'
+            '    async def g():\n'
+            '        requests.get("url", timeout=5)',
+            '4:8: TIM300 requests.get blocks the event loop in async '
+            'function f.g()',
+            id='nested-async',
+        ),
+    ),
+)
+def test_blocking_call_in_async_function(s, expected):
+    assert results(f'import requests\n{s}\n') == {expected}
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param('requests.get("url", timeout=5)', id='module-level'),
+        pytest.param(
+            'def f():\n    requests.get("url", timeout=5)',
+            id='sync-function',
+        ),
+        pytest.param(
+            'async def f():\n'
+            '    def g():\n'
+            '        requests.get("url", timeout=5)\n'
+            '    await asyncio.to_thread(g)',
+            id='nested-sync-function',
+        ),
+        pytest.param(
+            'async def f(loop):\n'
+            '    await loop.run_in_executor(\n'
+            '        None, lambda: requests.get("url", timeout=5),\n'
+            '    )',
+            id='lambda',
+        ),
+        pytest.param(
+            'async def f():\n'
+            '    await asyncio.to_thread(requests.get, "url", timeout=5)',
+            id='to-thread',
+        ),
+    ),
+)
+def test_blocking_call_not_reported(s):
+    assert not results(f'import asyncio\nimport requests\n{s}\n')
+
+
+def test_blocking_funcs_option(manager):
+    options = manager.parse_args([
+        '--timeout-blocking-funcs=time.sleep',
+    ])
+    Plugin.parse_options(options)
+    s = '''\
+import time
+import requests
+async def f():
+    time.sleep(1)
+    requests.get("url", timeout=5)
+'''
+    assert results(s) == {
+        '4:4: TIM300 time.sleep blocks the event loop in async function f()',
+    }
+
+
+def test_results_in_source_order():
+    s = '''\
+import requests
+requests.get(requests.post("a"), requests.put("b"))
+def f(x=requests.head("c")):
+    requests.delete("d")
+'''
+    ret = [(line, col) for line, col, *_ in Plugin(ast.parse(s)).run()]
+    assert ret == [(2, 0), (2, 13), (2, 33), (3, 8), (4, 4)]
+
+
+def test_results_are_streamed():
+    tree = ast.parse('import requests\n' + 'requests.get("url")\n' * 100)
+    visitor = Visitor(DEFAULT_MATCHER)
+    violation = next(visitor.visit(tree))
+    assert (violation.lineno, violation.col_offset) == (2, 0)
+    assert violation.spec.key == 'requests.get'
+    assert violation.msg == MSG
+    # the rest of the module has not been walked yet
+    assert visitor.n_calls == 1
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv(RUN_ENV, raising=False)
+    tmp_path.joinpath('pkg').mkdir()
+    tmp_path.joinpath('pkg/a.py').write_text(
+        'import requests\nrequests.get("url")\n',
+    )
+    tmp_path.joinpath('pkg/b.py').write_text(
+        'from foo import bar\nbar.baz("url")\n',
+    )
+    tmp_path.joinpath('pkg/c.txt').write_text('requests.get("url")\n')
+    tmp_path.joinpath('.tox').mkdir()
+    tmp_path.joinpath('.tox/d.py').write_text(
+        'import requests\nrequests.get("url")\n',
+    )
+    return tmp_path
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main(project, capsys, jobs):
+    assert main(['-j', jobs]) == 1
+    out, _ = capsys.readouterr()
+    assert out == './pkg/a.py:2:1: TIM100 request call has no timeout\n'
+
+
+def test_main_no_results(project, capsys):
+    assert main(['pkg/b.py']) == 0
+    out, _ = capsys.readouterr()
+    assert out == ''
+
+
+def test_main_reads_flake8_config(project, capsys):
+    project.joinpath('tox.ini').write_text(
+        '[flake8]\n'
+        'timeout-extend-funcs = foo.bar.baz\n'
+        'extend-exclude = a.py\n',
+    )
+    assert main([]) == 1
+    out, _ = capsys.readouterr()
+    assert out == './pkg/b.py:2:1: TIM100 request call has no timeout\n'
+
+
+def test_main_arguments_override_config(project, capsys):
+    project.joinpath('setup.cfg').write_text(
+        '[flake8]\ntimeout-funcs = foo.bar.baz\n',
+    )
+    assert main(['--timeout-funcs=requests.get', 'pkg']) == 1
+    out, _ = capsys.readouterr()
+    assert out == 'pkg/a.py:2:1: TIM100 request call has no timeout\n'
+
+
+def test_main_explicit_config(project, capsys):
+    project.joinpath('custom.cfg').write_text(
+        '[flake8]\ntimeout-funcs = foo.bar.baz\n',
+    )
+    assert main(['--config=custom.cfg', 'pkg']) == 1
+    out, _ = capsys.readouterr()
+    assert out == 'pkg/b.py:2:1: TIM100 request call has no timeout\n'
+
+
+def test_main_invalid_spec(project, capsys):
+    with pytest.raises(SystemExit):
+        main(['--timeout-funcs=invalid'])
+    _, err = capsys.readouterr()
+    assert "Function spec must be at least 'module.function'" in err
+
+
+NOQA = """\
+import requests
+requests.get("url")
+requests.get("url")  # noqa
+requests.get("url")  # noqa: TIM100
+requests.get("url")  # NOQA:TIM1
+requests.get("url")  # noqa: E501
+requests.get(
+    "url",
+)  # noqa: TIM100
+requests.post("url", data='''
+''')  # noqa: TIM100
+for url in ("a", "b"):
+    requests.get(url, timeout=5)
+    requests.get(url, timeout=5)  # noqa: TIM200
+"""
+
+
+@pytest.mark.parametrize(
+    ('config', 'args'),
+    (
+        pytest.param('', (), id='defaults'),
+        pytest.param('ignore = TIM200\n', (), id='ignore'),
+        pytest.param('extend-ignore = TIM1\n', (), id='extend-ignore'),
+        pytest.param('', ('--extend-ignore=TIM200',), id='ignore-argument'),
+        pytest.param(
+            'per-file-ignores =\n    tests/*: TIM100\n    a.py: TIM2\n',
+            (),
+            id='per-file-ignores',
+        ),
+        pytest.param(
+            '',
+            ('--per-file-ignores=tests/*.py:TIM200',),
+            id='per-file-ignores-argument',
+        ),
+        pytest.param(
+            'ignore = TIM\n',
+            ('--extend-select=TIM100',),
+            id='longer-select-wins',
+        ),
+        pytest.param('', ('--ignore=TIM100',), id='argument-overrides'),
+    ),
+)
+def test_main_same_results_as_flake8(project, capsys, config, args):
+    project.joinpath('tox.ini').write_text(f'[flake8]\n{config}')
+    project.joinpath('a.py').write_text(NOQA)
+    project.joinpath('tests').mkdir()
+    project.joinpath('tests/test_a.py').write_text(NOQA)
+    proc = subprocess.run(
+        (sys.executable, '-m', 'flake8', '--select=TIM', *args, '.'),
+        capture_output=True,
+        text=True,
+    )
+    expected = sorted(proc.stdout.splitlines())
+    assert expected
+    main(['--select=TIM', *args])
+    out, _ = capsys.readouterr()
+    assert sorted(out.splitlines()) == expected
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main_cache(project, capsys, jobs):
+    project.joinpath('pkg/e.py').write_text('import requests\n')
+    assert main(['-j', jobs, '--timeout-cache=cache.db', 'pkg']) == 1
+    assert main(['-j', jobs, '--timeout-cache=cache.db', 'pkg']) == 1
+    out, err = capsys.readouterr()
+    assert out == 'pkg/a.py:2:1: TIM100 request call has no timeout\n' * 2
+    assert err == (
+        'flake8-timeout cache: 0 hits, 2 misses\n'
+        'flake8-timeout cache: 2 hits, 0 misses\n'
+    )
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main_stats(project, jobs):
+    main(['-j', jobs, '--timeout-stats=stats.json', 'pkg', '.tox'])
+    stats = json.loads(project.joinpath('stats.json').read_text())
+    assert stats['files'] == 3
+    # files without tracked names are not walked
+    assert stats['nodes'] == 10
+    assert stats['calls'] == 2
+    assert stats['imports'] == 2
+    assert stats['matches'] == 2
+    assert stats['time_ms'].keys() == {'p50', 'p90', 'p99', 'max'}
+    assert stats['time_ms']['max'] == max(
+        f['time_s'] * 1e3 for f in stats['slowest']
+    )
+    filenames = {f['filename'] for f in stats['slowest']}
+    assert filenames == {'pkg/a.py', 'pkg/b.py', '.tox/d.py'}
+    assert Plugin.stats is not None
+    assert not os.path.exists(Plugin.stats.parts)
+
+
+def test_stats_from_environment(monkeypatch):
+    monkeypatch.setenv('FLAKE8_TIMEOUT_STATS', 'stats.json')
+    mgr = OptionManager(
+        version='0',
+        plugin_versions='',
+        formatter_names=(),
+        parents=[],
+    )
+    Plugin.add_options(mgr)
+    assert mgr.parse_args([]).timeout_stats == 'stats.json'
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main_report(project, jobs):
+    project.joinpath('pkg/e.py').write_text(
+        'import requests\n'
+        'class C:\n'
+        '    def f(self, t):\n'
+        '        requests.post("url", timeout=None)\n'
+        '        requests.put("url", timeout=t)\n'
+        '        requests.head("url", timeout=600)\n',
+    )
+    argv = ['-j', jobs, '--timeout-max=60', '--timeout-report=r.jsonl']
+    assert main([*argv, 'pkg']) == 1
+    lines = project.joinpath('r.jsonl').read_text().splitlines()
+    records = sorted(
+        (json.loads(line) for line in lines),
+        key=lambda r: (r['filename'], r['line']),
+    )
+    assert records == [
+        {
+            'filename': 'pkg/a.py',
+            'line': 2,
+            'col': 1,
+            'end_line': 2,
+            'end_col': 20,
+            'code': 'TIM100',
+            'message': 'request call has no timeout',
+            'spec': 'requests.get',
+            'status': 'missing',
+            'function': None,
+        },
+        {
+            'filename': 'pkg/e.py',
+            'line': 4,
+            'col': 9,
+            'end_line': 4,
+            'end_col': 43,
+            'code': 'TIM100',
+            'message': 'request call has no timeout',
+            'spec': 'requests.post',
+            'status': 'none',
+            'function': 'C.f',
+        },
+        {
+            'filename': 'pkg/e.py',
+            'line': 5,
+            'col': 9,
+            'end_line': 5,
+            'end_col': 39,
+            'code': 'TIM100',
+            'message': 'request call has no timeout',
+            'spec': 'requests.put',
+            'status': 'non-constant',
+            'function': 'C.f',
+        },
+        {
+            'filename': 'pkg/e.py',
+            'line': 6,
+            'col': 9,
+            'end_line': 6,
+            'end_col': 42,
+            'code': 'TIM101',
+            'message': 'timeout of 600s exceeds the maximum of 60s',
+            'spec': 'requests.head',
+            'status': 'too-large',
+            'function': 'C.f',
+        },
+    ]
+    assert Plugin.report_writer is not None
+    assert not os.path.exists(Plugin.report_writer.parts)
+
+
+def test_main_report_cached(project):
+    argv = ['--timeout-cache=cache.db', '--timeout-report=r.jsonl', 'pkg']
+    main(argv)
+    first = project.joinpath('r.jsonl').read_text()
+    main(argv)
+    assert project.joinpath('r.jsonl').read_text() == first != ''
+
+
+def test_main_report_sarif(project):
+    argv = ['--timeout-report=r.sarif', '--timeout-report-format=sarif']
+    main([*argv, './pkg'])
+    sarif = json.loads(project.joinpath('r.sarif').read_text())
+    assert sarif['version'] == '2.1.0'
+    run, = sarif['runs']
+    assert run['tool']['driver']['name'] == 'flake8-timeout'
+    rules = [rule['id'] for rule in run['tool']['driver']['rules']]
+    assert rules == [
+        'TIM100', 'TIM101', 'TIM200', 'TIM201', 'TIM202', 'TIM300',
+    ]
+    assert run['results'] == [
+        {
+            'ruleId': 'TIM100',
+            'level': 'warning',
+            'message': {'text': 'request call has no timeout'},
+            'locations': [{
+                'physicalLocation': {
+                    'artifactLocation': {'uri': 'pkg/a.py'},
+                    'region': {
+                        'startLine': 2,
+                        'startColumn': 1,
+                        'endLine': 2,
+                        'endColumn': 20,
+                    },
+                },
+            }],
+            'properties': {'spec': 'requests.get', 'status': 'missing'},
+        },
+    ]
+
+
+def test_main_report_sarif_empty(project):
+    argv = ['--timeout-report=r.sarif', '--timeout-report-format=sarif']
+    assert main([*argv, 'pkg/b.py']) == 0
+    sarif = json.loads(project.joinpath('r.sarif').read_text())
+    assert sarif['runs'][0]['results'] == []
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main_baseline(project, capsys, jobs):
+    argv = ['-j', jobs, '--timeout-baseline=baseline.txt', 'pkg', '.tox']
+    assert main([*argv, '--timeout-baseline-update']) == 0
+    lines = project.joinpath('baseline.txt').read_text().splitlines()
+    assert lines[0] == '# flake8-timeout baseline 1'
+    assert len(lines[1:]) == 2 and lines[1:] == sorted(lines[1:])
+    assert main(argv) == 0
+
+    # moving the known call doesn't report it, a new call is reported
+    project.joinpath('pkg/a.py').write_text(
+        'import requests\n'
+        '\n'
+        'requests.get("url")\n'
+        'requests.get("other")\n',
+    )
+    assert main(argv) == 1
+    out, _ = capsys.readouterr()
+    assert out == 'pkg/a.py:4:1: TIM100 request call has no timeout\n'
+
+
+def test_main_baseline_from_subdirectory(project, monkeypatch):
+    argv = ['--timeout-baseline=bl.txt', '--timeout-baseline-update']
+    assert main(argv) == 0
+    monkeypatch.chdir(project / 'pkg')
+    assert main(['--timeout-baseline=../bl.txt', '.']) == 0
+
+
+def test_baseline_identical_calls(tmp_path):
+    src = 'import requests\ndef f():\n    requests.get( "url" )\n'
+    baseline = Baseline(str(tmp_path / 'baseline.txt'), 'run', update=True)
+    plugin = Plugin(None, src.splitlines(True), 'a.py')
+    # nothing is reported while the baseline is written
+    assert not list(
+        baseline.filter('a.py', plugin._results(), plugin._lines),
+    )
+    baseline.report()
+
+    baseline = Baseline(str(tmp_path / 'baseline.txt'), 'run')
+    assert len(baseline.fingerprints) == 1
+    # whitespace in the call does not matter, a second identical call does
+    src = src.replace('( "url" )', '("url")') + '    requests.get("url")\n'
+    plugin = Plugin(None, src.splitlines(True), 'a.py')
+    results = baseline.filter('a.py', plugin._results(), plugin._lines)
+    assert [result.line for result in results] == [4]
+
+
+@pytest.mark.parametrize(
+    ('filename', 'function', 'call'),
+    (
+        ('b.py', 'f', 'requests.get("url")'),
+        ('a.py', 'g', 'requests.get("url")'),
+        ('a.py', 'f', 'requests.get("other")'),
+    ),
+)
+def test_baseline_fingerprint_changes(tmp_path, filename, function, call):
+    path = str(tmp_path / 'baseline.txt')
+    baseline = Baseline(path, 'run', update=True)
+    src = 'import requests\ndef f():\n    requests.get("url")\n'
+    plugin = Plugin(None, src.splitlines(True), 'a.py')
+    list(baseline.filter('a.py', plugin._results(), plugin._lines))
+    baseline.report()
+
+    src = f'import requests\ndef {function}():\n    {call}\n'
+    plugin = Plugin(None, src.splitlines(True), filename)
+    results = Baseline(path, 'run').filter(
+        filename, plugin._results(), plugin._lines,
+    )
+    assert len(list(results)) == 1
+
+
+def test_main_baseline_not_found(project, capsys):
+    with pytest.raises(SystemExit):
+        main(['--timeout-baseline=missing.txt'])
+    _, err = capsys.readouterr()
+    assert 'Baseline not found: missing.txt' in err
+
+
+def test_coverage_kinds():
+    s = '''\
+import requests
+import urllib.request
+from project import settings
+T = 5
+KWARGS = {"timeout": T}
+requests.get("url", timeout=5)
+requests.get("url", timeout=(1, None))
+requests.get("url", **KWARGS)
+requests.get("url", **{"timeout": 5})
+requests.get("url", timeout=T * 2)
+requests.get("url", timeout=settings.TIMEOUT)
+urllib.request.urlopen("url", None, t)
+requests.get("url", timeout=t)
+requests.get("url", timeout=None)
+requests.get("url")
+requests.post("url", timeout=600)
+'''
+    matcher = Matcher.compile(
+        DEFAULT_TRACKED_FUNCTIONS,
+        limit=(None, 60),
+        settings=['project.settings'],
+    )
+    visitor = Visitor(matcher)
+    visitor.coverage = {}
+    for _ in visitor.visit(ast.parse(s)):
+        pass
+    assert visitor.coverage == {
+        ('requests.get', 'literal'): 2,
+        ('requests.get', 'constant'): 3,
+        ('urllib.request.urlopen', 'dynamic'): 1,
+        ('requests.get', 'non-constant'): 1,
+        ('requests.get', 'none'): 2,
+        ('requests.get', 'missing'): 1,
+        ('requests.post', 'too-large'): 1,
+    }
+
+
+def test_coverage_not_counted_by_default():
+    visitor = Visitor(DEFAULT_MATCHER)
+    for _ in visitor.visit(ast.parse('import requests\nrequests.get("u")\n')):
+        pass
+    assert visitor.coverage is None
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main_coverage(wrapper_project, jobs):
+    argv = [
+        '-j', jobs,
+        '--timeout-project-index=index.db',
+        '--timeout-coverage=coverage.json',
+        # not used, the cached results don't contain the calls which pass
+        '--timeout-cache=cache.db',
+    ]
+    for _ in range(2):
+        assert main([*argv, 'pkg']) == 1
+        coverage = json.loads(
+            wrapper_project.joinpath('coverage.json').read_text(),
+        )
+        assert coverage['total'] == {
+            'calls': 9,
+            'covered': 4,
+            'coverage': 0.4444,
+            'literal': 2,
+            'constant': 0,
+            'dynamic': 0,
+            'forwarded': 2,
+            'too-large': 0,
+            'none': 0,
+            'negative': 0,
+            'non-constant': 0,
+            'missing': 5,
+        }
+    assert list(coverage['packages']) == ['pkg', 'pkg.sub']
+    assert coverage['packages']['pkg']['calls'] == 9
+    assert coverage['packages']['pkg.sub']['calls'] == 4
+    assert list(coverage['modules']) == ['pkg.a', 'pkg.http', 'pkg.sub.use']
+    # the most calls without a timeout first
+    assert [
+        (spec, row['calls'], row['covered'])
+        for spec, row in coverage['specs'].items()
+    ] == [
+        ('pkg.http.fetch', 4, 2),
+        ('requests.get', 3, 1),
+        ('pkg.http.download', 2, 1),
+    ]
+
+
+def test_main_coverage_csv(project):
+    argv = ['--timeout-coverage=c.csv', '--timeout-coverage-format=csv']
+    assert main([*argv, 'pkg']) == 1
+    assert project.joinpath('c.csv').read_text() == (
+        'group,name,calls,covered,coverage,literal,constant,dynamic,'
+        'forwarded,too-large,none,negative,non-constant,missing\n'
+        'total,,1,0,0.0,0,0,0,0,0,0,0,0,1\n'
+        'module,a,1,0,0.0,0,0,0,0,0,0,0,0,1\n'
+        'spec,requests.get,1,0,0.0,0,0,0,0,0,0,0,0,1\n'
+    )
+
+
+def test_main_coverage_no_calls(project):
+    assert main(['--timeout-coverage=c.json', 'pkg/b.py']) == 0
+    coverage = json.loads(project.joinpath('c.json').read_text())
+    assert coverage['total']['calls'] == 0
+    assert coverage['total']['coverage'] is None
+    assert coverage['modules'] == coverage['specs'] == {}
+
+
+SERVED = '''\
+import requests
+TIMEOUT = 5
+
+
+def fetch(url):
+    return requests.get(url)
+
+
+def fetch_all(urls):
+    return [fetch(url) for url in urls]
+
+
+@decorator
+def post(url):
+    return requests.post(url, timeout=TIMEOUT)
+'''
+
+
+def test_server_reuses_unchanged_statements():
+    server = Server(DEFAULT_MATCHER)
+    expected = [
+        (6, 11, 'TIM100 request call has no timeout'),
+        (6, 11,
+         'TIM202 requests.get opens a new connection on every call of '
+         'fetch() which is called in a loop'),
+    ]
+
+    results = server.check('t.py', SERVED)
+    assert [(r.line, r.col, r.msg) for r in results] == expected
+    assert server.n_analyzed == 5
+
+    # lines added before a statement only move its results
+    results = server.check('t.py', '\n\n' + SERVED)
+    assert [(r.line + 2, r.col, r.msg) for r in results] == [
+        (line + 4, col, msg) for line, col, msg in expected
+    ]
+    assert server.n_analyzed == 5
+
+    changed = SERVED.replace('return requests.get(url)', 'return 1')
+    assert server.check('t.py', changed) == []
+    assert server.n_analyzed == 6
+
+
+def test_server_names_bound_before_a_statement():
+    server = Server(DEFAULT_MATCHER)
+    server.check('t.py', SERVED)
+    n_analyzed = server.n_analyzed
+
+    changed = SERVED.replace('TIMEOUT = 5', 'TIMEOUT = None')
+    results = server.check('t.py', changed)
+    assert (15, 11, MSG) in [(r.line, r.col, r.msg) for r in results]
+    # the constant and everything after it
+    assert server.n_analyzed == n_analyzed + 4
+
+
+def test_server_constant_defined_after_function():
+    server = Server(DEFAULT_MATCHER)
+    results = server.check('t.py', DEFINED_LATER)
+    assert [(r.line, r.col) for r in results] == [(5, 4), (7, 0)]
+    n_analyzed = server.n_analyzed
+
+    # the function is not analyzed again, only its deferred calls
+    changed = DEFINED_LATER.replace('= 5', '= None')
+    results = server.check('t.py', changed)
+    assert [(r.line, r.col) for r in results] == [
+        (3, 4), (4, 4), (5, 4), (6, 12), (7, 0),
+    ]
+    assert server.n_analyzed == n_analyzed + 2
+
+
+@pytest.mark.parametrize(
+    'source',
+    (
+        'import requests\nrequests.get("url")\n',
+        SERVED,
+        SERVED.replace('def fetch_all', 'async def fetch_all'),
+        DEFINED_LATER,
+        pytest.param(
+            '"""Docstring.\n'
+            '\n'
+            'requests.get(url)\n'
+            '"""\n'
+            'import requests\n'
+            '@a\n'
+            '@b(\n'
+            '1)\n'
+            'def f():\n'
+            '    requests.get(url)\n'
+            'try:\n'
+            '    x = (requests.get(url),\n'
+            'requests.post(url))\n'
+            'except ValueError:\n'
+            '    pass\n'
+            'y = 1; requests.get(url, timeout=y)\n'
+            'z = \\\n'
+            'requests.head(url)\n',
+            id='statements-without-indentation',
+        ),
+    ),
+)
+def test_server_same_results_as_plugin(source):
+    server = Server(DEFAULT_MATCHER)
+    server.check('t.py', source.replace('import', '\nimport'))
+    results = server.check('t.py', source)
+    assert server.check('t.py', source) == results
+    plugin = Plugin(ast.parse(source))
+    assert results == sorted(plugin._results())
+
+
+def test_serve(tmp_path):
+    tmp_path.joinpath('a.py').write_text(
+        'import requests\nrequests.get("url")\n',
+    )
+    requests = [
+        {'id': 1, 'filename': 't.py', 'source': SERVED},
+        {'id': 2, 'filename': str(tmp_path / 'a.py')},
+        {'id': 3, 'filename': 't.py', 'source': 'import requests\n(\n'},
+        {'id': 4, 'method': 'close', 'filename': 't.py'},
+        {'id': 5, 'method': 'unknown'},
+        {'method': 'shutdown'},
+        {'id': 6, 'filename': 't.py', 'source': SERVED},
+    ]
+    stdin = io.StringIO(''.join(f'{json.dumps(r)}\n' for r in requests))
+    stdout = io.StringIO()
+    assert serve(stdin, stdout) == 0
+
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [r['id'] for r in responses] == [1, 2, 3, 4, 5]
+    assert responses[0]['results'][0] == {
+        'line': 6,
+        'col': 12,
+        'end_line': 6,
+        'end_col': 29,
+        'code': 'TIM100',
+        'message': 'request call has no timeout',
+        'spec': 'requests.get',
+        'status': 'missing',
+        'function': 'fetch',
+    }
+    assert responses[0]['time_ms'] >= 0
+    assert [r['line'] for r in responses[1]['results']] == [2]
+    assert responses[2]['error'].startswith('SyntaxError: ')
+    assert responses[4] == {'id': 5, 'error': "Unknown method: 'unknown'"}
+
+
+def test_serve_invalid_request():
+    stdout = io.StringIO()
+    requests = (
+        'not json\n'
+        '\n'
+        '{"id": 1}\n'
+        '[1]\n'
+        '"x"\n'
+        'null\n'
+        '{"id": 2, "filename": 0}\n'
+        '{"id": 3, "method": "close", "filename": "a.py"}\n'
+    )
+    serve(io.StringIO(requests), stdout)
+    responses = [json.loads(line) for line in stdout.getvalue().splitlines()]
+    assert [r.get('error', '').split(':')[0] for r in responses] == [
+        *['Invalid request'] * 6, '',
+    ]
+    # the server keeps running
+    assert responses[-1] == {'id': 3}
+
+
+def test_main_serve(project, monkeypatch, capsys):
+    request = {'id': 1, 'filename': 'pkg/a.py'}
+    monkeypatch.setattr(sys, 'stdin', io.StringIO(json.dumps(request)))
+    assert main(['--serve', '--timeout-funcs=requests.post']) == 0
+    out, _ = capsys.readouterr()
+    assert json.loads(out)['results'] == []
+
+
+def _fix(s):
+    results = Plugin(None, io.StringIO(s).readlines())._results()
+    return fix_source(s, results, DEFAULT_MATCHER, 'T')
+
+
+@pytest.mark.parametrize(
+    ('s', 'expected'),
+    (
+        pytest.param(
+            'requests.get("url")\n',
+            'requests.get("url", timeout=T)\n',
+            id='after the last argument',
+        ),
+        pytest.param(
+            'requests.get()\n',
+            'requests.get(timeout=T)\n',
+            id='no arguments',
+        ),
+        pytest.param(
+            'requests.get("url",)\n',
+            'requests.get("url", timeout=T)\n',
+            id='trailing comma',
+        ),
+        pytest.param(
+            'requests.post(\n'
+            '    "url",\n'
+            '    data=data,  # comment\n'
+            ')\n',
+            'requests.post(\n'
+            '    "url",\n'
+            '    data=data,  # comment\n'
+            '    timeout=T,\n'
+            ')\n',
+            id='trailing comma before a closing paren on its own line',
+        ),
+        pytest.param(
+            'requests.post(\n'
+            '    "url",\n'
+            '    data=data  # comment\n'
+            ')\n',
+            'requests.post(\n'
+            '    "url",\n'
+            '    data=data, timeout=T  # comment\n'
+            ')\n',
+            id='before a comment',
+        ),
+        pytest.param(
+            'requests.get("ü")\r\n',
+            'requests.get("ü", timeout=T)\r\n',
+            id='line endings and non-ascii characters',
+        ),
+        pytest.param(
+            'urllib.request.urlopen("url", None)\n',
+            'urllib.request.urlopen("url", None, T)\n',
+            id='positional',
+        ),
+        pytest.param(
+            'urllib.request.urlopen("url")\n',
+            'urllib.request.urlopen("url", timeout=T)\n',
+            id='positional slot not reached',
+        ),
+        pytest.param(
+            'urllib.request.urlopen("url", None, context=ctx)\n',
+            'urllib.request.urlopen("url", None, context=ctx, timeout=T)\n',
+            id='positional after keywords',
+        ),
+        pytest.param(
+            'urllib.request.urlopen(*args)\n',
+            'urllib.request.urlopen(*args, timeout=T)\n',
+            id='positional unpacked arguments',
+        ),
+    ),
+)
+def test_fix_source(s, expected):
+    imports = 'import requests\nimport urllib.request\n'
+    assert _fix(imports + s) == (imports + expected, 1, [])
+
+
+def test_fix_source_nested_calls():
+    s = 'import requests\nrequests.get(requests.get("url"))\n'
+    assert _fix(s) == (
+        'import requests\n'
+        'requests.get(requests.get("url", timeout=T), timeout=T)\n',
+        2,
+        [],
+    )
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param('requests.get("url", **kwargs)\n', id='unpacked dict'),
+        pytest.param('requests.get(x for x in y)\n', id='generator'),
+    ),
+)
+def test_fix_source_not_fixed(s):
+    s = f'import requests\n{s}'
+    fixed, n_fixed, unfixed = _fix(s)
+    assert (fixed, n_fixed) == (s, 0)
+    assert [(r.line, r.msg) for r in unfixed] == [(2, MSG)]
+
+
+def test_fix_source_timeout_keyword():
+    Plugin.matcher = Matcher.compile(['redis.Redis@socket_timeout,timeout'])
+    s = 'import redis\nredis.Redis(host="h")\n'
+    results = Plugin(None, io.StringIO(s).readlines())._results()
+    assert fix_source(s, results, Plugin.matcher, '5') == (
+        'import redis\nredis.Redis(host="h", socket_timeout=5)\n', 1, [],
+    )
+
+
+def test_fix_source_only_missing_timeouts():
+    s = (
+        'import requests\n'
+        'requests.get("url", timeout=None)\n'
+        'requests.get("url", timeout=t)\n'
+        'requests.get("url", timeout=-1)\n'
+    )
+    fixed, n_fixed, unfixed = _fix(s)
+    assert (fixed, n_fixed) == (s, 0)
+    assert [(r.line, r.status) for r in unfixed] == [
+        (2, 'none'), (3, 'non-constant'), (4, 'negative'),
+    ]
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main_fix(project, capsys, jobs):
+    assert main(['--fix', '--timeout-fix-value=30', '-j', jobs]) == 0
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert err == 'Fixed 1 call(s) in 1 file(s)\n'
+    assert project.joinpath('pkg/a.py').read_text() == (
+        'import requests\nrequests.get("url", timeout=30)\n'
+    )
+    assert main([]) == 0
+
+
+def test_main_fix_diff(project, capsys):
+    project.joinpath('setup.cfg').write_text(
+        '[flake8]\ntimeout-fix-value = 30\n',
+    )
+    assert main(['--diff', 'pkg']) == 1
+    out, err = capsys.readouterr()
+    assert out == (
+        '--- a/pkg/a.py\n'
+        '+++ b/pkg/a.py\n'
+        '@@ -1,2 +1,2 @@\n'
+        ' import requests\n'
+        '-requests.get("url")\n'
+        '+requests.get("url", timeout=30)\n'
+    )
+    assert err == 'Would fix 1 call(s) in 1 file(s)\n'
+    assert project.joinpath('pkg/a.py').read_text() == (
+        'import requests\nrequests.get("url")\n'
+    )
+
+
+def test_main_fix_not_fixed(project, capsys):
+    project.joinpath('pkg/a.py').write_text(
+        'import requests\nrequests.get("url", **kwargs)\n',
+    )
+    assert main(['--fix', '--timeout-fix-value=30', 'pkg']) == 1
+    out, _ = capsys.readouterr()
+    assert out == 'pkg/a.py:2:1: TIM100 request call has no timeout\n'
+
+
+def test_main_fix_explicit_none_not_fixed(project, capsys):
+    project.joinpath('pkg/a.py').write_text(
+        'import requests\nrequests.get("url", timeout=None)\n',
+    )
+    assert main(['--fix', '--timeout-fix-value=30', 'pkg']) == 1
+    out, err = capsys.readouterr()
+    assert out == 'pkg/a.py:2:1: TIM100 request call has no timeout\n'
+    assert err == 'Fixed 0 call(s) in 0 file(s)\n'
+    assert main(['--diff', '--timeout-fix-value=30', 'pkg']) == 1
+
+
+def test_main_fix_diff_nothing_to_fix(project, capsys):
+    project.joinpath('pkg/a.py').write_text(
+        'import requests\nrequests.get("url", timeout=5)\n',
+    )
+    assert main(['--diff', '--timeout-fix-value=30', 'pkg']) == 0
+    out, err = capsys.readouterr()
+    assert out == ''
+    assert err == 'Would fix 0 call(s) in 0 file(s)\n'
+
+
+@pytest.mark.parametrize('value', ('', '30)'))
+def test_main_fix_invalid_value(project, capsys, value):
+    with pytest.raises(SystemExit):
+        main(['--fix', f'--timeout-fix-value={value}'])
+    _, err = capsys.readouterr()
+    assert '--timeout-fix-value' in err
+
+
+def test_main_unreadable_file(project, capsys):
+    project.joinpath('pkg/e.py').write_text('import requests\ndef (\n')
+    assert main(['pkg/e.py']) == 1
+    out, _ = capsys.readouterr()
+    assert out.startswith('pkg/e.py:1:1: E902 SyntaxError: ')
+
+
+def test_parse_diff():
+    diff = '''\
+diff --git a/pkg/a.py b/pkg/a.py
+index 1111111..2222222 100644
+--- a/pkg/a.py
++++ b/pkg/a.py
+@@ -3 +3 @@ import requests
+-x = 1
++x = 2
+@@ -10,0 +11,3 @@ def f():
++    a
++    b
++    c
+@@ -20,2 +23,0 @@ def g():
+-    d
+-    e
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1 +0,0 @@
+-import requests
+'''
+    assert parse_diff(diff, '/root') == {
+        os.path.realpath('/root/pkg/a.py'): [(3, 3), (11, 13), (23, 24)],
+    }
+
+
+def test_read_changed_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    changed = tmp_path.joinpath('changed.txt')
+    changed.write_text(f'a.py:3\na.py:5-8\n\n{tmp_path}/b.py\n')
+    assert read_changed_lines(str(changed)) == {
+        os.path.realpath('a.py'): [(3, 3), (5, 8)],
+        os.path.realpath(tmp_path / 'b.py'): [(1, sys.maxsize)],
+    }
+
+
+@pytest.mark.parametrize(
+    ('changed', 'expected'),
+    (
+        pytest.param('t.py:2', [(2, 0)], id='call-line'),
+        pytest.param('t.py:4', [(3, 0)], id='inside-multi-line-call'),
+        pytest.param('t.py:1', [], id='import-line'),
+        pytest.param('other.py', [], id='other-file'),
+    ),
+)
+def test_changed_lines(manager, tmp_path, monkeypatch, changed, expected):
+    monkeypatch.chdir(tmp_path)
+    tmp_path.joinpath('changed.txt').write_text(changed)
+    options = manager.parse_args(['--timeout-changed-lines=changed.txt'])
+    Plugin.parse_options(options)
+
+    lines = [
+        'import requests\n',
+        'requests.get("url")\n',
+        'requests.get(\n',
+        '    "url",\n',
+        ')\n',
+    ]
+    plugin = Plugin(ast.parse(''.join(lines)), lines, 't.py')
+    assert [(line, col) for line, col, *_ in plugin.run()] == expected
+
+
+@pytest.fixture
+def committed_project(project):
+    def git(*args):
+        subprocess.check_call(
+            (
+                'git', '-c', 'user.name=u', '-c', 'user.email=u@example.com',
+                *args,
+            ),
+            stdout=subprocess.DEVNULL,
+        )
+
+    project.joinpath('pkg/e.py').write_text(
+        'import requests\nrequests.get("url")\n',
+    )
+    git('init', '-q', '.')
+    git('add', '.')
+    git('commit', '-q', '-m', 'initial')
+    project.joinpath('pkg/a.py').write_text(
+        'import requests\nrequests.get("url")\nrequests.post("url")\n',
+    )
+    return project
+
+
+def test_main_diff_ref(committed_project, capsys):
+    assert main(['--timeout-diff-ref=HEAD']) == 1
+    out, _ = capsys.readouterr()
+    assert out == './pkg/a.py:3:1: TIM100 request call has no timeout\n'
+
+
+@pytest.mark.parametrize(
+    ('args', 'expected'),
+    (
+        pytest.param(
+            [],
+            'pkg/a.py:3:1: TIM100 request call has no timeout\n'
+            'pkg/e.py:3:1: TIM100 request call has no timeout\n',
+            id='check',
+        ),
+        pytest.param(
+            ['--diff', '--timeout-fix-value=5'],
+            '+requests.post("url", timeout=5)\n'
+            '+requests.put("url", timeout=5)\n',
+            id='fix',
+        ),
+    ),
+)
+def test_main_diff_ref_spawned_workers(committed_project, args, expected):
+    committed_project.joinpath('pkg/e.py').write_text(
+        'import requests\nrequests.get("url")\nrequests.put("url")\n',
+    )
+    # the workers don't inherit the changed lines of the parent
+    code = (
+        'import multiprocessing, sys, flake8_timeout\n'
+        'multiprocessing.set_start_method("spawn")\n'
+        'sys.exit(flake8_timeout.main(sys.argv[1:]))\n'
+    )
+    proc = subprocess.run(
+        (
+            sys.executable, '-c', code,
+            '--timeout-diff-ref=HEAD', '-j2', *args, 'pkg',
+        ),
+        capture_output=True,
+        text=True,
+    )
+    lines = proc.stdout.splitlines(keepends=True)
+    assert ''.join(sorted(
+        line for line in lines if line.startswith(('pkg', '+r'))
+    )) == expected
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param(
+            'import google.cloud.storage.client\n'
+            'google.cloud.storage.client.Client("p")',
+            id='full-path',
+        ),
+        pytest.param(
+            'from google.cloud import storage\nstorage.client.Client("p")',
+            id='from-import-prefix',
+        ),
+        pytest.param(
+            'import google.cloud.storage as gcs\ngcs.client.Client("p")',
+            id='aliased-prefix',
+        ),
+        pytest.param(
+            'from google.cloud.storage.client import Client as C\nC("p")',
+            id='aliased-function',
+        ),
+        pytest.param(
+            'import botocore.vendored.requests as r\nr.get("url")',
+            id='vendored-requests',
+        ),
+    ),
+)
+def test_deep_call_chains(manager, s):
+    options = manager.parse_args([
+        '--timeout-extend-funcs='
+        'google.cloud.storage.client.Client,botocore.vendored.requests.get',
+    ])
+    Plugin.parse_options(options)
+    msg, = results(s)
+    assert msg == '2:0: TIM100 request call has no timeout'
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param(
+            'import urllib.request\nrequest.urlopen("url")',
+            id='import-binds-only-the-root',
+        ),
+        pytest.param(
+            'from .requests import get\nget("url")',
+            id='relative-import-of-same-name',
+        ),
+        pytest.param(
+            'import requests\nrequests.get.attr("url")',
+            id='attribute-of-tracked-function',
+        ),
+        pytest.param(
+            'import requests as r\nrequests.r.get("url")',
+            id='alias-not-at-root',
+        ),
+    ),
+)
+def test_call_chain_not_tracked(s):
+    assert not results(s)
+
+
+@pytest.mark.parametrize(
+    ('s', 'expected'),
+    (
+        pytest.param(
+            'import requests\n'
+            's = requests.Session()\n'
+            's.get("url")\n',
+            '3:0',
+            id='assignment',
+        ),
+        pytest.param(
+            'from requests import Session\n'
+            'with Session() as s:\n'
+            '    s.post("url")\n',
+            '3:4',
+            id='with-as',
+        ),
+        pytest.param(
+            'import requests\n'
+            'def f(session: requests.Session):\n'
+            '    session.get("url")\n',
+            '3:4',
+            id='annotated-parameter',
+        ),
+        pytest.param(
+            'import requests\n'
+            'def f(session: requests.Session | None = None):\n'
+            '    session.get("url")\n',
+            '3:4',
+            id='optional-annotated-parameter',
+        ),
+        pytest.param(
+            'import requests\n'
+            's: requests.Session\n'
+            's.get("url")\n',
+            '3:0',
+            id='annotated-assignment',
+        ),
+        pytest.param(
+            'import requests\n'
+            'if (s := requests.Session()):\n'
+            '    s.get("url")\n',
+            '3:4',
+            id='walrus',
+        ),
+        pytest.param(
+            'import requests\n'
+            'requests.Session().request("GET", "url")\n',
+            '2:0',
+            id='called-on-constructor',
+        ),
+        pytest.param(
+            'import requests\n'
+            's = requests.Session()\n'
+            'def f():\n'
+            '    s.get("url")\n',
+            '4:4',
+            id='module-client-in-function',
+        ),
+        pytest.param(
+            'import requests\n'
+            'class C:\n'
+            '    def __init__(self):\n'
+            '        self.session = requests.Session()\n'
+            '    def f(self):\n'
+            '        self.session.get("url")\n',
+            '6:8',
+            id='instance-attribute',
+        ),
+        pytest.param(
+            'import requests\n'
+            'class C:\n'
+            '    session: requests.Session\n'
+            '    def f(self):\n'
+            '        self.session.get("url")\n',
+            '5:8',
+            id='class-annotation',
+        ),
+    ),
+)
+def test_client_method_no_timeout(s, expected):
+    msg, = results(s)
+    assert msg == f'{expected}: TIM100 request call has no timeout'
+
+
+@pytest.mark.parametrize(
+    's',
+    (
+        pytest.param(
+            'import requests\n'
+            's = requests.Session()\n'
+            's.get("url", timeout=5)\n',
+            id='with-timeout',
+        ),
+        pytest.param(
+            'import requests\n'
+            's = requests.Session()\n'
+            's = other()\n'
+            's.get("url")\n',
+            id='rebound',
+        ),
+        pytest.param(
+            'import requests\n'
+            's = requests.Session()\n'
+            'def f(s):\n'
+            '    s.get("url")\n',
+            id='shadowed-by-parameter',
+        ),
+        pytest.param(
+            'import requests\n'
+            'def f():\n'
+            '    s = requests.Session()\n'
+            '    return s\n'
+            's.get("url")\n',
+            id='out-of-scope',
+        ),
+        pytest.param(
+            'import requests\n'
+            'class C:\n'
+            '    s = requests.Session()\n'
+            '    def f(self):\n'
+            '        s.get("url")\n',
+            id='class-body-not-visible-in-methods',
+        ),
+        pytest.param(
+            'import requests\n'
+            's = requests.Session()\n'
+            's.mount("https://", adapter)\n',
+            id='untracked-method',
+        ),
+        pytest.param(
+            'import requests\n'
+            'requests = None\n'
+            'requests.get("url")\n',
+            id='shadowed-import',
+        ),
+        pytest.param(
+            'import requests\n'
+            'x = f()\n'
+            'x.get("url")\n',
+            id='unrelated-object',
+        ),
+    ),
+)
+def test_client_method_not_reported(s):
+    assert not results(s)
+
+
+def test_custom_client(manager):
+    options = manager.parse_args([
+        '--timeout-extend-funcs=httpx.Client.get',
+        '--timeout-client-funcs=httpx.Client',
+    ])
+    Plugin.parse_options(options)
+
+    s = 'import requests\ns = requests.Session()\ns.get("url")\n'
+    assert not results(s)
+    s = 'import httpx\nwith httpx.Client() as c:\n    c.get("url")\n'
+    msg, = results(s)
+    assert msg == '3:4: TIM100 request call has no timeout'
+
+
+# flake8 imports the plugin in every process, including each -j worker. The
+# budget is generous so slow machines pass, the deferred imports are checked
+# exactly. benchmarks/startup.py measures it more precisely
+IMPORT_BUDGET_US = 50_000
+
+
+def test_import_time(tmp_path):
+    env = {**os.environ, 'PYTHONPYCACHEPREFIX': str(tmp_path)}
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    cmd = (sys.executable, '-X', 'importtime', '-c', 'import flake8_timeout')
+    # the first import writes the bytecode cache
+    subprocess.run(cmd, env=env, capture_output=True, check=True)
+    stderr = subprocess.run(
+        cmd, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    imported = {}
+    for line in stderr.splitlines()[1:]:
+        _, cumulative, name = line.split('|')
+        imported[name.strip()] = int(cumulative)
+        if name.strip() == 'flake8_timeout':
+            break
+        elif not name.startswith('   '):
+            # imported at startup before the plugin, e.g. by site
+            imported.clear()
+
+    deferred = {
+        'configparser', 'flake8', 'fnmatch', 'heapq', 'importlib.metadata',
+        'io', 'multiprocessing', 'shutil', 'sqlite3', 'subprocess',
+        'tempfile', 'tokenize', 'uuid',
+    }
+    assert not deferred & imported.keys()
+    assert imported['flake8_timeout'] < IMPORT_BUDGET_US
+
+
+@pytest.fixture
+def wrapper_project(project):
+    project.joinpath('pkg/__init__.py').touch()
+    project.joinpath('pkg/sub').mkdir()
+    project.joinpath('pkg/sub/__init__.py').touch()
+    project.joinpath('pkg/http.py').write_text(
+        'import requests\n'
+        '\n'
+        'def fetch(url, **kwargs):\n'
+        '    return requests.get(url, **kwargs)\n'
+        '\n'
+        'def fetch_default(url, **kwargs):\n'
+        '    kwargs.setdefault("timeout", 5)\n'
+        '    return requests.get(url, **kwargs)\n'
+        '\n'
+        'def download(url, timeout=None):\n'
+        '    return fetch(url, timeout=timeout)\n'
+        '\n'
+        'def local():\n'
+        '    return fetch("url")\n',
+    )
+    project.joinpath('pkg/sub/use.py').write_text(
+        'from .. import http\n'
+        'from ..http import download\n'
+        'from pkg.http import fetch_default\n'
+        'http.fetch("url")\n'
+        'http.fetch("url", timeout=5)\n'
+        'download("url")\n'
+        'download("url", 5)\n'
+        'fetch_default("url")\n',
+    )
+    return project
+
+
+@pytest.mark.parametrize('jobs', ('1', '2'))
+def test_main_project_index(wrapper_project, capsys, jobs):
+    assert main(['-j', jobs, '--timeout-project-index=index.db', 'pkg']) == 1
+    out, _ = capsys.readouterr()
+    assert sorted(out.splitlines()) == [
+        'pkg/a.py:2:1: TIM100 request call has no timeout',
+        'pkg/http.py:14:12: TIM100 request call has no timeout',
+        'pkg/http.py:8:12: TIM100 request call has no timeout',
+        'pkg/sub/use.py:4:1: TIM100 request call has no timeout',
+        'pkg/sub/use.py:6:1: TIM100 request call has no timeout',
+    ]
+
+
+def test_main_project_index_wrappers_in_other_files(wrapper_project, capsys):
+    # e.g. pre-commit only passes the changed files
+    args = ['--timeout-project-index=index.db', 'pkg/sub/use.py']
+    assert main(args) == 1
+    out, _ = capsys.readouterr()
+    assert out.splitlines() == [
+        'pkg/sub/use.py:4:1: TIM100 request call has no timeout',
+        'pkg/sub/use.py:6:1: TIM100 request call has no timeout',
+    ]
+
+
+def test_project_index_only_summarizes_changed_files(
+        wrapper_project,
+        manager,
+        monkeypatch,
+):
+    summarized = []
+
+    def _summarize(filename):
+        summarized.append(filename)
+        return summarize(filename)
+
+    summarize = flake8_timeout._summarize
+    monkeypatch.setattr(flake8_timeout, '_summarize', _summarize)
+    args = ['--timeout-project-index=index.db', 'pkg']
+    Plugin.parse_options(manager.parse_args(args))
+    assert len(summarized) == 6
+    assert Plugin.matcher.lookup(('pkg', 'http', 'download')) == Spec(
+        'pkg.http.download', ('pkg', 'http', 'download'), 1, tracked=True,
+    )
+
+    summarized.clear()
+    wrapper_project.joinpath('pkg/http.py').write_text(
+        'def fetch(url, **kwargs):\n    pass\n',
+    )
+    Plugin.parse_options(manager.parse_args(args))
+    assert summarized == ['./pkg/http.py']
+    assert Plugin.matcher.lookup(('pkg', 'http', 'download')) is None
+
+
+def test_project_index_wrapper_called_in_same_module(wrapper_project):
+    Plugin.project = True
+    Plugin.matcher = Matcher.compile(
+        DEFAULT_TRACKED_FUNCTIONS, wrappers=['pkg.http.fetch'],
+    )
+    lines = ['def fetch(url, **kw):\n', '    pass\n', 'fetch("url")\n']
+    ret = list(Plugin(None, lines, 'pkg/http.py').run())
+    assert ret == [(3, 0, MSG, Plugin)]
+    # the name of the function is enough to pass the prefilter
+    assert not list(Plugin(None, lines, 'pkg/other.py').run())
+
+
+def test_project_index_wrapper_keywords(wrapper_project):
+    Plugin.project = True
+    Plugin.matcher = Matcher.compile(
+        ['redis.Redis@socket_timeout'],
+        wrappers=['pkg.db.connect', 'pkg.db.other'],
+    )
+    source = (
+        'import redis\n'
+        'def connect(timeout=None):\n'
+        '    return redis.Redis(socket_timeout=timeout)\n'
+        'def other(timeout=None):\n'
+        '    return redis.Redis(timeout=timeout)\n'
+    )
+    wrapper_project.joinpath('pkg/db.py').write_text(source)
+    lines = source.splitlines(keepends=True)
+    ret = list(Plugin(None, lines, 'pkg/db.py').run())
+    assert ret == [(5, 11, MSG, Plugin)]
+    assert flake8_timeout._summarize('pkg/db.py') == [
+        ('pkg.db.connect:0', 'redis.Redis'),
+    ]
+
+
+@pytest.mark.parametrize(
+    ('filename', 'expected'),
+    (
+        ('pkg/http.py', (('pkg', 'http'), ('pkg',))),
+        ('pkg/sub/__init__.py', (('pkg', 'sub'), ('pkg', 'sub'))),
+        ('setup.py', (('setup',), ())),
+    ),
+)
+def test_module_name(wrapper_project, filename, expected):
+    assert module_name(filename) == expected
+
+
+def test_resolve_wrappers():
+    summaries = [
+        ('a.b.fetch', 'requests.get'),
+        ('a.b.download:1', 'a.b.fetch'),
+        ('a.c.other', 'a.b.unrelated'),
+        ('a.c.loop', 'a.c.loop'),
+        ('a.c.twice', 'a.b.fetch'),
+        ('a.c.twice', 'a.b.download'),
+    ]
+    assert resolve_wrappers(summaries, ['requests.get']) == [
+        'a.b.download:1', 'a.b.fetch', 'a.c.twice',
+    ]